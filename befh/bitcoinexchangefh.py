@@ -4,6 +4,7 @@ import argparse
 import sys
 
 from befh.clients.redis import RedisClient
+from befh.clients.redisstream import RedisStreamClient
 from befh.exchanges.gateway import ExchangeGateway
 from befh.exchanges.bitmex import ExchGwBitmex
 from befh.exchanges.btcc import ExchGwBtccSpot, ExchGwBtccFuture
@@ -27,10 +28,12 @@ from befh.exchanges.wex import ExchGwWex
 from befh.exchanges.bitflyer import ExchGwBitflyer
 from befh.exchanges.coinone import ExchGwCoinOne
 from befh.clients.kdbplus import KdbPlusClient
+from befh.clients.kdbtick import KdbTickerplantClient
 from befh.clients.mysql import MysqlClient
 from befh.clients.postgresql import PostgresqlClient
 from befh.clients.sqlite import SqliteClient
 from befh.clients.csv import FileClient
+from befh.clients.tickstore import TickStoreClient
 from befh.clients.zmq import ZmqClient
 from befh.subscription_manager import SubscriptionManager
 from befh.util import Logger
@@ -52,6 +55,7 @@ def main():
     parser.add_argument('-exchtime', action='store_true', help='Use exchange timestamp.')
     parser.add_argument('-kdb', action='store_true', help='Use Kdb+ as database.')
     parser.add_argument('-csv', action='store_true', help='Use csv file as database.')
+    parser.add_argument('-tickstore', action='store_true', help='Use columnar tick store files as database.')
     parser.add_argument('-sqlite', action='store_true', help='Use SQLite database.')
     parser.add_argument('-mysql', action='store_true', help='Use MySQL.')
     parser.add_argument('-postgresql', action='store_true', help='Use PostgreSQL.')
@@ -64,6 +68,8 @@ def main():
     parser.add_argument('-postgresqlschema', action='store', dest='postgresqlschema',
                         help='PostgreSQL schema.',
                         default='')
+    parser.add_argument('-postgresqlcopy', action='store_true',
+                        help='Insert the batches into PostgreSQL by COPY. Requires -sqlbatchsize.')
 
     parser.add_argument('-mysqldest', action='store', dest='mysqldest',
                         help='MySQL destination. Formatted as <name:pwd@host:port>',
@@ -75,24 +81,89 @@ def main():
     parser.add_argument('-kdbdest', action='store', dest='kdbdest',
                         help='Kdb+ destination. Formatted as <host:port>',
                         default='')
+    parser.add_argument('-kdbbatchsize', action='store', dest='kdbbatchsize', type=int,
+                        help='Number of rows per table inserted in a batch into Kdb+. ' +
+                             'Rows are inserted one by one by default.',
+                        default=1)
+    parser.add_argument('-kdbasync', action='store_true',
+                        help='Send the insertions to Kdb+ by asynchronous messages.')
+    parser.add_argument('-kdbtick', action='store_true',
+                        help='Publish the trades and quotes to a Kdb+ tickerplant by .u.upd.')
 
     parser.add_argument('-zmqdest', action='store', dest='zmqdest',
                         help='Zmq destination. For example \"tcp://127.0.0.1:3306\"',
                         default='')
+    parser.add_argument('-zmqformat', action='store', dest='zmqformat',
+                        choices=['json', 'packed'],
+                        help='Zmq message format. JSON (default), or a topic frame with the packed values.',
+                        default='json')
+    parser.add_argument('-zmqconflate', action='store', dest='zmqconflate', type=int,
+                        help='Maximum number of order book updates published per second per instrument. ' +
+                             'Requires -zmqformat packed. Not conflated by default.',
+                        default=0)
+    parser.add_argument('-zmqsnapshotdest', action='store', dest='zmqsnapshotdest',
+                        help='Zmq snapshot channel address, replying the latest snapshot of every instrument. ' +
+                             'Requires -zmqformat packed. For example \"tcp://127.0.0.1:6002\"',
+                        default='')
 
     parser.add_argument('-redisdest', action='store', dest='redisdest',
                         help='Redis destination. Formatted as <host:port>')
 
     parser.add_argument('-redisdb', action='store', dest='redisdb',
                         help='Redis DB. For example \"0\"')
+    parser.add_argument('-redisbatchsize', action='store', dest='redisbatchsize', type=int,
+                        help='Number of rows written in a pipeline to Redis. ' +
+                             'Rows are written one by one by default.',
+                        default=1)
+    parser.add_argument('-redislayout', action='store', dest='redislayout',
+                        choices=['keys', 'hash', 'packed'],
+                        help='Redis snapshot layout. A key per column (default), a hash per instrument, ' +
+                             'or a key of packed values per instrument.',
+                        default='keys')
+    parser.add_argument('-redismessage', action='store', dest='redismessage',
+                        choices=['json', 'packed'],
+                        help='Format of the snapshots published to Redis. JSON (default) or packed values.',
+                        default='json')
+    parser.add_argument('-redisstream', action='store_true',
+                        help='Append the trades and quotes to Redis streams instead.')
+    parser.add_argument('-redisstreamlen', action='store', dest='redisstreamlen', type=int,
+                        help='Approximate maximum number of entries of each Redis stream.',
+                        default=100000)
 
 
     parser.add_argument('-sqlitepath', action='store', dest='sqlitepath',
                         help='SQLite database path',
                         default='')
+    parser.add_argument('-sqlitewriter', action='store_true',
+                        help='Use WAL in SQLite and insert the rows in a dedicated writer thread.')
     parser.add_argument('-csvpath', action='store', dest='csvpath',
                         help='Csv file path',
                         default='')
+    parser.add_argument('-csvflushinterval', action='store', dest='csvflushinterval', type=int,
+                        help='Milliseconds between the flushes of the csv files.',
+                        default=1000)
+    parser.add_argument('-tickstorepath', action='store', dest='tickstorepath',
+                        help='Tick store file path',
+                        default='')
+    parser.add_argument('-sqlbatchsize', action='store', dest='sqlbatchsize', type=int,
+                        help='Number of rows per table inserted in a batch into SQLite, MySQL and PostgreSQL. ' +
+                             'Rows are inserted one by one by default.',
+                        default=1)
+    parser.add_argument('-sqlflushinterval', action='store', dest='sqlflushinterval', type=int,
+                        help='Maximum milliseconds that a row is buffered before the batch insertion.',
+                        default=1000)
+    parser.add_argument('-sinkqueue', action='store', dest='sinkqueue', type=int,
+                        help='Maximum number of rows queued for each database client. The rows are inserted by ' +
+                             'a worker thread of each client. Rows are inserted in the exchange threads by default.',
+                        default=0)
+    parser.add_argument('-sinkoverflow', action='store', dest='sinkoverflow',
+                        choices=['block', 'drop', 'spill'],
+                        help='Action when the queue of a database client is full. Block the exchange thread, ' +
+                             'drop the oldest row, or spill the rows to disk.',
+                        default='block')
+    parser.add_argument('-sinkspilldir', action='store', dest='sinkspilldir',
+                        help='Directory of the spill files. The working directory by default.',
+                        default='')
     parser.add_argument('-output', action='store', dest='output',
                         help='Verbose output file path')
     parser.add_argument('-proxy', action='store', dest='proxy',
@@ -106,6 +177,9 @@ def main():
     if args.sqlite:
         db_client = SqliteClient()
         db_client.connect(path=args.sqlitepath)
+        db_client.set_batch_insert(args.sqlbatchsize, args.sqlflushinterval)
+        if args.sqlitewriter:
+            db_client.set_writer_mode(flush_interval=args.sqlflushinterval)
         db_clients.append(db_client)
         is_database_defined = True
 
@@ -119,6 +193,7 @@ def main():
                           user=logon_credential.split(':')[0],
                           pwd=logon_credential.split(':')[1],
                           schema=args.mysqlschema)
+        db_client.set_batch_insert(args.sqlbatchsize, args.sqlflushinterval)
         db_clients.append(db_client)
         is_database_defined = True
 
@@ -132,34 +207,54 @@ def main():
                           user=logon_credential.split(':')[0],
                           pwd=logon_credential.split(':')[1],
                           schema=args.postgresqlschema)
+        db_client.set_batch_insert(args.sqlbatchsize, args.sqlflushinterval)
+        db_client.set_copy_insert(args.postgresqlcopy)
         db_clients.append(db_client)
         is_database_defined = True
 
     if args.csv:
         if args.csvpath != '':
-            db_client = FileClient(dir=args.csvpath)
+            db_client = FileClient(dir=args.csvpath, flush_interval=args.csvflushinterval)
+        else:
+            db_client = FileClient(flush_interval=args.csvflushinterval)
+        db_clients.append(db_client)
+        is_database_defined = True
+
+    if args.tickstore:
+        if args.tickstorepath != '':
+            db_client = TickStoreClient(dir=args.tickstorepath)
         else:
-            db_client = FileClient()
+            db_client = TickStoreClient()
         db_clients.append(db_client)
         is_database_defined = True
 
     if args.kdb:
-        db_client = KdbPlusClient()
+        db_client = KdbTickerplantClient() if args.kdbtick else KdbPlusClient()
         db_client.connect(host=args.kdbdest.split(':')[0], port=int(args.kdbdest.split(':')[1]))
+        db_client.set_batch_insert(args.kdbbatchsize, args.sqlflushinterval, args.kdbasync or args.kdbtick)
         db_clients.append(db_client)
         is_database_defined = True
 
     if args.zmq:
         db_client = ZmqClient()
+        db_client.set_message_format(args.zmqformat)
         db_client.connect(addr=args.zmqdest)
+        if args.zmqconflate > 0:
+            db_client.set_conflation(args.zmqconflate)
+        if len(args.zmqsnapshotdest) > 0:
+            db_client.bind_snapshot(args.zmqsnapshotdest)
         db_clients.append(db_client)
         is_database_defined = True
 
     if args.redis:
-        db_client = RedisClient()
+        db_client = RedisStreamClient() if args.redisstream else RedisClient()
         db_client.connect(host=args.redisdest.split(':')[0],
                           port=int(args.redisdest.split(':')[1]),
                           db=int(args.redisdb))
+        db_client.set_batch_insert(args.redisbatchsize, args.sqlflushinterval)
+        db_client.set_snapshot_format(args.redislayout, args.redismessage)
+        if args.redisstream:
+            db_client.set_max_length(args.redisstreamlen)
         db_clients.append(db_client)
         is_database_defined = True
 
@@ -178,6 +273,11 @@ def main():
     if args.exchtime:
         ExchangeGateway.is_local_timestamp = False
 
+    # Asynchronous insertion
+    ExchangeGateway.sink_queue_size = args.sinkqueue
+    ExchangeGateway.sink_overflow_policy = args.sinkoverflow
+    ExchangeGateway.sink_spill_directory = args.sinkspilldir
+
     proxy = None
     if args.proxy:
         proxy = args.proxy
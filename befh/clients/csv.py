@@ -1,6 +1,14 @@
 from befh.clients.database import DatabaseClient
 from befh.util import Logger
+from collections import OrderedDict
+from itertools import islice
 import threading
+import operator
+import bisect
+import atexit
+import heapq
+import re
+import io
 import os
 import csv
 
@@ -19,19 +27,259 @@ class FileClient(DatabaseClient):
         SMALLER = 5
         SMALLER_OR_EQUAL = 6
 
-    def __init__(self, dir=os.getcwd()):
+    class Handle:
+        """
+        Opened file of a table
+        """
+        def __init__(self, file, offset, time_column_index=None, index_file=None, max_time=None, index_rows=0):
+            """
+            Constructor
+            :param file: File opened in binary append mode
+            :param offset: Size of the file
+            :param time_column_index: Index of the time column, or None if the file is not indexed
+            :param index_file: Time index file opened in append mode
+            :param max_time: Maximum time of the written rows
+            :param index_rows: Number of rows written since the last index entry
+            """
+            self.file = file
+            self.buffer = io.StringIO()
+            self.writer = csv.writer(self.buffer, lineterminator='\n', quotechar='\"', quoting=csv.QUOTE_NONNUMERIC)
+            self.offset = offset
+            self.pending_rows = 0
+            self.time_column_index = time_column_index
+            self.index_file = index_file
+            self.index_writer = None if index_file is None else \
+                csv.writer(index_file, lineterminator='\n', quotechar='\"', quoting=csv.QUOTE_NONNUMERIC)
+            self.max_time = max_time
+            self.index_rows = index_rows
+            # Index entries written after the rows are flushed
+            self.pending_index = []
+
+        def write(self, values, index_interval):
+            """
+            Write a row
+            :param values: Value array
+            :param index_interval: Number of rows between the time index entries
+            """
+            self.buffer.seek(0)
+            self.buffer.truncate()
+            self.writer.writerow(values)
+            data = self.buffer.getvalue().encode('utf-8')
+
+            if self.time_column_index is not None:
+                if self.index_rows >= index_interval and self.max_time is not None:
+                    self.pending_index.append([self.offset, self.max_time])
+                    self.index_rows = 0
+                time = values[self.time_column_index]
+                self.max_time = time if self.max_time is None or time > self.max_time else self.max_time
+                self.index_rows += 1
+
+            self.file.write(data)
+            self.offset += len(data)
+            self.pending_rows += 1
+
+        def flush(self):
+            """
+            Flush the rows, and then the index entries of them
+            """
+            self.file.flush()
+            self.pending_rows = 0
+            if len(self.pending_index) > 0:
+                self.index_writer.writerows(self.pending_index)
+                self.index_file.flush()
+                self.pending_index = []
+
+        def close(self):
+            self.flush()
+            self.file.close()
+            if self.index_file is not None:
+                self.index_file.close()
+
+    class Condition:
+        """
+        Where condition compiled into a predicate over the column indices,
+        e.g. "k >= 2 and (v = 'a' or v != 'b')"
+        """
+        TOKEN = re.compile(r"\s*(?:(-?\d+\.\d*|-?\.?\d+)|('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")|(\w+)|(==|!=|<>|>=|<=|=|>|<|\(|\)))")
+        OPERATORS = {'=': operator.eq, '==': operator.eq, '!=': operator.ne, '<>': operator.ne,
+                     '>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le}
+        REVERSED_OPERATORS = {'>': '<', '>=': '<=', '<': '>', '<=': '>='}
+
+        def __init__(self, condition, field_names):
+            """
+            Constructor
+            :param condition: Where condition
+            :param field_names: Column names of the table
+            """
+            self.field_names = field_names
+            self.tokens = self.tokenize(condition)
+            self.position = 0
+            # (column index, operator, value) of the comparisons in the top level conjunction
+            self.bounds = []
+            # Number of the terms in the top level conjunction
+            self.terms = 0
+            if len(self.tokens) == 0:
+                self.predicate = None
+            else:
+                self.predicate = self.parse_or(True)
+                if self.position != len(self.tokens):
+                    raise Exception("Incorrect condition in select statement (%s)." % condition)
+
+        @classmethod
+        def tokenize(cls, condition):
+            tokens = []
+            position = 0
+            condition = condition.strip()
+            while position < len(condition):
+                match = cls.TOKEN.match(condition, position)
+                if match is None or match.end() == position:
+                    raise Exception("Incorrect condition in select statement (%s)." % condition)
+                number, string, name, symbol = match.groups()
+                if number is not None:
+                    tokens.append(('value', float(number) if number.find('.') > -1 else int(number)))
+                elif string is not None:
+                    tokens.append(('value', string[1:-1].replace(string[0] * 2, string[0])))
+                elif name is not None:
+                    tokens.append(('name', name))
+                else:
+                    tokens.append(('symbol', symbol))
+                position = match.end()
+
+            return tokens
+
+        def peek(self):
+            return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+        def next(self):
+            token = self.peek()
+            if token[0] is None:
+                raise Exception("Incomplete condition in select statement.")
+            self.position += 1
+            return token
+
+        def is_keyword(self, keyword):
+            token_type, token = self.peek()
+            return token_type == 'name' and token.lower() == keyword
+
+        def parse_or(self, is_top=False):
+            predicates = [self.parse_and(is_top)]
+            while self.is_keyword('or'):
+                self.next()
+                predicates.append(self.parse_and())
+
+            if len(predicates) == 1:
+                return predicates[0]
+
+            # Bounds are only valid in a conjunction
+            if is_top:
+                self.bounds = []
+            return lambda row: any(p(row) for p in predicates)
+
+        def parse_and(self, is_top=False):
+            predicates = [self.parse_not(is_top)]
+            while self.is_keyword('and'):
+                self.next()
+                predicates.append(self.parse_not(is_top))
+
+            if is_top:
+                self.terms = len(predicates)
+            if len(predicates) == 1:
+                return predicates[0]
+            return lambda row: all(p(row) for p in predicates)
+
+        def parse_not(self, is_top=False):
+            if self.is_keyword('not'):
+                self.next()
+                predicate = self.parse_not()
+                return lambda row: not predicate(row)
+            elif self.peek() == ('symbol', '('):
+                self.next()
+                predicate = self.parse_or()
+                if self.next() != ('symbol', ')'):
+                    raise Exception("Unbalanced parenthesis in select statement.")
+                return predicate
+            else:
+                return self.parse_comparison(is_top)
+
+        def parse_operand(self):
+            token_type, token = self.next()
+            if token_type == 'value':
+                return None, token
+            elif token_type == 'name' and token in self.field_names:
+                return self.field_names.index(token), None
+            else:
+                raise Exception("Field (%s) is not in the table." % token)
+
+        def parse_comparison(self, is_top=False):
+            left_index, left = self.parse_operand()
+            token_type, op = self.next()
+            if token_type != 'symbol' or op not in self.OPERATORS:
+                raise Exception("Incorrect operator (%s) in select statement." % op)
+            right_index, right = self.parse_operand()
+
+            if left_index is None and right_index is not None:
+                # Column on the left, e.g. "1 < k" to "k > 1"
+                left_index, left, right_index, right = right_index, right, left_index, left
+                op = self.REVERSED_OPERATORS.get(op, op)
+
+            func = self.OPERATORS[op]
+            if left_index is None:
+                result = func(left, right)
+                return lambda row: result
+            elif right_index is None:
+                if is_top:
+                    self.bounds.append((left_index, op, right))
+                return lambda row: func(row[left_index], right)
+            else:
+                return lambda row: func(row[left_index], row[right_index])
+
+        def get_lower_bounds(self, column_index):
+            """
+            Get the lower bounds of the column in the top level conjunction
+            :param column_index: Column index
+            :return: List of (value, is_exclusive)
+            """
+            return [(value, op == '>') for index, op, value in self.bounds
+                    if index == column_index and op in ('>', '>=', '=', '==')]
+
+    def __init__(self, dir=os.getcwd(), max_open_files=256, flush_interval=1000, flush_size=1000,
+                 index_interval=1000):
         """
         Constructor
+        :param dir: Directory of the files
+        :param max_open_files: Maximum number of files kept open. The least
+                               recently written file is closed beyond it.
+        :param flush_interval: Milliseconds between the flushes of the open files.
+                               Files are only flushed by size if it is zero.
+        :param flush_size: Number of rows written in a file before it is flushed
+        :param index_interval: Number of rows between the entries of the time index
+                               files. The tables are not indexed if it is zero.
         """
         DatabaseClient.__init__(self)
+        # Lock of the open files and the table locks
         self.lock = threading.Lock()
-        self.file_mapping = dict()
+        # Table name -> lock of the table file
+        self.table_locks = dict()
+        # Table name -> FileClient.Handle, in the order of the last write
+        self.handles = OrderedDict()
+        self.max_open_files = max_open_files
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.index_interval = index_interval
+        self.flush_event = threading.Event()
+        self.flush_thread = None
 
         if dir is None or dir == '':
             raise Exception("FileClient does not accept empty directory.")
 
         self.file_directory = dir
 
+        if self.flush_interval > 0:
+            self.flush_thread = threading.Thread(target=self.run_flush)
+            self.flush_thread.daemon = True
+            self.flush_thread.start()
+        atexit.register(self.close)
+
     @staticmethod
     def convert_to(from_str, to_type):
         """
@@ -45,6 +293,152 @@ class FileClient(DatabaseClient):
             return from_str
 
 
+    def get_file_path(self, table):
+        return os.path.join(self.file_directory, table + ".csv")
+
+    def get_index_path(self, table):
+        """
+        Get the path of the time index file. Each line of the index file is
+        the offset of a row in the table file, and the maximum time of the
+        rows before it.
+        :param table: Table name
+        """
+        return os.path.join(self.file_directory, table + ".idx")
+
+    @classmethod
+    def get_time_column_index(cls, columns):
+        """
+        Get the index of the column which the table is indexed by
+        :param columns: Column array
+        :return: Index of the "date_time" column, or the first date time column.
+                 None if there is no date time column.
+        """
+        if 'date_time' in columns:
+            return columns.index('date_time')
+
+        for i in range(0, len(columns)):
+            if columns[i].find('date_time') > -1:
+                return i
+
+        return None
+
+    @classmethod
+    def read_index(cls, index_path, file_size):
+        """
+        Read the time index file
+        :param index_path: Index file path
+        :param file_size: Size of the table file
+        :return: List of (offset, maximum time of the rows before the offset)
+        """
+        with open(index_path, "r", newline='') as indexfile:
+            reader = csv.reader(indexfile, lineterminator='\n', quotechar='\"', quoting=csv.QUOTE_NONNUMERIC)
+            return [(int(e[0]), e[1]) for e in reader if len(e) == 2 and e[0] < file_size]
+
+    def open_handle(self, table):
+        """
+        Open the file of the table, and the time index file if the table is indexed
+        :param table: Table name
+        :return: FileClient.Handle
+        """
+        file_path = self.get_file_path(table)
+        index_path = self.get_index_path(table)
+        with open(file_path, "r", newline='') as csvfile:
+            reader = csv.reader(csvfile, lineterminator='\n', quotechar='\"', quoting=csv.QUOTE_NONNUMERIC)
+            field_names = next(reader, [])
+            time_column_index = self.get_time_column_index(field_names)
+            if time_column_index is None or self.index_interval <= 0 or not os.path.isfile(index_path):
+                # Files written without index are not indexed
+                return FileClient.Handle(open(file_path, "ab"), os.path.getsize(file_path))
+
+            # Recover the maximum time and the number of rows after the last index entry
+            index = self.read_index(index_path, os.path.getsize(file_path))
+            max_time = None
+            if len(index) > 0:
+                csvfile.seek(index[-1][0])
+                max_time = index[-1][1]
+            index_rows = 0
+            for row in reader:
+                if max_time is None or row[time_column_index] > max_time:
+                    max_time = row[time_column_index]
+                index_rows += 1
+
+        return FileClient.Handle(open(file_path, "ab"), os.path.getsize(file_path),
+                                 time_column_index, open(index_path, "a", newline=''), max_time, index_rows)
+
+    def get_table_lock(self, table):
+        """
+        Get the lock of the table file
+        :param table: Table name
+        :return: Lock
+        """
+        with self.lock:
+            lock = self.table_locks.get(table)
+            if lock is None:
+                lock = self.table_locks[table] = threading.Lock()
+
+        return lock
+
+    def get_handle(self, table):
+        """
+        Get the open file of the table. The file is opened if it is not open,
+        and the least recently written file is closed if there are too many
+        open files. The table lock must be acquired by the caller.
+        :param table: Table name
+        :return: FileClient.Handle, or None if the file has not been created
+        """
+        with self.lock:
+            handle = self.handles.get(table)
+            if handle is not None:
+                self.handles.move_to_end(table)
+                return handle
+
+            file_path = self.get_file_path(table)
+            if not os.path.isfile(file_path):
+                return None
+
+            # Files being written by other threads are skipped
+            for name in list(self.handles.keys()):
+                if len(self.handles) < self.max_open_files:
+                    break
+                if self.table_locks[name].acquire(False):
+                    try:
+                        self.handles.pop(name).close()
+                    finally:
+                        self.table_locks[name].release()
+
+            handle = self.handles[table] = self.open_handle(table)
+            return handle
+
+    def run_flush(self):
+        """
+        Flush the open files periodically
+        """
+        while not self.flush_event.wait(self.flush_interval / 1000.0):
+            self.flush()
+
+    def flush(self):
+        """
+        Flush the written rows of the open files
+        """
+        with self.lock:
+            handles = list(self.handles.items())
+
+        for table, handle in handles:
+            with self.get_table_lock(table):
+                if handle.pending_rows > 0 and not handle.file.closed:
+                    handle.flush()
+
+    def close_table(self, table):
+        """
+        Flush and close the file of the table. It is opened again on the next insertion.
+        :param table: Table name
+        """
+        with self.get_table_lock(table):
+            with self.lock:
+                handle = self.handles.pop(table, None)
+            if handle is not None:
+                handle.close()
+
     def create(self, table, columns, types, primary_key_index=(), is_ifnotexists=True):
         """
         Create table in the database
@@ -53,19 +447,20 @@ class FileClient(DatabaseClient):
         :param types: Type array
         :param is_ifnotexists: Create table if not exists keyword
         """
-        file_path = os.path.join(self.file_directory, table + ".csv")
+        file_path = self.get_file_path(table)
         columns = [e.split(' ')[0] for e in columns]
         if len(columns) != len(types):
             return False
 
-        self.lock.acquire()
-        if os.path.isfile(file_path):
-            Logger.info(self.__class__.__name__, "File (%s) has been created already." % file_path)
-        else:
-            with open(file_path, 'w+') as csvfile:
-                csvfile.write(','.join(["\"" + e + "\"" for e in columns])+'\n')
+        with self.get_table_lock(table):
+            if os.path.isfile(file_path):
+                Logger.info(self.__class__.__name__, "File (%s) has been created already." % file_path)
+            else:
+                with open(file_path, 'w+') as csvfile:
+                    csvfile.write(','.join(["\"" + e + "\"" for e in columns])+'\n')
+                if self.index_interval > 0 and self.get_time_column_index(columns) is not None:
+                    open(self.get_index_path(table), 'w').close()
 
-        self.lock.release()
         return True
 
     def insert(self, table, columns, types, values, primary_key_index=(), is_orreplace=False, is_commit=True):
@@ -79,29 +474,28 @@ class FileClient(DatabaseClient):
                           e.g. [0] means the first column is the primary key
         :param is_orreplace: Indicate if the query is "INSERT OR REPLACE"
         """
-        ret = True
-        file_path = os.path.join(self.file_directory, table + ".csv")
         if len(columns) != len(values):
             return False
 
-        self.lock.acquire()
-        if not os.path.isfile(file_path):
-            ret = False
-        else:
-            with open(file_path, "a+") as csvfile:
-                writer = csv.writer(csvfile, lineterminator='\n', quotechar='\"', quoting=csv.QUOTE_NONNUMERIC)
-                writer.writerow(values)
-        self.lock.release()
+        with self.get_table_lock(table):
+            handle = self.get_handle(table)
+            if handle is None:
+                raise Exception("File (%s) has not been created." % self.get_file_path(table))
 
-        if not ret:
-            raise Exception("File (%s) has not been created.")
+            handle.write(self.format_date_time(columns, values), self.index_interval)
+            if handle.pending_rows >= self.flush_size:
+                handle.flush()
 
         return True
 
     def select(self, table, columns=['*'], condition='', orderby='', limit=0, isFetchAll=True):
         """
         Select rows from the table.
-        Currently the method only processes the one column ordering and condition
+        The condition is compiled once into a predicate, and the rows are
+        streamed from the file until the limit is reached. If the table is
+        indexed, the rows before the lower bound of the time column in the
+        condition, e.g. "date_time >= '20170506 00:00:00.000000'", are skipped.
+        Currently the method only processes the one column ordering
         :param table: Table name
         :param columns: Selected columns
         :param condition: Where condition
@@ -110,73 +504,93 @@ class FileClient(DatabaseClient):
         :param isFetchAll: Indicator of fetching all
         :return Result rows
         """
-        file_path = self.file_directory + table + ".csv"
+        file_path = self.get_file_path(table)
         is_all_columns = len(columns) == 1 and columns[0] == '*'
-        csv_field_names = []
         columns = [e.split(' ')[0] for e in columns]
-        ret = []
-        is_error = False
-
-        # Preparing condition
-        if condition != '':
-            condition = condition.replace('=', '==')
-            condition = condition.replace('!==', '!=')
-            condition = condition.replace('>==', '>=')
-            condition = condition.replace('<==', '<=')
-
-        self.lock.acquire()
-        if not os.path.isfile(file_path):
-            is_error = True
-        else:
-            with open(file_path, "r") as csvfile:
+
+        with self.get_table_lock(table):
+            handle = self.handles.get(table)
+            if handle is not None and handle.pending_rows > 0:
+                handle.flush()
+
+            if not os.path.isfile(file_path):
+                raise Exception("File (%s) has not been created." % file_path)
+
+            with open(file_path, "r", newline='') as csvfile:
                 reader = csv.reader(csvfile, lineterminator='\n', quotechar='\"', quoting=csv.QUOTE_NONNUMERIC)
-                csv_field_names = next(reader, None)
+                csv_field_names = next(reader, [])
                 for col in columns:
                     if not is_all_columns and col not in csv_field_names:
                         raise Exception("Field (%s) is not in the table." % col)
 
-                for csv_row in reader:
-                    # Filter by condition statement
-                    is_selected = True
-                    if condition != '':
-                        condition_eval = condition
-                        for i in range(0, len(csv_field_names)):
-                            key = csv_field_names[i]
-                            value = csv_row[i]
-                            if condition_eval.find(key) > -1:
-                                condition_eval = condition_eval.replace(key, str(value))
-                        is_selected = eval(condition_eval)
-
-                    if is_selected:
-                        ret.append(list(csv_row))
-
-        self.lock.release()
-
-        if is_error:
-            raise Exception("File (%s) has not been created.")
-
-        if orderby != '':
-            # Sort the result
-            field = orderby.split(' ')[0].strip()
-            asc_val = orderby.split(' ')[1].strip() if len(orderby.split(' ')) > 1 else 'asc'
-            if asc_val != 'asc' and asc_val != 'desc':
-                raise Exception("Incorrect orderby in select statement (%s)." % orderby)
-            elif field not in csv_field_names:
-                raise Exception("Field (%s) is not in the table." % col)
-
-            field_index = csv_field_names.index(field)
-            ret = sorted(ret, key=lambda x:x[field_index], reverse=(asc_val == 'desc'))
-
-        if limit > 0:
-            # Trim the result by the limit
-            ret = ret[:limit]
-
-        if not is_all_columns:
-            field_index = [csv_field_names.index(x) for x in columns]
-            ret = [[row[i] for i in field_index] for row in ret]
+                # Preparing condition
+                condition = FileClient.Condition(condition, csv_field_names)
+                offset = self.get_index_offset(table, csv_field_names, condition)
+                if offset > 0:
+                    csvfile.seek(offset)
+
+                rows = reader if condition.predicate is None else filter(condition.predicate, reader)
+
+                if orderby != '':
+                    # Sort the result
+                    field = orderby.split(' ')[0].strip()
+                    asc_val = orderby.split(' ')[1].strip() if len(orderby.split(' ')) > 1 else 'asc'
+                    if asc_val != 'asc' and asc_val != 'desc':
+                        raise Exception("Incorrect orderby in select statement (%s)." % orderby)
+                    elif field not in csv_field_names:
+                        raise Exception("Field (%s) is not in the table." % field)
+
+                    field_index = csv_field_names.index(field)
+                    key = operator.itemgetter(field_index)
+                    if limit > 0:
+                        # Top rows by heap
+                        rows = (heapq.nlargest if asc_val == 'desc' else heapq.nsmallest)(limit, rows, key=key)
+                    else:
+                        rows = sorted(rows, key=key, reverse=(asc_val == 'desc'))
+                elif limit > 0:
+                    # Stop reading at the limit
+                    rows = islice(rows, limit)
+
+                if is_all_columns:
+                    ret = [list(row) for row in rows]
+                else:
+                    field_index = [csv_field_names.index(x) for x in columns]
+                    ret = [[row[i] for i in field_index] for row in rows]
 
         return ret
 
+    def get_index_offset(self, table, field_names, condition):
+        """
+        Get the offset of the table file from which the rows can satisfy the
+        lower bounds of the time column in the condition
+        :param table: Table name
+        :param field_names: Column names of the table
+        :param condition: FileClient.Condition
+        :return: Offset, or 0 if the rows are read from the beginning
+        """
+        time_column_index = self.get_time_column_index(field_names)
+        index_path = self.get_index_path(table)
+        if time_column_index is None or not os.path.isfile(index_path):
+            return 0
+
+        bounds = condition.get_lower_bounds(time_column_index)
+        if len(bounds) == 0:
+            return 0
+
+        index = self.read_index(index_path, os.path.getsize(self.get_file_path(table)))
+        max_times = [e[1] for e in index]
+        offset = 0
+        for value, is_exclusive in bounds:
+            try:
+                # The last entry with all the rows before it outside the bound
+                i = (bisect.bisect_right if is_exclusive else bisect.bisect_left)(max_times, value) - 1
+            except TypeError:
+                continue
+            if i >= 0:
+                offset = max(offset, index[i][0])
+
+        return offset
+
     def delete(self, table, condition='1==1'):
         """
         Delete rows from the table
@@ -185,3 +599,16 @@ class FileClient(DatabaseClient):
         """
         raise Exception("Deletion is not supported in file client.")
 
+    def close(self):
+        """
+        Flush and close the open files
+        """
+        self.flush_event.set()
+        with self.lock:
+            tables = list(self.handles.keys())
+
+        for table in tables:
+            self.close_table(table)
+
+        return True
+
@@ -1,7 +1,14 @@
+from befh.util import Timestamp
+
+
 class DatabaseClient:
     """
     Base database client
     """
+    # Indicate if the client only receives the exchange snapshots, but not
+    # the rows of the instrument tables
+    is_snapshot_only = False
+
     def __init__(self):
         """
         Constructor
@@ -27,6 +34,18 @@ class DatabaseClient:
             raise Exception("Cannot convert value (%s)<%s> to string. Value is not a string, an integer nor a float" %\
                             (val, type(val)))
 
+    @classmethod
+    def format_date_time(cls, columns, values):
+        """
+        Format the timestamps of the date time columns to string
+        :param columns: Column array
+        :param values: Value array. Date time values are either formatted strings
+                       or integer microseconds since epoch.
+        :return: Value array with the date time values formatted
+        """
+        return [Timestamp.format(v) if type(v) is int and c.find('date_time') > -1 else v
+                for c, v in zip(columns, values)]
+
     def connect(self, **args):
         """
         Connect
@@ -1,16 +1,25 @@
 from befh.clients.database import DatabaseClient
-from befh.util import Logger
+from befh.util import Logger, Timestamp
 import threading
+import atexit
 import re
 import numpy
 from qpython import qconnection
-from qpython.qcollection import QTable, QKeyedTable, QList
+from qpython.qcollection import QTable, QKeyedTable, QList, qlist
+from qpython.qtype import QTIMESTAMP_LIST, QSYMBOL_LIST, QDOUBLE_LIST, QLONG_LIST
 
 
 class KdbPlusClient(DatabaseClient):
     """
     Kdb+ Client
     """
+    # Microseconds between the unix epoch and the kdb+ epoch (2000.01.01)
+    KDB_EPOCH = 946684800000000
+
+    # Functions of the columnar insertions. The columns are sent as typed lists.
+    INSERT_FUNCTION = '{[t;c;d] t insert flip c!d}'
+    UPSERT_FUNCTION = '{[t;c;d] t upsert flip c!d}'
+
     @classmethod
     def parse_condition(cls, condition):
         """
@@ -62,6 +71,29 @@ class KdbPlusClient(DatabaseClient):
         else:
             return value.item()
 
+    @classmethod
+    def to_qlist(cls, column, type, values):
+        """
+        Convert the values of a column to a typed list
+        :param column: Column name
+        :param type: SQL type, or "timestamp" for the timestamp columns
+        :param values: Value array
+        :return: QList
+        """
+        t = str if type == 'timestamp' else cls.convert_type(type)
+        if type == 'timestamp' or (t is str and column.find('date_time') > -1):
+            # Nanoseconds since the kdb+ epoch
+            timestamps = numpy.array([Timestamp.parse(v) if isinstance(v, str) else v for v in values],
+                                     dtype=numpy.int64)
+            return qlist((timestamps - cls.KDB_EPOCH) * 1000, qtype=QTIMESTAMP_LIST)
+        elif t is str:
+            return qlist(numpy.array([str(v).encode('utf-8') for v in values], dtype=numpy.bytes_),
+                         qtype=QSYMBOL_LIST)
+        elif t is float:
+            return qlist(numpy.array(values, dtype=numpy.float64), qtype=QDOUBLE_LIST)
+        else:
+            return qlist(numpy.array(values, dtype=numpy.int64), qtype=QLONG_LIST)
+
     def __init__(self):
         """
         Constructor
@@ -69,6 +101,41 @@ class KdbPlusClient(DatabaseClient):
         DatabaseClient.__init__(self)
         self.conn = None
         self.lock = threading.Lock()
+        # Batch insert. Rows are inserted one by one if the batch size is 1.
+        self.batch_size = 1
+        self.flush_interval = 0
+        self.is_async = False
+        # (table, columns, types, is_orreplace) -> buffered rows
+        self.buffers = dict()
+        self.flush_event = threading.Event()
+        self.flush_thread = None
+
+    def set_batch_insert(self, batch_size, flush_interval=1000, is_async=False):
+        """
+        Buffer the inserted rows and insert them in batches. The rows of a
+        table are sent as a single columnar insertion either when the table
+        has buffered the batch size of rows, or when the flush interval has
+        elapsed.
+        :param batch_size: Number of rows buffered per table
+        :param flush_interval: Maximum milliseconds that a row is buffered
+        :param is_async: Send the insertions by asynchronous messages. The
+                         errors in the kdb+ process are not returned.
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.is_async = is_async
+        if self.batch_size > 1 and self.flush_interval > 0 and self.flush_thread is None:
+            self.flush_thread = threading.Thread(target=self.run_flush)
+            self.flush_thread.daemon = True
+            self.flush_thread.start()
+            atexit.register(self.flush)
+
+    def run_flush(self):
+        """
+        Flush the buffered rows periodically
+        """
+        while not self.flush_event.wait(self.flush_interval / 1000.0):
+            self.flush()
 
     def connect(self, **kwargs):
         """
@@ -189,38 +256,60 @@ class KdbPlusClient(DatabaseClient):
             raise Exception("Incorrect insert statement. Number of columns and that of types are different.\n%s\n%s" % \
                 (columns, values))
 
-        v = values[:]
-        for i in range(0, len(v)):
-            type = self.convert_type(types[i])
-            if i in primary_key_index:
-                v[i] = "`" + v[i]
-            elif type is str:
-                if columns[i].find('date_time') > -1:
-                    v_len = len(v[i])
-                    v[i] = re.sub("(\d{4})(\d{2})(\d{2}) (\d{2}):(\d{2}):(\d{2}).(\d*)", \
-                                  "\\1.\\2.\\3D\\4:\\5:\\6.\\7", v[i]) + "0" * (27-v_len)
-                else:
-                    v[i] = "`$\"" + v[i] + "\""
-            elif type is float:
-                v[i] = float(v[i])
-            elif type is int:
-                v[i] = int(v[i])
+        key = (table, tuple(columns), tuple(types), is_orreplace)
+        self.lock.acquire()
+        try:
+            rows = self.buffers.setdefault(key, [])
+            rows.append(values)
+            if len(rows) >= self.batch_size:
+                self.flush_rows(key)
+        finally:
+            self.lock.release()
 
-        value_string = '; '.join([str(e) for e in v])
+        return True
 
-        if is_orreplace:
-            command = "`%s upsert (%s)" % (table, value_string)
-        else:
-            command = "`%s insert (%s)" % (table, value_string)
+    def flush_rows(self, key):
+        """
+        Send the buffered rows of the table as typed column lists. The lock
+        must be acquired by the caller.
+        :param key: (table, columns, types, is_orreplace)
+        """
+        table, columns, types, is_orreplace = key
+        rows = self.buffers.pop(key, [])
+        if len(rows) == 0:
+            return
+
+        data = [self.to_qlist(columns[i], types[i], [row[i] for row in rows]) for i in range(0, len(columns))]
+        function = self.UPSERT_FUNCTION if is_orreplace else self.INSERT_FUNCTION
+        send = self.conn.sendAsync if self.is_async else self.conn.sendSync
+        try:
+            send(function,
+                 numpy.bytes_(table.encode('utf-8')),
+                 qlist(numpy.array([c.encode('utf-8') for c in columns]), qtype=QSYMBOL_LIST),
+                 data)
+        except Exception as e:
+            raise Exception("Error in inserting %d rows into table %s.\n%s" % (len(rows), table, e))
 
+    def flush(self):
+        """
+        Send all the buffered rows
+        """
         self.lock.acquire()
         try:
-            self.conn.sync(command)
-        except Exception as e:
-            raise Exception("Error in running insert statement (%s).\n%s" % (command, e))
+            for key in list(self.buffers.keys()):
+                try:
+                    self.flush_rows(key)
+                except Exception as e:
+                    Logger.error(self.__class__.__name__, str(e))
         finally:
             self.lock.release()
 
+    def close(self):
+        """
+        Flush the buffered rows and stop the flush thread
+        """
+        self.flush_event.set()
+        self.flush()
         return True
 
     def select(self, table, columns=['*'], condition='', orderby='', limit=0, isFetchAll=True):
@@ -234,6 +323,7 @@ class KdbPlusClient(DatabaseClient):
         :param isFetchAll: Indicator of fetching all
         :return Result rows
         """
+        self.flush()
         command = ''
 
         # Select columns
@@ -315,6 +405,7 @@ class KdbPlusClient(DatabaseClient):
         :param table: Table name
         :param condition: Where condition
         """
+        self.flush()
         if condition == '1==1':
             statement = 'delete from `%s' % (table)
         else:
@@ -0,0 +1,140 @@
+from befh.clients.kdbplus import KdbPlusClient
+from befh.market_data import Snapshot
+import numpy
+
+
+class KdbTickerplantClient(KdbPlusClient):
+    """
+    Kdb+ tickerplant publisher.
+
+    The client acts as a feed handler of a kdb+ tickerplant. The exchange
+    snapshots are published as the rows of the "trades" and "quotes" tables
+    by asynchronous ".u.upd" calls, and the tickerplant subscribers (rdb/hdb)
+    store them. The tables are defined in the tickerplant schema, see
+    KdbTickerplantClient.schema().
+    """
+    is_snapshot_only = True
+    SNAPSHOT_TABLE = 'exchanges_snapshot'
+
+    TRADES_TABLE = 'trades'
+    TRADES_COLUMNS = ['time', 'sym', 'exchange', 'price', 'size']
+    TRADES_TYPES = ['timestamp', 'varchar(20)', 'varchar(20)', 'decimal(20,8)', 'decimal(20,8)']
+
+    QUOTES_TABLE = 'quotes'
+    QUOTES_COLUMNS = ['time', 'sym', 'exchange'] + \
+                     ['b1', 'b2', 'b3', 'b4', 'b5', 'a1', 'a2', 'a3', 'a4', 'a5'] + \
+                     ['bq1', 'bq2', 'bq3', 'bq4', 'bq5', 'aq1', 'aq2', 'aq3', 'aq4', 'aq5']
+    QUOTES_TYPES = ['timestamp', 'varchar(20)', 'varchar(20)'] + ['decimal(20,8)'] * 20
+
+    @classmethod
+    def schema(cls):
+        """
+        Table definitions in the tickerplant schema file
+        :return: q statements
+        """
+        definitions = []
+        for table, columns, types in [(cls.TRADES_TABLE, cls.TRADES_COLUMNS, cls.TRADES_TYPES),
+                                      (cls.QUOTES_TABLE, cls.QUOTES_COLUMNS, cls.QUOTES_TYPES)]:
+            c = []
+            for column, type in zip(columns, types):
+                if type == 'timestamp':
+                    c.append(column + ":`timestamp$()")
+                elif cls.convert_type(type) is str:
+                    c.append(column + ":`symbol$()")
+                else:
+                    c.append(column + ":`float$()")
+            definitions.append('%s:([] %s)' % (table, '; '.join(c)))
+
+        return '\n'.join(definitions)
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        KdbPlusClient.__init__(self)
+        self.is_async = True
+
+    def set_batch_insert(self, batch_size, flush_interval=1000, is_async=True):
+        """
+        Buffer the published rows and publish them in batches. The rows of a
+        table are published by a single ".u.upd" call either when the table
+        has buffered the batch size of rows, or when the flush interval has
+        elapsed.
+        :param batch_size: Number of rows buffered per table
+        :param flush_interval: Maximum milliseconds that a row is buffered
+        :param is_async: Publish the rows by asynchronous messages
+        """
+        KdbPlusClient.set_batch_insert(self, batch_size, flush_interval, is_async)
+
+    def create(self, table, columns, types, primary_key_index=(), is_ifnotexists=True):
+        """
+        The tables are defined in the tickerplant schema
+        """
+        return True
+
+    def insert(self, table, columns, types, values, primary_key_index=(), is_orreplace=False, is_commit=True):
+        """
+        Publish the exchange snapshot. A trade update is published as a row
+        of the trades table, and an order book update as a row of the quotes
+        table. Only the exchange snapshot table is published.
+        :param table: Table name
+        :param columns: Column array
+        :param types: Type array
+        :param values: Value array
+        :param primary_key_index: Not used
+        :param is_orreplace: Not used
+        :param is_commit: Not used
+        """
+        if table != self.SNAPSHOT_TABLE or columns != Snapshot.columns():
+            return True
+
+        snapshot = dict(zip(columns, values))
+        if snapshot['update_type'] == Snapshot.UpdateType.TRADES:
+            key = self.TRADES_TABLE
+            row = [snapshot['trades_date_time'], snapshot['instmt'], snapshot['exchange'],
+                   snapshot['trade_px'], snapshot['trade_volume']]
+        elif snapshot['update_type'] == Snapshot.UpdateType.ORDER_BOOK:
+            key = self.QUOTES_TABLE
+            row = [snapshot['order_date_time'], snapshot['instmt'], snapshot['exchange']] + \
+                  [snapshot[c] for c in self.QUOTES_COLUMNS[3:]]
+        else:
+            return True
+
+        self.lock.acquire()
+        try:
+            rows = self.buffers.setdefault(key, [])
+            rows.append(row)
+            if len(rows) >= self.batch_size:
+                self.flush_rows(key)
+        finally:
+            self.lock.release()
+
+        return True
+
+    def flush_rows(self, key):
+        """
+        Publish the buffered rows of the table by ".u.upd". The lock must be
+        acquired by the caller.
+        :param key: Table name
+        """
+        rows = self.buffers.pop(key, [])
+        if len(rows) == 0:
+            return
+
+        if key == self.TRADES_TABLE:
+            columns, types = self.TRADES_COLUMNS, self.TRADES_TYPES
+        else:
+            columns, types = self.QUOTES_COLUMNS, self.QUOTES_TYPES
+
+        data = [self.to_qlist(columns[i], types[i], [row[i] for row in rows]) for i in range(0, len(columns))]
+        send = self.conn.sendAsync if self.is_async else self.conn.sendSync
+        try:
+            send('.u.upd', numpy.bytes_(key.encode('utf-8')), data)
+        except Exception as e:
+            raise Exception("Error in publishing %d rows of table %s.\n%s" % (len(rows), key, e))
+
+    def select(self, table, columns=['*'], condition='', orderby='', limit=0, isFetchAll=True):
+        raise Exception("Selection is not supported in tickerplant client.")
+
+    def delete(self, table, condition='1==1'):
+        raise Exception("Deletion is not supported in tickerplant client.")
@@ -4,13 +4,18 @@ import pymysql
 
 class MysqlClient(SqlClient):
     """
-    Sqlite client
+    Mysql client
     """
+    # Pymysql splits a batch into statements bounded by max_allowed_packet
+    max_rows_per_statement = 5000
+
     def __init__(self):
         """
         Constructor
         """
         SqlClient.__init__(self)
+        # Tuple cursor for the parameterised writes
+        self.write_cursor = None
 
     def connect(self, **kwargs):
         """
@@ -30,14 +35,35 @@ class MysqlClient(SqlClient):
                                     charset='utf8mb4',
                                     cursorclass=pymysql.cursors.DictCursor)
         self.cursor = self.conn.cursor()
+        self.write_cursor = self.conn.cursor(pymysql.cursors.Cursor)
+
+        # Multi-row insert statements are bounded by the server packet size
+        self.cursor.execute("select @@max_allowed_packet as max_allowed_packet")
+        max_allowed_packet = int(self.cursor.fetchone()['max_allowed_packet'])
+        self.write_cursor.max_stmt_length = max(max_allowed_packet - 1024, 1024)
+
         return self.conn is not None and self.cursor is not None
 
-    def execute(self, sql):
+    def execute(self, sql, params=None):
         """
         Execute the sql command
         :param sql: SQL command
+        :param params: Parameter values of the placeholders
+        """
+        if params is None:
+            return self.cursor.execute(sql)
+        else:
+            return self.write_cursor.execute(sql, params)
+
+    def executemany(self, sql, rows):
+        """
+        Execute the parameterised sql command for each row. Pymysql
+        combines the rows into multi-row insert statements, each of which
+        is bounded by max_allowed_packet.
+        :param sql: SQL command
+        :param rows: Array of parameter value arrays
         """
-        return self.cursor.execute(sql)
+        return self.write_cursor.executemany(sql, rows)
 
     def commit(self):
         """
@@ -45,6 +71,12 @@ class MysqlClient(SqlClient):
         """
         self.conn.commit()
 
+    def rollback(self):
+        """
+        Rollback
+        """
+        self.conn.rollback()
+
     def fetchone(self):
         """
         Fetch one record
@@ -86,3 +118,20 @@ class MysqlClient(SqlClient):
             return ret
         else:
             return select
+
+    def insert_statement(self, table, columns, is_orreplace):
+        """
+        Parameterised insert statement. Rows replacing the existing ones are
+        updated in place by "on duplicate key update" rather than "replace",
+        which deletes and inserts the row again.
+        :param table: Table name
+        :param columns: Column array
+        :param is_orreplace: Indicate if the query is "INSERT OR REPLACE"
+        :return SQL statement
+        """
+        sql = SqlClient.insert_statement(self, table, columns, False)
+        if is_orreplace:
+            sql += " on duplicate key update %s" % ', '.join(['%s = values(%s)' % (column, column)
+                                                              for column in columns])
+
+        return sql
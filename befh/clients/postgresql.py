@@ -1,8 +1,8 @@
 from befh.clients.sql import SqlClient
 from befh.clients.database import DatabaseClient
-from befh.util import Logger
 import psycopg2
 import psycopg2.extras
+import io
 
 class PostgresqlClient(SqlClient):
     """
@@ -12,11 +12,59 @@ class PostgresqlClient(SqlClient):
     def replace_keyword(cls):
         return 'insert into'
 
+    @classmethod
+    def conflict_columns(cls, table):
+        """
+        Unique columns of the upsert
+        :param table: Table name
+        """
+        if table == "exchanges_snapshot":
+            return "exchange, instmt"
+        else:
+            return "id"
+
+    @classmethod
+    def staging_table_name(cls, table):
+        """
+        Temporary table receiving the copied rows before the merge
+        :param table: Table name
+        """
+        return 'staging_' + table
+
+    @classmethod
+    def copy_data(cls, rows):
+        """
+        Rows in the CSV format of COPY. Strings are quoted so that an empty
+        string is not read as NULL, and None is written as an unquoted NULL.
+        :param rows: Array of value arrays
+        :return: File object of the data
+        """
+        data = io.StringIO()
+        for values in rows:
+            data.write(','.join(['' if e is None else
+                                 '"' + e.replace('"', '""') + '"' if isinstance(e, str) else
+                                 str(e) for e in values]))
+            data.write('\n')
+        data.seek(0)
+        return data
+
     def __init__(self):
         """
         Constructor
         """
         SqlClient.__init__(self)
+        self.is_copy = False
+
+    def set_copy_insert(self, is_copy=True):
+        """
+        Insert the buffered rows by COPY FROM STDIN instead of insert
+        statements. The rows are copied directly into the table, or into a
+        temporary staging table and merged into the table by a single
+        "insert ... select ... on conflict" statement for upserts. Only
+        effective with batch insert.
+        :param is_copy: Indicate if COPY is used
+        """
+        self.is_copy = is_copy
 
     def connect(self, **kwargs):
         """
@@ -43,24 +91,41 @@ class PostgresqlClient(SqlClient):
         self.cursor = self.conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
         return self.conn is not None and self.cursor is not None
 
-    def execute(self, sql):
+    def execute(self, sql, params=None):
         """
         Execute the sql command
         :param sql: SQL command
+        :param params: Parameter values of the placeholders
         """
         try:
-            return_val = self.cursor.execute(sql)
+            return_val = self.cursor.execute(sql, params)
             return True
         except Exception as err:
 
             raise
 
+    def executemany(self, sql, rows):
+        """
+        Execute the parameterised sql command for each row. The rows are
+        sent in pages of statements rather than one round trip per row.
+        :param sql: SQL command
+        :param rows: Array of parameter value arrays
+        """
+        psycopg2.extras.execute_batch(self.cursor, sql, rows, page_size=self.max_rows_per_statement)
+        return True
+
     def commit(self):
         """
         Commit
         """
         self.conn.commit()
 
+    def rollback(self):
+        """
+        Rollback
+        """
+        self.conn.rollback()
+
     def fetchone(self):
         """
         Fetch one record
@@ -103,48 +168,52 @@ class PostgresqlClient(SqlClient):
         else:
             return select
 
-    def insert(self, table, columns, types, values, primary_key_index=(), is_orreplace=False, is_commit=True):
+    def insert_statement(self, table, columns, is_orreplace):
         """
-        Insert into the table
+        Parameterised insert statement
         :param table: Table name
         :param columns: Column array
-        :param types: Type array
-        :param values: Value array
-        :param primary_key_index: An array of indices of primary keys in columns,
-                          e.g. [0] means the first column is the primary key
         :param is_orreplace: Indicate if the query is "INSERT OR REPLACE"
+        :return SQL statement
         """
-        if len(columns) != len(values):
-            return False
-
-        column_names = ','.join(columns)
-        value_string = ','.join([SqlClient.convert_str(e) for e in values])
+        sql = SqlClient.insert_statement(self, table, columns, False)
         if is_orreplace:
-            conflict_update_string = []
-            column_vals = dict(zip(columns, [SqlClient.convert_str(e) for e in values]))
-            for column, val in column_vals.items():
-                if column == "id":
-                    continue
+            sql += self.conflict_statement(table, columns)
 
-                conflict_update_string += [('%s  = %s' % (column, val))]
+        return sql
 
-            conflict_update_string = ', '.join(conflict_update_string)
+    def conflict_statement(self, table, columns):
+        """
+        On conflict clause of the upsert
+        :param table: Table name
+        :param columns: Column array
+        """
+        conflict_update_string = ', '.join(['%s = excluded.%s' % (column, column)
+                                            for column in columns if column != "id"])
+        return " on conflict (%s) do update set %s" % (self.conflict_columns(table), conflict_update_string)
 
-            if table == "exchanges_snapshot":
-                conflict_columns = "exchange, instmt"
-            else:
-                conflict_columns = "id"
+    def insert_rows(self, table, columns, rows, is_orreplace):
+        """
+        Insert a batch of rows without commit
+        :param table: Table name
+        :param columns: Column array
+        :param rows: Array of value arrays
+        :param is_orreplace: Indicate if the query is "INSERT OR REPLACE"
+        """
+        if not self.is_copy:
+            return SqlClient.insert_rows(self, table, columns, rows, is_orreplace)
 
-            sql = "insert into %s (%s) values (%s) on conflict (%s) do update set %s" % (table, column_names, value_string, conflict_columns, conflict_update_string)
+        column_names = ','.join(columns)
+        if is_orreplace:
+            # The staging table is emptied on commit
+            staging_table = self.staging_table_name(table)
+            self.execute("create temp table if not exists %s (like %s) on commit delete rows" %
+                         (staging_table, table))
+            self.cursor.copy_expert("copy %s (%s) from stdin with (format csv)" % (staging_table, column_names),
+                                    self.copy_data(rows))
+            self.execute("insert into %s (%s) select %s from %s%s" %
+                         (table, column_names, column_names, staging_table,
+                          self.conflict_statement(table, columns)))
         else:
-            sql = "insert into %s (%s) values (%s)" % (table, column_names, value_string)
-
-        self.lock.acquire()
-        try:
-            self.execute(sql)
-            if is_commit:
-                self.commit()
-        except Exception as e:
-            Logger.info(self.__class__.__name__, "SQL error: %s\nSQL: %s" % (e, sql))
-        self.lock.release()
-        return True
\ No newline at end of file
+            self.cursor.copy_expert("copy %s (%s) from stdin with (format csv)" % (table, column_names),
+                                    self.copy_data(rows))
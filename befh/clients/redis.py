@@ -1,11 +1,11 @@
 import json
-from datetime import datetime
-
-import pytz
-from pytz import utc
 
 from befh.clients.database import DatabaseClient
+from befh.market_data import Snapshot
+from befh.util import Logger, Timestamp
+from collections import OrderedDict
 import threading
+import atexit
 import redis
 import re
 
@@ -19,12 +19,111 @@ class RedisClient(DatabaseClient):
     _EXCHANGES_SNAPSHOT_TABLE_NAME = "exchanges_snapshot"
     _TRADES_TABLE_PREFIX = re.compile("exch_(.*)_(.*)_trades_[0-9]{8}")
 
+    class SnapshotLayout:
+        # A string key per column
+        KEYS = 'keys'
+        # A hash per instrument, with the field "version"
+        HASH = 'hash'
+        # A string key per instrument of the values packed by Snapshot.pack
+        PACKED = 'packed'
+
+    class MessageFormat:
+        JSON = 'json'
+        PACKED = 'packed'
+
+    # Version of the snapshot hash fields
+    SNAPSHOT_HASH_VERSION = 1
+
+    @classmethod
+    def get_snapshot_key(cls, layout, exchange, instmt, column=''):
+        """
+        Get the key of the instrument snapshot
+        :param layout: RedisClient.SnapshotLayout
+        :param exchange: Exchange name
+        :param instmt: Instrument name
+        :param column: Column name, only for the layout of keys
+        :return: Key
+        """
+        if layout == cls.SnapshotLayout.KEYS:
+            return "%ses_%s_%s_%s" % (cls._REDIS_KEY_PREFIX, exchange.lower(), instmt.lower(), column.lower())
+        elif layout == cls.SnapshotLayout.HASH:
+            return "%sesh_%s_%s" % (cls._REDIS_KEY_PREFIX, exchange.lower(), instmt.lower())
+        elif layout == cls.SnapshotLayout.PACKED:
+            return "%sesp_%s_%s" % (cls._REDIS_KEY_PREFIX, exchange.lower(), instmt.lower())
+        else:
+            raise Exception("Unknown Redis snapshot layout (%s)" % layout)
+
+    @classmethod
+    def get_snapshot_channel(cls):
+        """
+        Get the pub/sub channel of the snapshots
+        :return: Channel name
+        """
+        return "%ses" % cls._REDIS_KEY_PREFIX
+
     def __init__(self):
         """
         Constructor
         """
         DatabaseClient.__init__(self)
+        self.conn = None
         self.lock = threading.Lock()
+        # Serializes the pipelines so that the writes are applied in order
+        self.send_lock = threading.Lock()
+        # Batch insert. Rows are written one by one if the batch size is 1.
+        self.batch_size = 1
+        self.flush_interval = 0
+        self.flush_event = threading.Event()
+        self.flush_thread = None
+        # Buffered writes. The snapshot keys are coalesced to the latest values.
+        self.pending_rows = 0
+        self.snapshot_values = OrderedDict()
+        self.messages = []
+        self.period_values = OrderedDict()
+        self.queue_periods = OrderedDict()
+        self.snapshot_hashes = OrderedDict()
+        # Snapshot layout and pub/sub message format
+        self.snapshot_layout = RedisClient.SnapshotLayout.KEYS
+        self.message_format = RedisClient.MessageFormat.JSON
+
+    def set_snapshot_format(self, layout, message_format):
+        """
+        Set the layout of the snapshot keys and the format of the published
+        snapshots. The packed values and messages require the rows of the
+        snapshot table in the order of Snapshot.columns().
+        :param layout: RedisClient.SnapshotLayout
+        :param message_format: RedisClient.MessageFormat
+        """
+        self.get_snapshot_key(layout, '', '')
+        if message_format not in (RedisClient.MessageFormat.JSON, RedisClient.MessageFormat.PACKED):
+            raise Exception("Unknown Redis message format (%s)" % message_format)
+
+        self.snapshot_layout = layout
+        self.message_format = message_format
+
+    def set_batch_insert(self, batch_size, flush_interval=1000):
+        """
+        Buffer the inserted rows and write them in a single pipeline either
+        when the batch size of rows is buffered, or when the flush interval
+        has elapsed. The snapshot keys are written once per flush with the
+        latest values, while every snapshot is still published.
+        :param batch_size: Number of rows buffered
+        :param flush_interval: Maximum milliseconds that a row is buffered
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        if self.batch_size > 1 and self.flush_interval > 0 and self.flush_thread is None:
+            self.flush_thread = threading.Thread(target=self.run_flush)
+            self.flush_thread.daemon = True
+            self.flush_thread.start()
+            atexit.register(self.flush)
+
+    def run_flush(self):
+        """
+        Flush the buffered rows periodically
+        """
+        while not self.flush_event.wait(self.flush_interval / 1000.0):
+            self.flush()
 
     def connect(self, **kwargs):
         """
@@ -88,62 +187,149 @@ class RedisClient(DatabaseClient):
         :param is_orreplace: Indicate if the query is "INSERT OR REPLACE"
         """
 
-        # If it's an exchange snapshot table SET all column values into Redis and also publish the values as JSON.
+        # If it's an exchange snapshot table write the values into Redis by the snapshot layout, and also publish
+        # the values as JSON or packed bytes.
         if table == RedisClient._EXCHANGES_SNAPSHOT_TABLE_NAME:
-            ret = dict(zip(columns, values))
-            ret['table'] = table
-            json_ret = json.dumps(ret)
-
+            ret = dict(zip(columns, self.format_date_time(columns, values)))
             exchange = ret['exchange']
             instrument = ret['instmt']
 
+            packed = None
+            if self.snapshot_layout == RedisClient.SnapshotLayout.PACKED or \
+               self.message_format == RedisClient.MessageFormat.PACKED:
+                if list(columns) != Snapshot.columns():
+                    raise Exception("Snapshot columns are not packable.\n%s" % columns)
+                packed = Snapshot.pack(values)
+
+            if self.message_format == RedisClient.MessageFormat.PACKED:
+                message = packed
+            else:
+                ret['table'] = table
+                message = json.dumps(ret)
+
             self.lock.acquire()
-            for column in columns:
-                key = "%ses_%s_%s_%s" % (RedisClient._REDIS_KEY_PREFIX,
-                                         exchange.lower(),
-                                         instrument.lower(),
-                                         column.lower())
-                value = ret[column]
-                self.conn.set(key, value)
-
-            self.conn.publish("%ses" % RedisClient._REDIS_KEY_PREFIX, json_ret)
-            self.lock.release()
+            try:
+                if self.snapshot_layout == RedisClient.SnapshotLayout.KEYS:
+                    for column in columns:
+                        key = self.get_snapshot_key(self.snapshot_layout, exchange, instrument, column)
+                        self.snapshot_values[key] = ret[column]
+                elif self.snapshot_layout == RedisClient.SnapshotLayout.HASH:
+                    key = self.get_snapshot_key(self.snapshot_layout, exchange, instrument)
+                    mapping = dict((column, ret[column]) for column in columns)
+                    mapping['version'] = RedisClient.SNAPSHOT_HASH_VERSION
+                    self.snapshot_hashes[key] = mapping
+                else:
+                    key = self.get_snapshot_key(self.snapshot_layout, exchange, instrument)
+                    self.snapshot_values[key] = packed
+
+                self.messages.append(message)
+                self.pending_rows += 1
+                is_flush = self.pending_rows >= self.batch_size
+            finally:
+                self.lock.release()
         else:
             # If it's the trades table add the amount and volume to the period trades list and add the period to the
             # period queue.
             trades_table_match = RedisClient._TRADES_TABLE_PREFIX.match(table)
-            if trades_table_match:
-                ret = dict(zip(columns, values))
-                ret['table'] = table
+            if not trades_table_match:
+                return True
 
-                exchange = trades_table_match.group(1)
-                instrument = trades_table_match.group(2)
+            ret = dict(zip(columns, values))
+            ret['table'] = table
 
-                trade_price = str(ret['trade_price'])
-                trade_volume = str(ret['trade_volume'])
+            exchange = trades_table_match.group(1)
+            instrument = trades_table_match.group(2)
 
-                trade_date = pytz.utc.localize(datetime.strptime(ret['date_time'], '%Y%m%d %H:%M:%S.%f'))
-                epoch = int(trade_date.strftime("%s"))
+            trade_price = str(ret['trade_price'])
+            trade_volume = str(ret['trade_volume'])
 
-                now = datetime.now(tz=utc)
+            trade_date = ret['date_time']
+            if not isinstance(trade_date, int):
+                trade_date = Timestamp.parse(trade_date)
+            epoch = trade_date // Timestamp.MICROSECONDS_PER_SECOND
 
-                # Delay between now and trade date.
-                print("{} {}".format(instrument, (now - trade_date)))
+            period_key = "%setp_%s_%s_%d" % (RedisClient._REDIS_KEY_PREFIX,
+                                             exchange,
+                                             instrument,
+                                             epoch)
+            queue_key = "%setpq_%s_%s" % (RedisClient._REDIS_KEY_PREFIX,
+                                          exchange,
+                                          instrument)
 
-                period_key = "%setp_%s_%s_%d" % (RedisClient._REDIS_KEY_PREFIX,
-                                                 exchange,
-                                                 instrument,
-                                                 epoch)
-                queue_key = "%setpq_%s_%s" % (RedisClient._REDIS_KEY_PREFIX,
-                                              exchange,
-                                              instrument)
+            val = "/".join([trade_price, trade_volume])
 
-                val = "/".join([trade_price, trade_volume])
+            self.lock.acquire()
+            try:
+                self.period_values.setdefault(period_key, []).append(val)
+                self.queue_periods.setdefault(queue_key, OrderedDict())[period_key] = epoch
+                self.pending_rows += 1
+                is_flush = self.pending_rows >= self.batch_size
+            finally:
+                self.lock.release()
 
-                self.lock.acquire()
-                self.conn.lpush(period_key, val)
-                self.conn.zadd(queue_key, epoch, period_key)
+        if is_flush:
+            self.flush()
+
+        return True
+
+    def flush(self):
+        """
+        Write all the buffered rows in a single pipeline
+        """
+        self.send_lock.acquire()
+        try:
+            self.lock.acquire()
+            try:
+                if self.pending_rows == 0:
+                    return
+
+                pending_rows = self.pending_rows
+                snapshot_values = self.snapshot_values
+                messages = self.messages
+                period_values = self.period_values
+                queue_periods = self.queue_periods
+                snapshot_hashes = self.snapshot_hashes
+                self.pending_rows = 0
+                self.snapshot_values = OrderedDict()
+                self.messages = []
+                self.period_values = OrderedDict()
+                self.queue_periods = OrderedDict()
+                self.snapshot_hashes = OrderedDict()
+            finally:
                 self.lock.release()
+
+            pipeline = self.conn.pipeline(transaction=False)
+            if len(snapshot_values) > 0:
+                pipeline.mset(snapshot_values)
+
+            for key, mapping in snapshot_hashes.items():
+                pipeline.hmset(key, mapping)
+
+            for message in messages:
+                pipeline.publish(self.get_snapshot_channel(), message)
+
+            for period_key, vals in period_values.items():
+                pipeline.lpush(period_key, *vals)
+
+            for queue_key, periods in queue_periods.items():
+                args = []
+                for period_key, epoch in periods.items():
+                    args += [epoch, period_key]
+                pipeline.zadd(queue_key, *args)
+
+            try:
+                pipeline.execute()
+            except Exception as e:
+                Logger.error(self.__class__.__name__, "Error in writing %d rows to Redis.\n%s" % (pending_rows, e))
+        finally:
+            self.send_lock.release()
+
+    def close(self):
+        """
+        Flush the buffered rows and stop the flush thread
+        """
+        self.flush_event.set()
+        self.flush()
         return True
 
     def select(self, table, columns=['*'], condition='', orderby='', limit=0, isFetchAll=True):
@@ -165,4 +351,92 @@ class RedisClient(DatabaseClient):
         :param table: Table name
         :param condition: Where condition
         """
-        return True
\ No newline at end of file
+        return True
+
+
+class RedisSnapshotReader(object):
+    """
+    Reader of the snapshots written by RedisClient
+
+    The snapshots are returned as dictionaries of Snapshot.columns(), with
+    the prices and volumes in float, the timestamps in microseconds and the
+    update type in int.
+    """
+    def __init__(self, conn, layout=RedisClient.SnapshotLayout.KEYS):
+        """
+        Constructor
+        :param conn: Redis connection
+        :param layout: Snapshot layout of the writer, RedisClient.SnapshotLayout
+        """
+        RedisClient.get_snapshot_key(layout, '', '')
+        self.conn = conn
+        self.layout = layout
+
+    @classmethod
+    def convert_values(cls, values):
+        """
+        Convert the values read from Redis or JSON
+        :param values: Value array in the order of Snapshot.columns()
+        :return: Snapshot dictionary, or None if any value is missing
+        """
+        if any(v is None for v in values):
+            return None
+
+        values = [v.decode('utf-8') if isinstance(v, bytes) else v for v in values]
+        return dict(zip(Snapshot.columns(),
+                        [str(values[0]), str(values[1])] +
+                        [float(v) for v in values[2:24]] +
+                        [v if isinstance(v, int) else Timestamp.parse(v) for v in values[24:26]] +
+                        [int(values[26])]))
+
+    @classmethod
+    def decode_message(cls, data):
+        """
+        Decode a published snapshot, either in JSON or packed bytes
+        :param data: Message data
+        :return: Snapshot dictionary
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+
+        if data[:1] == b'{':
+            ret = json.loads(data.decode('utf-8'))
+            return cls.convert_values([ret.get(column) for column in Snapshot.columns()])
+        else:
+            return dict(zip(Snapshot.columns(), Snapshot.unpack(data)))
+
+    def get(self, exchange, instmt):
+        """
+        Get the latest snapshot of the instrument by a single command
+        :param exchange: Exchange name
+        :param instmt: Instrument name
+        :return: Snapshot dictionary, or None if the instrument is not found
+        """
+        if self.layout == RedisClient.SnapshotLayout.KEYS:
+            return self.convert_values(self.conn.mget([RedisClient.get_snapshot_key(self.layout, exchange, instmt, c)
+                                                       for c in Snapshot.columns()]))
+        elif self.layout == RedisClient.SnapshotLayout.HASH:
+            ret = self.conn.hgetall(RedisClient.get_snapshot_key(self.layout, exchange, instmt))
+            ret = dict((k.decode('utf-8') if isinstance(k, bytes) else k, v) for k, v in ret.items())
+            if len(ret) == 0:
+                return None
+            elif int(ret['version']) != RedisClient.SNAPSHOT_HASH_VERSION:
+                raise Exception("Unsupported snapshot hash version (%s)" % ret['version'])
+            return self.convert_values([ret.get(column) for column in Snapshot.columns()])
+        else:
+            data = self.conn.get(RedisClient.get_snapshot_key(self.layout, exchange, instmt))
+            return dict(zip(Snapshot.columns(), Snapshot.unpack(data))) if data is not None else None
+
+    def listen(self):
+        """
+        Subscribe the published snapshots
+        :return: Generator of the snapshot dictionaries
+        """
+        pubsub = self.conn.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(RedisClient.get_snapshot_channel())
+        try:
+            for message in pubsub.listen():
+                if message['type'] == 'message':
+                    yield self.decode_message(message['data'])
+        finally:
+            pubsub.close()
@@ -0,0 +1,232 @@
+from befh.clients.redis import RedisClient
+from befh.market_data import Snapshot
+from befh.util import Logger, Timestamp
+import redis
+
+
+class RedisStreamClient(RedisClient):
+    """
+    Redis Streams client.
+
+    The trades and the order book updates of each instrument are appended
+    to the capped streams "befh_xt_<exchange>_<instrument>" and
+    "befh_xq_<exchange>_<instrument>". Downstream applications consume them
+    in consumer groups, see RedisStreamReader.
+    """
+    # Columns of the quote entries, from the exchange snapshot
+    QUOTES_COLUMNS = ['b1', 'b2', 'b3', 'b4', 'b5',
+                      'a1', 'a2', 'a3', 'a4', 'a5',
+                      'bq1', 'bq2', 'bq3', 'bq4', 'bq5',
+                      'aq1', 'aq2', 'aq3', 'aq4', 'aq5']
+
+    @classmethod
+    def get_trades_stream(cls, exchange, instmt):
+        """
+        Get the trades stream key of the instrument
+        :param exchange: Exchange name
+        :param instmt: Instrument name
+        :return: Stream key
+        """
+        return "%sxt_%s_%s" % (cls._REDIS_KEY_PREFIX, exchange.lower(), instmt.lower())
+
+    @classmethod
+    def get_quotes_stream(cls, exchange, instmt):
+        """
+        Get the quotes stream key of the instrument
+        :param exchange: Exchange name
+        :param instmt: Instrument name
+        :return: Stream key
+        """
+        return "%sxq_%s_%s" % (cls._REDIS_KEY_PREFIX, exchange.lower(), instmt.lower())
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        RedisClient.__init__(self)
+        # Approximate maximum length of each stream
+        self.max_length = 100000
+        # Buffered entries, (stream key, fields)
+        self.entries = []
+
+    def set_max_length(self, max_length):
+        """
+        Set the approximate maximum length of each stream. The oldest
+        entries are trimmed by "MAXLEN ~".
+        :param max_length: Maximum number of entries
+        """
+        self.max_length = max_length
+
+    def insert(self, table, columns, types, values, primary_key_index=(), is_orreplace=False, is_commit=True):
+        """
+        Append the trades and the order book updates to the streams. A row of
+        an instrument trades table is appended to the trades stream, and an
+        order book update of the exchange snapshot table to the quotes
+        stream. The other tables are not written.
+        :param table: Table name
+        :param columns: Column array
+        :param types: Type array
+        :param values: Value array
+        :param primary_key_index: An array of indices of primary keys in columns,
+                          e.g. [0] means the first column is the primary key
+        :param is_orreplace: Indicate if the query is "INSERT OR REPLACE"
+        """
+        ret = dict(zip(columns, values))
+        if table == RedisStreamClient._EXCHANGES_SNAPSHOT_TABLE_NAME:
+            if ret['update_type'] != Snapshot.UpdateType.ORDER_BOOK:
+                return True
+
+            date_time = ret['order_date_time']
+            key = self.get_quotes_stream(ret['exchange'], ret['instmt'])
+            fields = [('date_time', date_time if isinstance(date_time, int) else Timestamp.parse(date_time))] + \
+                     [(column, ret[column]) for column in RedisStreamClient.QUOTES_COLUMNS]
+        else:
+            trades_table_match = RedisStreamClient._TRADES_TABLE_PREFIX.match(table)
+            if not trades_table_match:
+                return True
+
+            key = self.get_trades_stream(trades_table_match.group(1), trades_table_match.group(2))
+            fields = [(column, Timestamp.parse(value) if column == 'date_time' and not isinstance(value, int) else value)
+                      for column, value in zip(columns, values)]
+
+        self.lock.acquire()
+        try:
+            self.entries.append((key, fields))
+            is_flush = len(self.entries) >= self.batch_size
+        finally:
+            self.lock.release()
+
+        if is_flush:
+            self.flush()
+
+        return True
+
+    def flush(self):
+        """
+        Append all the buffered entries in a single pipeline
+        """
+        self.send_lock.acquire()
+        try:
+            self.lock.acquire()
+            try:
+                entries = self.entries
+                self.entries = []
+            finally:
+                self.lock.release()
+
+            if len(entries) == 0:
+                return
+
+            pipeline = self.conn.pipeline(transaction=False)
+            for key, fields in entries:
+                args = []
+                for field, value in fields:
+                    args += [field, value]
+                pipeline.execute_command('XADD', key, 'MAXLEN', '~', self.max_length, '*', *args)
+
+            try:
+                pipeline.execute()
+            except Exception as e:
+                Logger.error(self.__class__.__name__, "Error in appending %d entries to Redis streams.\n%s" %
+                             (len(entries), e))
+        finally:
+            self.send_lock.release()
+
+
+class RedisStreamReader(object):
+    """
+    Consumer of the streams written by RedisStreamClient
+
+    The consumers of the same group share the entries of the streams, and
+    each group receives all the entries. The entries are pending in the
+    group until they are acknowledged.
+    """
+    def __init__(self, conn, group, consumer, streams, count=100, block=1000):
+        """
+        Constructor
+        :param conn: Redis connection
+        :param group: Consumer group name
+        :param consumer: Consumer name in the group
+        :param streams: Stream keys, e.g. RedisStreamClient.get_trades_stream
+        :param count: Maximum number of entries read from each stream at a time
+        :param block: Maximum milliseconds to wait for the entries
+        """
+        self.conn = conn
+        self.group = group
+        self.consumer = consumer
+        self.streams = list(streams)
+        self.count = count
+        self.block = block
+
+    @classmethod
+    def decode(cls, value):
+        """
+        Decode the bytes returned by Redis
+        """
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    @classmethod
+    def parse_entries(cls, response):
+        """
+        Parse the response of XREADGROUP
+        :param response: Either the raw reply, or the reply parsed by redis-py
+        :return: List of (stream key, entry id, fields dictionary). The fields
+                 are None if the pending entry has been trimmed.
+        """
+        if response is None:
+            return []
+        elif isinstance(response, dict):
+            response = response.items()
+
+        ret = []
+        for stream, entries in response:
+            for entry_id, fields in entries:
+                if fields is not None and not isinstance(fields, dict):
+                    fields = dict(zip(fields[0::2], fields[1::2]))
+
+                if fields is not None:
+                    fields = dict((cls.decode(k), cls.decode(v)) for k, v in fields.items())
+
+                ret.append((cls.decode(stream), cls.decode(entry_id), fields))
+
+        return ret
+
+    def create_group(self, start_id='$'):
+        """
+        Create the consumer group on the streams, if not created
+        :param start_id: Id after which the entries are consumed. "$" for the
+                         new entries only, and "0" for all the entries.
+        """
+        for stream in self.streams:
+            try:
+                self.conn.execute_command('XGROUP', 'CREATE', stream, self.group, start_id, 'MKSTREAM')
+            except redis.exceptions.ResponseError as e:
+                if not str(e).startswith('BUSYGROUP'):
+                    raise
+
+    def read(self, is_pending=False):
+        """
+        Read the entries of the streams. The call blocks until any entry is
+        available or the block timeout has elapsed.
+        :param is_pending: Read the entries delivered to this consumer but not
+                           yet acknowledged, e.g. after a restart
+        :return: List of (stream key, entry id, fields dictionary)
+        """
+        ids = ['0' if is_pending else '>'] * len(self.streams)
+        args = ['GROUP', self.group, self.consumer, 'COUNT', self.count]
+        if not is_pending:
+            args += ['BLOCK', self.block]
+
+        return self.parse_entries(self.conn.execute_command('XREADGROUP', *(args + ['STREAMS'] + self.streams + ids)))
+
+    def ack(self, stream, entry_ids):
+        """
+        Acknowledge the processed entries
+        :param stream: Stream key
+        :param entry_ids: Entry ids
+        :return: Number of acknowledged entries
+        """
+        if len(entry_ids) == 0:
+            return 0
+
+        return self.conn.execute_command('XACK', stream, self.group, *entry_ids)
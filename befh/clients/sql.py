@@ -1,16 +1,27 @@
 from befh.clients.database import DatabaseClient
 from befh.util import Logger
 import threading
+import atexit
 
 
 class SqlClient(DatabaseClient):
     """
     Sql client
     """
+    # Maximum number of rows in a single batch execution
+    max_rows_per_statement = 500
+
     @classmethod
     def replace_keyword(cls):
         return 'replace into'
 
+    @classmethod
+    def placeholder(cls):
+        """
+        Parameter placeholder of the database driver
+        """
+        return '%s'
+
     def __init__(self):
         """
         Constructor
@@ -19,11 +30,61 @@ class SqlClient(DatabaseClient):
         self.conn = None
         self.cursor = None
         self.lock = threading.Lock()
+        # Batch insert. Rows are inserted one by one if the batch size is 1.
+        self.batch_size = 1
+        self.flush_interval = 0
+        # (table, columns, primary key index, is_orreplace) -> buffered rows
+        self.buffers = dict()
+        self.flush_event = threading.Event()
+        self.flush_thread = None
+        # (table, columns, is_orreplace) -> parameterised insert statement
+        self.insert_statements = dict()
+
+    def set_batch_insert(self, batch_size, flush_interval=1000):
+        """
+        Buffer the inserted rows and insert them in batches. The rows of a table
+        are flushed by batch executions of the insert statement, each with a single commit, either
+        when the table has buffered the batch size of rows, or when the flush
+        interval has elapsed. The insertion that fills up a batch flushes it
+        before returning, so the buffer is bounded and the producers are held
+        back if the database cannot catch up.
+        :param batch_size: Number of rows buffered per table
+        :param flush_interval: Maximum milliseconds that a row is buffered
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        if self.batch_size > 1 and self.flush_interval > 0 and self.flush_thread is None:
+            self.flush_thread = threading.Thread(target=self.run_flush)
+            self.flush_thread.daemon = True
+            self.flush_thread.start()
+            atexit.register(self.flush)
+
+    def run_flush(self):
+        """
+        Flush the buffered rows periodically
+        """
+        while not self.flush_event.wait(self.flush_interval / 1000.0):
+            self.flush()
 
-    def execute(self, sql):
+    def rollback(self):
+        """
+        Rollback
+        """
+        return True
+
+    def execute(self, sql, params=None):
         """
         Execute the sql command
         :param sql: SQL command
+        :param params: Parameter values of the placeholders
+        """
+        return True
+
+    def executemany(self, sql, rows):
+        """
+        Execute the parameterised sql command for each row
+        :param sql: SQL command
+        :param rows: Array of parameter value arrays
         """
         return True
 
@@ -98,33 +159,145 @@ class SqlClient(DatabaseClient):
         if len(columns) != len(values):
             return False
 
-        column_names = ','.join(columns)
-        value_string = ','.join([SqlClient.convert_str(e) for e in values])
-        if is_orreplace:
-            sql = "%s %s (%s) values (%s)" % (self.replace_keyword(), table, column_names, value_string)
-        else:
-            sql = "insert into %s (%s) values (%s)" % (table, column_names, value_string)
+        values = self.format_date_time(columns, values)
+
+        if self.batch_size > 1:
+            key = (table, tuple(columns), tuple(primary_key_index), is_orreplace)
+            self.lock.acquire()
+            try:
+                rows = self.buffers.setdefault(key, [])
+                rows.append(values)
+                if len(rows) >= self.batch_size:
+                    self.flush_rows(key)
+            finally:
+                self.lock.release()
+            return True
 
+        sql = self.get_insert_statement(table, columns, is_orreplace)
         self.lock.acquire()
         try:
-            self.execute(sql)
+            self.execute(sql, values)
             if is_commit:
                 self.commit()
         except Exception as e:
-            Logger.info(self.__class__.__name__, "SQL error: %s\nSQL: %s" % (e, sql))
+            Logger.info(self.__class__.__name__, "SQL error: %s\nSQL: %s\nValues: %s" % (e, sql, values))
         self.lock.release()
         return True
 
-    def select(self, table, columns=['*'], condition='', orderby='', limit=0, isFetchAll=True):
+    def get_insert_statement(self, table, columns, is_orreplace):
         """
-        Select rows from the table
+        Get the cached parameterised insert statement
+        :param table: Table name
+        :param columns: Column array
+        :param is_orreplace: Indicate if the query is "INSERT OR REPLACE"
+        :return SQL statement
+        """
+        key = (table, tuple(columns), is_orreplace)
+        sql = self.insert_statements.get(key)
+        if sql is None:
+            sql = self.insert_statement(table, columns, is_orreplace)
+            self.insert_statements[key] = sql
+
+        return sql
+
+    def insert_statement(self, table, columns, is_orreplace):
+        """
+        Parameterised insert statement
+        :param table: Table name
+        :param columns: Column array
+        :param is_orreplace: Indicate if the query is "INSERT OR REPLACE"
+        :return SQL statement
+        """
+        column_names = ','.join(columns)
+        value_string = ','.join([self.placeholder()] * len(columns))
+        if is_orreplace:
+            return "%s %s (%s) values (%s)" % (self.replace_keyword(), table, column_names, value_string)
+        else:
+            return "insert into %s (%s) values (%s)" % (table, column_names, value_string)
+
+    @classmethod
+    def unique_rows(cls, rows, primary_key_index, is_orreplace):
+        """
+        Keep only the last row of the same primary key if the rows replace
+        each other
+        :param rows: Array of value arrays
+        :param primary_key_index: An array of indices of primary keys in columns
+        :param is_orreplace: Indicate if the query is "INSERT OR REPLACE"
+        :return Array of value arrays
+        """
+        if not is_orreplace or len(primary_key_index) == 0:
+            return rows
+
+        latest = dict()
+        for values in rows:
+            latest[tuple([values[i] for i in primary_key_index])] = values
+        return list(latest.values())
+
+    def insert_rows(self, table, columns, rows, is_orreplace):
+        """
+        Insert a batch of rows without commit
+        :param table: Table name
+        :param columns: Column array
+        :param rows: Array of value arrays
+        :param is_orreplace: Indicate if the query is "INSERT OR REPLACE"
+        """
+        self.executemany(self.get_insert_statement(table, columns, is_orreplace), rows)
+
+    def flush_rows(self, key):
+        """
+        Insert and commit the buffered rows of a table. The lock must be acquired
+        by the caller.
+        :param key: Buffer key
+        """
+        table, columns, primary_key_index, is_orreplace = key
+        rows = self.unique_rows(self.buffers.pop(key, []), primary_key_index, is_orreplace)
+        sql = self.get_insert_statement(table, columns, is_orreplace)
+        for i in range(0, len(rows), self.max_rows_per_statement):
+            batch = rows[i:i+self.max_rows_per_statement]
+            try:
+                self.insert_rows(table, columns, batch, is_orreplace)
+                self.commit()
+            except Exception as e:
+                # Retry row by row so that only the failed rows are dropped
+                Logger.info(self.__class__.__name__, "SQL error: %s\nSQL: %s" % (e, sql))
+                self.rollback()
+                for values in batch:
+                    try:
+                        self.execute(sql, values)
+                        self.commit()
+                    except Exception as e:
+                        Logger.info(self.__class__.__name__, "SQL error: %s\nSQL: %s\nValues: %s" % (e, sql, values))
+                        self.rollback()
+
+    def flush(self):
+        """
+        Insert and commit all the buffered rows
+        """
+        self.lock.acquire()
+        try:
+            for key in list(self.buffers.keys()):
+                self.flush_rows(key)
+        finally:
+            self.lock.release()
+
+    def close(self):
+        """
+        Flush the buffered rows and stop the flush thread
+        """
+        self.flush_event.set()
+        self.flush()
+        return True
+
+    @classmethod
+    def select_statement(cls, table, columns=['*'], condition='', orderby='', limit=0):
+        """
+        Select statement
         :param table: Table name
         :param columns: Selected columns
         :param condition: Where condition
         :param orderby: Order by condition
         :param limit: Rows limit
-        :param isFetchAll: Indicator of fetching all
-        :return Result rows
+        :return SQL statement
         """
         sql = "select %s from %s" % (','.join(columns), table)
         if len(condition) > 0:
@@ -136,6 +309,21 @@ class SqlClient(DatabaseClient):
         if limit > 0:
             sql += " limit %d" % limit
 
+        return sql
+
+    def select(self, table, columns=['*'], condition='', orderby='', limit=0, isFetchAll=True):
+        """
+        Select rows from the table
+        :param table: Table name
+        :param columns: Selected columns
+        :param condition: Where condition
+        :param orderby: Order by condition
+        :param limit: Rows limit
+        :param isFetchAll: Indicator of fetching all
+        :return Result rows
+        """
+        sql = self.select_statement(table, columns, condition, orderby, limit)
+        self.flush()
         self.lock.acquire()
         self.execute(sql)
         if isFetchAll:
@@ -157,6 +345,7 @@ class SqlClient(DatabaseClient):
         if len(condition) > 0:
             sql += " where %s" % condition
 
+        self.flush()
         self.lock.acquire()
         self.execute(sql)
         self.commit()
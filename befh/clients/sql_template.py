@@ -20,12 +20,22 @@ class SqlClientTemplate(SqlClient):
         """
         return True
 
-    def execute(self, sql):
+    def execute(self, sql, params=None):
         """
         Execute the sql command
         :param sql: SQL command
+        :param params: Parameter values of the placeholders
         """
-        Logger.info(self.__class__.__name__, "Execute command = %s" % sql)
+        Logger.info(self.__class__.__name__, "Execute command = %s\nParameters = %s" % (sql, params))
+
+    def executemany(self, sql, rows):
+        """
+        Execute the parameterised sql command for each row
+        :param sql: SQL command
+        :param rows: Array of parameter value arrays
+        """
+        for params in rows:
+            self.execute(sql, params)
 
     def commit(self):
         """
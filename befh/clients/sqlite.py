@@ -1,22 +1,48 @@
 #!/bin/python
 
 from befh.clients.sql import SqlClient
+from befh.util import Logger
+from collections import deque
+from queue import Queue
+from urllib.request import pathname2url
 import sqlite3
+import threading
+import atexit
+import time
+import os
 
 
 class SqliteClient(SqlClient):
     """
     Sqlite client
     """
+    # Pragmas of the writer mode
+    writer_pragmas = ['journal_mode=WAL',
+                      'synchronous=NORMAL',
+                      'cache_size=-65536',
+                      'temp_store=MEMORY']
+
     @classmethod
     def replace_keyword(cls):
         return 'insert or replace into'
 
+    @classmethod
+    def placeholder(cls):
+        return '?'
+
     def __init__(self):
         """
         Constructor
         """
         SqlClient.__init__(self)
+        self.path = None
+        # Writer mode
+        self.writer_thread = None
+        self.writer_event = threading.Event()
+        self.queue = deque()
+        self.queue_size = 0
+        self.transaction_size = 0
+        self.read_connections = None
 
     def connect(self, **kwargs):
         """
@@ -24,16 +50,29 @@ class SqliteClient(SqlClient):
         :param path: sqlite file to connect
         """
         path = kwargs['path']
+        self.path = path
         self.conn = sqlite3.connect(path, check_same_thread=False)
         self.cursor = self.conn.cursor()
         return self.conn is not None and self.cursor is not None
 
-    def execute(self, sql):
+    def execute(self, sql, params=None):
         """
         Execute the sql command
         :param sql: SQL command
+        :param params: Parameter values of the placeholders
         """
-        return self.cursor.execute(sql)
+        if params is None:
+            return self.cursor.execute(sql)
+        else:
+            return self.cursor.execute(sql, params)
+
+    def executemany(self, sql, rows):
+        """
+        Execute the parameterised sql command for each row
+        :param sql: SQL command
+        :param rows: Array of parameter value arrays
+        """
+        return self.cursor.executemany(sql, rows)
 
     def commit(self):
         """
@@ -41,6 +80,12 @@ class SqliteClient(SqlClient):
         """
         self.conn.commit()
 
+    def rollback(self):
+        """
+        Rollback
+        """
+        self.conn.rollback()
+
     def fetchone(self):
         """
         Fetch one record
@@ -55,3 +100,159 @@ class SqliteClient(SqlClient):
         """
         return self.cursor.fetchall()
 
+
+    def set_writer_mode(self, transaction_size=10000, flush_interval=1000, queue_size=100000, read_connections=4):
+        """
+        High throughput profile. The database is switched to WAL with relaxed
+        synchronous and a larger page cache. Inserting threads only append the
+        rows to a queue, and a single writer thread inserts them in
+        transactions of many rows. Selects go through a pool of read-only
+        connections, which do not block the writer in WAL.
+        :param transaction_size: Maximum number of rows in a transaction
+        :param flush_interval: Maximum milliseconds that a row is queued
+        :param queue_size: Maximum number of queued rows before the inserting
+                           threads are held back
+        :param read_connections: Number of read-only connections
+        """
+        if self.writer_thread is not None:
+            return
+
+        self.lock.acquire()
+        try:
+            for pragma in self.writer_pragmas:
+                self.execute("pragma %s" % pragma)
+        finally:
+            self.lock.release()
+
+        self.transaction_size = transaction_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+
+        if self.path != ':memory:' and read_connections > 0:
+            self.read_connections = Queue()
+            uri = 'file:%s?mode=ro' % pathname2url(os.path.abspath(self.path))
+            for i in range(0, read_connections):
+                self.read_connections.put(sqlite3.connect(uri, uri=True, check_same_thread=False))
+
+        self.writer_thread = threading.Thread(target=self.run_writer)
+        self.writer_thread.daemon = True
+        self.writer_thread.start()
+        atexit.register(self.flush)
+
+    def run_writer(self):
+        """
+        Write the queued rows until the client is closed
+        """
+        while not self.flush_event.is_set():
+            self.writer_event.wait(self.flush_interval / 1000.0)
+            self.writer_event.clear()
+            self.write_queue()
+
+    def write_queue(self):
+        """
+        Insert all the queued rows, each transaction with up to the
+        transaction size of rows
+        """
+        self.lock.acquire()
+        try:
+            while len(self.queue) > 0:
+                try:
+                    for i in range(0, self.transaction_size):
+                        key, values = self.queue.popleft()
+                        self.buffers.setdefault(key, []).append(values)
+                except IndexError:
+                    pass
+
+                try:
+                    for key, rows in self.buffers.items():
+                        table, columns, primary_key_index, is_orreplace = key
+                        self.insert_rows(table, columns,
+                                         self.unique_rows(rows, primary_key_index, is_orreplace),
+                                         is_orreplace)
+                    self.commit()
+                    self.buffers = dict()
+                except Exception as e:
+                    # Insert table by table and retry the failed rows one by one
+                    Logger.info(self.__class__.__name__, "SQL error in writer transaction: %s" % e)
+                    self.rollback()
+                    for key in list(self.buffers.keys()):
+                        self.flush_rows(key)
+        finally:
+            self.lock.release()
+
+    def insert(self, table, columns, types, values, primary_key_index=(), is_orreplace=False, is_commit=True):
+        """
+        Insert into the table
+        :param table: Table name
+        :param columns: Column array
+        :param types: Type array
+        :param values: Value array
+        :param primary_key_index: An array of indices of primary keys in columns,
+                          e.g. [0] means the first column is the primary key
+        :param is_orreplace: Indicate if the query is "INSERT OR REPLACE"
+        """
+        if self.writer_thread is None:
+            return SqlClient.insert(self, table, columns, types, values, primary_key_index, is_orreplace, is_commit)
+
+        if len(columns) != len(values):
+            return False
+
+        # Hold back the inserting thread if the writer cannot catch up
+        while len(self.queue) >= self.queue_size and self.writer_thread.is_alive():
+            self.writer_event.set()
+            time.sleep(0.001)
+
+        self.queue.append(((table, tuple(columns), tuple(primary_key_index), is_orreplace),
+                           self.format_date_time(columns, values)))
+        if len(self.queue) >= self.transaction_size:
+            self.writer_event.set()
+
+        return True
+
+    def flush(self):
+        """
+        Insert and commit all the queued and buffered rows
+        """
+        if self.writer_thread is not None:
+            self.write_queue()
+
+        SqlClient.flush(self)
+
+    def select(self, table, columns=['*'], condition='', orderby='', limit=0, isFetchAll=True):
+        """
+        Select rows from the table
+        :param table: Table name
+        :param columns: Selected columns
+        :param condition: Where condition
+        :param orderby: Order by condition
+        :param limit: Rows limit
+        :param isFetchAll: Indicator of fetching all
+        :return Result rows
+        """
+        if self.read_connections is None:
+            return SqlClient.select(self, table, columns, condition, orderby, limit, isFetchAll)
+
+        sql = self.select_statement(table, columns, condition, orderby, limit)
+        self.flush()
+        conn = self.read_connections.get()
+        try:
+            cursor = conn.execute(sql)
+            if isFetchAll:
+                return cursor.fetchall()
+            else:
+                return cursor.fetchone()
+        finally:
+            self.read_connections.put(conn)
+
+    def close(self):
+        """
+        Stop the writer thread and insert the remaining rows
+        """
+        SqlClient.close(self)
+        self.writer_event.set()
+        if self.read_connections is not None:
+            while not self.read_connections.empty():
+                self.read_connections.get().close()
+            self.read_connections = None
+
+        return True
@@ -0,0 +1,538 @@
+from befh.clients.csv import FileClient
+from befh.clients.database import DatabaseClient
+from befh.util import Logger, Timestamp
+import numpy as np
+import threading
+import atexit
+import struct
+import mmap
+import zlib
+import os
+
+
+class TickStoreClient(DatabaseClient):
+    """
+    Columnar tick store client.
+
+    Each table is an append-only binary file of compressed column blocks. The
+    integer and decimal columns are stored as fixed-width little endian arrays,
+    the date time columns as integer microseconds since epoch, and the string
+    columns are dictionary encoded in each block. The footer indexes the blocks
+    by the time range of their rows, so that the selection of a time range only
+    decompresses the overlapping blocks of the memory mapped file.
+
+    File layout:
+        Header - magic, version, number of columns, (type, name) of each column
+        Blocks - block header (magic, compressed length, number of rows, minimum
+                 and maximum time), zlib compressed column data
+        Footer - (offset, compressed length, number of rows, minimum and maximum
+                 time) of each block, trailer (footer offset, number of blocks, magic)
+    """
+    class ColumnType:
+        INT = 0
+        FLOAT = 1
+        STRING = 2
+
+    class Table:
+        """
+        Opened table file
+        """
+        def __init__(self, path, columns, column_types, file, footer_offset, index):
+            self.path = path
+            self.columns = columns
+            self.column_types = column_types
+            self.time_column_index = TickStoreClient.get_time_column_index(columns)
+            self.file = file
+            self.footer_offset = footer_offset
+            self.index = index
+            self.rows = []
+
+    FILE_EXTENSION = '.tick'
+    FILE_MAGIC = b'BEFHTICK'
+    BLOCK_MAGIC = b'BLCK'
+    FOOTER_MAGIC = b'BEFHFOOT'
+    VERSION = 1
+    HEADER = struct.Struct('<8sHH')
+    COLUMN = struct.Struct('<BH')
+    BLOCK = struct.Struct('<4sIIqq')
+    INDEX = struct.Struct('<QIIqq')
+    TRAILER = struct.Struct('<QI8s')
+    DICTIONARY = struct.Struct('<IB')
+    DTYPES = {ColumnType.INT: np.dtype('<i8'), ColumnType.FLOAT: np.dtype('<f8')}
+
+    def __init__(self, dir=os.getcwd(), block_size=10000, flush_interval=60, compress_level=6):
+        """
+        Constructor
+        :param dir: Directory of the table files
+        :param block_size: Maximum number of rows in a block
+        :param flush_interval: Maximum seconds that a row is buffered before written
+                               in a block. Rows are only written in full blocks if it is zero.
+        :param compress_level: Zlib compression level
+        """
+        DatabaseClient.__init__(self)
+        if dir is None or dir == '':
+            raise Exception("TickStoreClient does not accept empty directory.")
+
+        self.file_directory = dir
+        self.block_size = block_size
+        self.flush_interval = flush_interval
+        self.compress_level = compress_level
+        self.lock = threading.Lock()
+        self.tables = dict()
+        self.flush_event = threading.Event()
+        self.flush_thread = None
+        if self.flush_interval > 0:
+            self.flush_thread = threading.Thread(target=self.run_flush)
+            self.flush_thread.daemon = True
+            self.flush_thread.start()
+        atexit.register(self.close)
+
+    @classmethod
+    def get_column_type(cls, column, type):
+        """
+        Get the storage type of the column
+        :param column: Column name
+        :param type: Column type in the table definition
+        :return: TickStoreClient.ColumnType
+        """
+        type = type.lower()
+        if column.find('date_time') > -1 or type.startswith('int') or type.startswith('bigint'):
+            return TickStoreClient.ColumnType.INT
+        elif type.startswith('decimal') or type.startswith('float') or \
+             type.startswith('double') or type.startswith('real'):
+            return TickStoreClient.ColumnType.FLOAT
+        else:
+            return TickStoreClient.ColumnType.STRING
+
+    @classmethod
+    def get_time_column_index(cls, columns):
+        """
+        Get the index of the column which the blocks are indexed by
+        :param columns: Column array
+        :return: Index of the "date_time" column, or the first date time column.
+                 None if there is no date time column.
+        """
+        if 'date_time' in columns:
+            return columns.index('date_time')
+
+        for i in range(0, len(columns)):
+            if columns[i].find('date_time') > -1:
+                return i
+
+        return None
+
+    def get_file_path(self, table):
+        return os.path.join(self.file_directory, table + self.FILE_EXTENSION)
+
+    def run_flush(self):
+        """
+        Write the buffered rows periodically
+        """
+        while not self.flush_event.wait(self.flush_interval):
+            self.flush()
+
+    def create(self, table, columns, types, primary_key_index=(), is_ifnotexists=True):
+        """
+        Create table in the database
+        :param table: Table name
+        :param columns: Column array
+        :param types: Type array
+        :param primary_key_index: Not used. Rows are only appended.
+        :param is_ifnotexists: Create table if not exists keyword
+        """
+        columns = [e.split(' ')[0] for e in columns]
+        if len(columns) != len(types):
+            return False
+
+        column_types = [self.get_column_type(c, t) for c, t in zip(columns, types)]
+        file_path = self.get_file_path(table)
+
+        with self.lock:
+            if table in self.tables:
+                return True
+
+            if os.path.isfile(file_path):
+                Logger.info(self.__class__.__name__, "File (%s) has been created already." % file_path)
+                self.tables[table] = self.open_table(file_path)
+                if self.tables[table].columns != columns:
+                    raise Exception("File (%s) has different columns." % file_path)
+            else:
+                header = self.HEADER.pack(self.FILE_MAGIC, self.VERSION, len(columns))
+                for column, column_type in zip(columns, column_types):
+                    name = column.encode('utf-8')
+                    header += self.COLUMN.pack(column_type, len(name)) + name
+
+                file = open(file_path, 'w+b')
+                file.write(header)
+                self.tables[table] = TickStoreClient.Table(file_path, columns, column_types, file, len(header), [])
+                self.write_footer(self.tables[table])
+
+        return True
+
+    def open_table(self, file_path):
+        """
+        Open the existing table file. The index is rebuilt from the block
+        headers if the footer was not written completely.
+        :param file_path: File path
+        :return: TickStoreClient.Table
+        """
+        file = open(file_path, 'r+b')
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, column_count = self.HEADER.unpack_from(data, 0)
+            if magic != self.FILE_MAGIC or version != self.VERSION:
+                raise Exception("File (%s) is not a tick store file of version %d." % (file_path, self.VERSION))
+
+            columns = []
+            column_types = []
+            offset = self.HEADER.size
+            for i in range(0, column_count):
+                column_type, length = self.COLUMN.unpack_from(data, offset)
+                offset += self.COLUMN.size
+                columns.append(data[offset:offset + length].decode('utf-8'))
+                column_types.append(column_type)
+                offset += length
+
+            index = self.read_footer(data, offset)
+            if index is None:
+                Logger.info(self.__class__.__name__, "Footer of file (%s) is not found. Recovering the blocks." %
+                            file_path)
+                index = self.scan_blocks(data, offset)
+        finally:
+            data.close()
+
+        footer_offset = index[-1][0] + self.BLOCK.size + index[-1][1] if len(index) > 0 else offset
+        table = TickStoreClient.Table(file_path, columns, column_types, file, footer_offset, index)
+        self.write_footer(table)
+        return table
+
+    def read_footer(self, data, header_length):
+        """
+        Read the block index from the footer
+        :param data: File content
+        :param header_length: Length of the file header
+        :return: List of (offset, compressed length, number of rows, minimum time, maximum time),
+                 or None if the footer is invalid
+        """
+        if len(data) < header_length + self.TRAILER.size:
+            return None
+
+        footer_offset, block_count, magic = self.TRAILER.unpack_from(data, len(data) - self.TRAILER.size)
+        if magic != self.FOOTER_MAGIC or \
+           footer_offset + block_count * self.INDEX.size + self.TRAILER.size != len(data):
+            return None
+
+        return [self.INDEX.unpack_from(data, footer_offset + i * self.INDEX.size) for i in range(0, block_count)]
+
+    def scan_blocks(self, data, header_length):
+        """
+        Rebuild the block index from the block headers. The incomplete block
+        at the end of the file is discarded.
+        :param data: File content
+        :param header_length: Length of the file header
+        :return: List of (offset, compressed length, number of rows, minimum time, maximum time)
+        """
+        index = []
+        offset = header_length
+        while offset + self.BLOCK.size <= len(data):
+            magic, length, count, min_time, max_time = self.BLOCK.unpack_from(data, offset)
+            if magic != self.BLOCK_MAGIC or offset + self.BLOCK.size + length > len(data):
+                break
+            index.append((offset, length, count, min_time, max_time))
+            offset += self.BLOCK.size + length
+
+        return index
+
+    def write_footer(self, table):
+        """
+        Write the footer after the last block
+        :param table: TickStoreClient.Table
+        """
+        footer = b''.join([self.INDEX.pack(*e) for e in table.index]) + \
+                 self.TRAILER.pack(table.footer_offset, len(table.index), self.FOOTER_MAGIC)
+        table.file.seek(table.footer_offset)
+        table.file.write(footer)
+        table.file.truncate()
+        table.file.flush()
+
+    def encode_column(self, column_type, values):
+        """
+        Encode the values of a column
+        :param column_type: TickStoreClient.ColumnType
+        :param values: Value array
+        :return: Bytes
+        """
+        if column_type == TickStoreClient.ColumnType.STRING:
+            dictionary = dict()
+            codes = [dictionary.setdefault('' if v is None else str(v), len(dictionary)) for v in values]
+            words = [e.encode('utf-8') for e in dictionary]
+            code_size = 1 if len(words) <= 0x100 else 2 if len(words) <= 0x10000 else 4
+            return self.DICTIONARY.pack(len(words), code_size) + \
+                   np.array([len(e) for e in words], dtype='<u4').tobytes() + \
+                   b''.join(words) + \
+                   np.array(codes, dtype='<u%d' % code_size).tobytes()
+        elif column_type == TickStoreClient.ColumnType.INT:
+            return np.array([Timestamp.parse(v) if isinstance(v, str) else 0 if v is None else v for v in values],
+                            dtype=self.DTYPES[column_type]).tobytes()
+        else:
+            return np.array([np.nan if v is None else v for v in values], dtype=self.DTYPES[column_type]).tobytes()
+
+    def decode_column(self, column_type, data, count):
+        """
+        Decode the values of a column
+        :param column_type: TickStoreClient.ColumnType
+        :param data: Bytes of the column
+        :param count: Number of rows
+        :return: Numpy array
+        """
+        if column_type == TickStoreClient.ColumnType.STRING:
+            word_count, code_size = self.DICTIONARY.unpack_from(data, 0)
+            offset = self.DICTIONARY.size
+            lengths = np.frombuffer(data, dtype='<u4', count=word_count, offset=offset).tolist()
+            offset += 4 * word_count
+            dictionary = np.empty(word_count, dtype=object)
+            for i in range(0, word_count):
+                dictionary[i] = data[offset:offset + lengths[i]].decode('utf-8')
+                offset += lengths[i]
+            return dictionary[np.frombuffer(data, dtype='<u%d' % code_size, count=count, offset=offset)]
+        else:
+            return np.frombuffer(data, dtype=self.DTYPES[column_type], count=count)
+
+    def write_block(self, table):
+        """
+        Write the buffered rows of the table in a block. The lock must be
+        acquired by the caller.
+        :param table: TickStoreClient.Table
+        """
+        if len(table.rows) == 0:
+            return
+
+        rows = table.rows
+        table.rows = []
+        data = [self.encode_column(table.column_types[i], [row[i] for row in rows])
+                for i in range(0, len(table.columns))]
+        payload = zlib.compress(np.array([len(e) for e in data], dtype='<u4').tobytes() + b''.join(data),
+                                self.compress_level)
+
+        if table.time_column_index is None:
+            min_time, max_time = 0, 0
+        else:
+            times = np.frombuffer(data[table.time_column_index], dtype='<i8')
+            min_time, max_time = int(times.min()), int(times.max())
+
+        block = (table.footer_offset, len(payload), len(rows), min_time, max_time)
+        table.file.seek(table.footer_offset)
+        table.file.write(self.BLOCK.pack(self.BLOCK_MAGIC, *block[1:]))
+        table.file.write(payload)
+        table.index.append(block)
+        table.footer_offset += self.BLOCK.size + len(payload)
+        self.write_footer(table)
+
+    def get_table(self, table):
+        """
+        Get the opened table. A closed table is opened again. The lock must be
+        acquired by the caller.
+        :param table: Table name
+        :return: TickStoreClient.Table
+        """
+        if table not in self.tables:
+            file_path = self.get_file_path(table)
+            if not os.path.isfile(file_path):
+                raise Exception("File (%s) has not been created." % file_path)
+            self.tables[table] = self.open_table(file_path)
+
+        return self.tables[table]
+
+    def close_table(self, table):
+        """
+        Write the buffered rows and close the file of the table. It is opened
+        again on the next insertion.
+        :param table: Table name
+        """
+        with self.lock:
+            t = self.tables.pop(table, None)
+            if t is not None:
+                self.write_block(t)
+                t.file.close()
+
+    def insert(self, table, columns, types, values, primary_key_index=(), is_orreplace=False, is_commit=True):
+        """
+        Insert into the table
+        :param table: Table name
+        :param columns: Column array
+        :param types: Type array
+        :param values: Value array
+        :param primary_key_index: Not used. Rows are only appended.
+        :param is_orreplace: Not used. Rows are only appended.
+        :param is_commit: Not used. Rows are written in blocks.
+        """
+        if len(columns) != len(values):
+            return False
+
+        with self.lock:
+            t = self.get_table(table)
+            if columns != t.columns:
+                values = [values[columns.index(c)] for c in t.columns]
+
+            t.rows.append(values)
+            if len(t.rows) >= self.block_size:
+                self.write_block(t)
+
+        return True
+
+    def parse_time_range(self, table, condition):
+        """
+        Get the bounds of the time column in the top level conjunction of the
+        condition
+        :param table: TickStoreClient.Table
+        :param condition: FileClient.Condition
+        :return: (Inclusive start time or None, inclusive end time or None,
+                  indicator if the condition is all parsed)
+        """
+        start_time, end_time = None, None
+        if condition.predicate is None:
+            return start_time, end_time, True
+
+        is_parsed = len(condition.bounds) == condition.terms
+        for index, op, value in condition.bounds:
+            if index != table.time_column_index or type(value) is not int or op in ('!=', '<>'):
+                is_parsed = False
+                continue
+
+            if op in ('>', '>='):
+                value = value + 1 if op == '>' else value
+                start_time = value if start_time is None else max(start_time, value)
+            if op in ('<', '<='):
+                value = value - 1 if op == '<' else value
+                end_time = value if end_time is None else min(end_time, value)
+            if op in ('=', '=='):
+                start_time = value if start_time is None else max(start_time, value)
+                end_time = value if end_time is None else min(end_time, value)
+
+        return start_time, end_time, is_parsed
+
+    def select(self, table, columns=['*'], condition='', orderby='', limit=0, isFetchAll=True):
+        """
+        Select rows from the table.
+        The blocks are filtered by the bounds of the time column in the condition,
+        e.g. "date_time >= 1494028800000000 and date_time < 1494115200000000", and
+        the other terms are evaluated on each row.
+        :param table: Table name
+        :param columns: Selected columns
+        :param condition: Where condition
+        :param orderby: Order by condition
+        :param limit: Rows limit
+        :param isFetchAll: Indicator of fetching all
+        :return Result rows
+        """
+        is_all_columns = len(columns) == 1 and columns[0] == '*'
+        columns = [e.split(' ')[0] for e in columns]
+        ret = []
+
+        with self.lock:
+            t = self.get_table(table)
+            self.write_block(t)
+            for col in columns:
+                if not is_all_columns and col not in t.columns:
+                    raise Exception("Field (%s) is not in the table." % col)
+
+            condition = FileClient.Condition(condition, t.columns)
+            start_time, end_time, is_parsed = self.parse_time_range(t, condition)
+
+            if len(t.index) > 0:
+                with open(t.path, 'rb') as file:
+                    data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                    try:
+                        for offset, length, count, min_time, max_time in t.index:
+                            if (start_time is not None and max_time < start_time) or \
+                               (end_time is not None and min_time > end_time):
+                                continue
+
+                            offset += self.BLOCK.size
+                            ret += self.read_block(t, zlib.decompress(data[offset:offset + length]), count,
+                                                   start_time, end_time)
+                    finally:
+                        data.close()
+
+        if not is_parsed:
+            ret = [row for row in ret if condition.predicate(row)]
+
+        if orderby != '':
+            # Sort the result
+            field = orderby.split(' ')[0].strip()
+            asc_val = orderby.split(' ')[1].strip() if len(orderby.split(' ')) > 1 else 'asc'
+            if asc_val != 'asc' and asc_val != 'desc':
+                raise Exception("Incorrect orderby in select statement (%s)." % orderby)
+            elif field not in t.columns:
+                raise Exception("Field (%s) is not in the table." % field)
+
+            field_index = t.columns.index(field)
+            ret = sorted(ret, key=lambda x: x[field_index], reverse=(asc_val == 'desc'))
+
+        if limit > 0:
+            # Trim the result by the limit
+            ret = ret[:limit]
+
+        if not is_all_columns:
+            field_index = [t.columns.index(x) for x in columns]
+            ret = [[row[i] for i in field_index] for row in ret]
+
+        return ret
+
+    def read_block(self, table, payload, count, start_time, end_time):
+        """
+        Decode the rows of a block within the time range
+        :param table: TickStoreClient.Table
+        :param payload: Decompressed block
+        :param count: Number of rows
+        :param start_time: Inclusive start time, or None
+        :param end_time: Inclusive end time, or None
+        :return: Rows
+        """
+        column_count = len(table.columns)
+        lengths = np.frombuffer(payload, dtype='<u4', count=column_count).tolist()
+        offset = 4 * column_count
+        arrays = []
+        for i in range(0, column_count):
+            arrays.append(self.decode_column(table.column_types[i], payload[offset:offset + lengths[i]], count))
+            offset += lengths[i]
+
+        if start_time is not None or end_time is not None:
+            times = arrays[table.time_column_index]
+            mask = np.ones(count, dtype=bool)
+            if start_time is not None:
+                mask &= times >= start_time
+            if end_time is not None:
+                mask &= times <= end_time
+            arrays = [e[mask] for e in arrays]
+
+        return [list(e) for e in zip(*[a.tolist() for a in arrays])]
+
+    def delete(self, table, condition='1==1'):
+        """
+        Delete rows from the table
+        :param table: Table name
+        :param condition: Where condition
+        """
+        raise Exception("Deletion is not supported in tick store client.")
+
+    def flush(self):
+        """
+        Write the buffered rows of all the tables
+        """
+        with self.lock:
+            for table in self.tables.values():
+                self.write_block(table)
+
+    def close(self):
+        """
+        Write the buffered rows and close the files
+        """
+        self.flush_event.set()
+        with self.lock:
+            for table in self.tables.values():
+                self.write_block(table)
+                table.file.close()
+            self.tables.clear()
+
+        return True
@@ -1,6 +1,9 @@
 from befh.clients.database import DatabaseClient
+from befh.market_data import Snapshot
 from befh.util import Logger
+from collections import OrderedDict
 import threading
+import atexit
 import re
 import zmq
 import time
@@ -10,6 +13,30 @@ class ZmqClient(DatabaseClient):
     """
     Zmq Client
     """
+    _EXCHANGES_SNAPSHOT_TABLE_NAME = "exchanges_snapshot"
+
+    class MessageFormat:
+        # A single frame of the JSON row
+        JSON = 'json'
+        # A topic frame and a frame of the values packed by Snapshot.pack
+        PACKED = 'packed'
+
+    # Update type -> topic type
+    TOPIC_TYPES = {Snapshot.UpdateType.NONE: 'snapshot',
+                   Snapshot.UpdateType.ORDER_BOOK: 'quotes',
+                   Snapshot.UpdateType.TRADES: 'trades'}
+
+    @classmethod
+    def get_topic(cls, topic_type, exchange, instmt):
+        """
+        Get the topic of the snapshot, formatted as <type>.<exchange>.<instrument>
+        :param topic_type: Topic type, e.g. "trades" or "quotes"
+        :param exchange: Exchange name
+        :param instmt: Instrument name
+        :return: Topic
+        """
+        return '%s.%s.%s' % (topic_type, exchange, instmt)
+
     def __init__(self):
         """
         Constructor
@@ -18,6 +45,113 @@ class ZmqClient(DatabaseClient):
         self.context = zmq.Context()
         self.conn = self.context.socket(zmq.PUB)
         self.lock = threading.Lock()
+        self.message_format = ZmqClient.MessageFormat.JSON
+        self.stop_event = threading.Event()
+        # Conflation. The order book updates are published at most max_rate
+        # times per second per instrument.
+        self.max_rate = 0
+        self.conflated = OrderedDict()
+        self.conflation_thread = None
+        # Snapshot channel. Topic -> latest payload, i.e. the latest quotes and
+        # the latest trades of each instrument
+        self.snapshot_conn = None
+        self.snapshot_thread = None
+        self.last_values = dict()
+
+    def set_message_format(self, message_format):
+        """
+        Set the message format. In the packed format, each message is sent
+        with a topic frame, so the subscribers can subscribe to a single
+        type or instrument by the topic prefix. Only the exchange snapshots
+        are published in the packed format.
+        :param message_format: ZmqClient.MessageFormat
+        """
+        if message_format not in (ZmqClient.MessageFormat.JSON, ZmqClient.MessageFormat.PACKED):
+            raise Exception("Unknown zmq message format (%s)" % message_format)
+
+        self.message_format = message_format
+        self.is_snapshot_only = message_format == ZmqClient.MessageFormat.PACKED
+
+    def set_conflation(self, max_rate):
+        """
+        Conflate the order book updates. Only the latest update of each
+        instrument is kept, and published at most max_rate times per second,
+        so the slow subscribers are not flooded. The trades are published
+        immediately, and do not affect the pending order book updates, so the
+        subscribers of the quotes topics keep receiving them. Requires the
+        packed message format.
+        :param max_rate: Maximum number of order book updates per second per instrument
+        """
+        if self.message_format != ZmqClient.MessageFormat.PACKED:
+            raise Exception("Zmq conflation requires the packed message format.")
+
+        self.max_rate = max_rate
+        if self.max_rate > 0 and self.conflation_thread is None:
+            self.conflation_thread = threading.Thread(target=self.run_conflation)
+            self.conflation_thread.daemon = True
+            self.conflation_thread.start()
+            atexit.register(self.close)
+
+    def bind_snapshot(self, addr):
+        """
+        Bind the snapshot channel. A ROUTER socket replies the latest quotes
+        and the latest trades of every instrument to the requests, so the
+        late joiners get the full state immediately, see ZmqSubscriber.request_snapshot. Requires the
+        packed message format.
+        :param addr: Snapshot channel address, e.g. "tcp://127.0.0.1:6002"
+        """
+        if self.message_format != ZmqClient.MessageFormat.PACKED:
+            raise Exception("Zmq snapshot channel requires the packed message format.")
+
+        Logger.info(self.__class__.__name__, 'Zmq snapshot channel is binding to %s' % addr)
+        self.snapshot_conn = self.context.socket(zmq.ROUTER)
+        self.snapshot_conn.bind(addr)
+        self.snapshot_thread = threading.Thread(target=self.run_snapshot)
+        self.snapshot_thread.daemon = True
+        self.snapshot_thread.start()
+        atexit.register(self.close)
+
+    def run_conflation(self):
+        """
+        Publish the conflated order book updates periodically
+        """
+        while not self.stop_event.wait(1.0 / self.max_rate):
+            self.lock.acquire()
+            try:
+                conflated = self.conflated
+                self.conflated = OrderedDict()
+                for topic, payload in conflated.items():
+                    self.conn.send_multipart([topic, payload])
+            finally:
+                self.lock.release()
+
+    def run_snapshot(self):
+        """
+        Reply the snapshot requests. The last frame of a request is the
+        topic prefix, and the reply is the number of snapshots followed by
+        the topic and payload frames of each snapshot.
+        """
+        poller = zmq.Poller()
+        poller.register(self.snapshot_conn, zmq.POLLIN)
+        while not self.stop_event.is_set():
+            if len(poller.poll(1000)) == 0:
+                continue
+
+            frames = self.snapshot_conn.recv_multipart()
+            # The envelope includes the identity, and the delimiter from REQ sockets
+            envelope, prefix = frames[:-1], frames[-1]
+            self.lock.acquire()
+            try:
+                last_values = [(t, p) for t, p in self.last_values.items() if t.startswith(prefix)]
+            finally:
+                self.lock.release()
+
+            reply = envelope + [str(len(last_values)).encode('utf-8')]
+            for topic, payload in last_values:
+                reply += [topic, payload]
+            self.snapshot_conn.send_multipart(reply)
+
+        self.snapshot_conn.close()
 
     def connect(self, **kwargs):
         """
@@ -79,7 +213,29 @@ class ZmqClient(DatabaseClient):
                           e.g. [0] means the first column is the primary key
         :param is_orreplace: Indicate if the query is "INSERT OR REPLACE"
         """
-        ret = dict(zip(columns, values))
+        if self.message_format == ZmqClient.MessageFormat.PACKED:
+            # The rows of the instrument tables are not published
+            if table != ZmqClient._EXCHANGES_SNAPSHOT_TABLE_NAME or list(columns) != Snapshot.columns():
+                return True
+
+            topic = self.get_topic(ZmqClient.TOPIC_TYPES[values[-1]], values[0], values[1]).encode('utf-8')
+            payload = Snapshot.pack(values)
+
+            self.lock.acquire()
+            try:
+                if self.snapshot_conn is not None:
+                    self.last_values[topic] = payload
+
+                if self.max_rate > 0 and values[-1] == Snapshot.UpdateType.ORDER_BOOK:
+                    self.conflated[topic] = payload
+                    return True
+
+                self.conn.send_multipart([topic, payload])
+            finally:
+                self.lock.release()
+            return True
+
+        ret = dict(zip(columns, self.format_date_time(columns, values)))
         ret['table'] = table
         self.lock.acquire()
         self.conn.send_json(ret)
@@ -107,6 +263,109 @@ class ZmqClient(DatabaseClient):
         """
         return True
 
+    def close(self):
+        """
+        Stop the conflation and the snapshot channel
+        """
+        self.stop_event.set()
+        for thread in [self.conflation_thread, self.snapshot_thread]:
+            if thread is not None and thread is not threading.current_thread():
+                thread.join(2.0)
+        return True
+
+
+class ZmqSubscriber(object):
+    """
+    Subscriber of the snapshots published by ZmqClient in the packed format
+    """
+    def __init__(self, addr, context=None):
+        """
+        Constructor
+        :param addr: Address of the publisher, e.g. "tcp://127.0.0.1:6001"
+        :param context: Zmq context. A new context is created by default.
+        """
+        self.context = context if context is not None else zmq.Context()
+        self.conn = self.context.socket(zmq.SUB)
+        self.conn.connect(addr)
+        # Subscribed (topic, is_exact). The instrument topics are matched exactly.
+        self.topics = []
+
+    def subscribe(self, topic_type='', exchange='', instmt=''):
+        """
+        Subscribe the topics. The topics are filtered by the publisher.
+        For example, subscribe() receives all the snapshots, subscribe('trades')
+        the trades of all instruments, and subscribe('quotes', 'Bitstamp', 'BTCUSD')
+        the order book updates of a single instrument.
+        :param topic_type: Topic type, e.g. "trades" or "quotes"
+        :param exchange: Exchange name. Requires the topic type.
+        :param instmt: Instrument name. Requires the exchange name.
+        """
+        if instmt:
+            topic = ZmqClient.get_topic(topic_type, exchange, instmt)
+        elif exchange:
+            topic = '%s.%s.' % (topic_type, exchange)
+        elif topic_type:
+            topic = '%s.' % topic_type
+        else:
+            topic = ''
+
+        self.topics.append((topic.encode('utf-8'), len(instmt) > 0))
+        self.conn.setsockopt(zmq.SUBSCRIBE, topic.encode('utf-8'))
+
+    @classmethod
+    def decode(cls, topic, payload):
+        """
+        Decode the message
+        :param topic: Topic frame
+        :param payload: Payload frame
+        :return: (topic, dictionary of the snapshot)
+        """
+        return topic.decode('utf-8'), dict(zip(Snapshot.columns(), Snapshot.unpack(payload)))
+
+    def request_snapshot(self, addr, topic_prefix='', timeout=1000):
+        """
+        Request the latest snapshots from the snapshot channel of the
+        publisher. Subscribe first and then request the snapshots, so no
+        update is missed in between.
+        :param addr: Snapshot channel address, e.g. "tcp://127.0.0.1:6002"
+        :param topic_prefix: Topic prefix of the requested snapshots, e.g. "quotes.Bitstamp."
+        :param timeout: Maximum milliseconds to wait for the reply
+        :return: List of (topic, dictionary of the row)
+        """
+        conn = self.context.socket(zmq.REQ)
+        conn.setsockopt(zmq.LINGER, 0)
+        conn.setsockopt(zmq.RCVTIMEO, timeout)
+        conn.connect(addr)
+        try:
+            conn.send(topic_prefix.encode('utf-8'))
+            frames = conn.recv_multipart()
+        except zmq.Again:
+            raise Exception("Zmq snapshot request to %s timed out." % addr)
+        finally:
+            conn.close()
+
+        return [self.decode(frames[i], frames[i + 1]) for i in range(1, len(frames), 2)]
+
+    def recv(self, flags=0):
+        """
+        Receive the next subscribed message
+        :param flags: Zmq flags, e.g. zmq.NOBLOCK
+        :return: (topic, dictionary of the row). The timestamps of the snapshots
+                 are in microseconds.
+        """
+        while True:
+            topic, payload = self.conn.recv_multipart(flags)
+            # The publisher filters by prefix, e.g. "BTC" also matches "BTCUSD"
+            if any(topic == t if is_exact else topic.startswith(t) for t, is_exact in self.topics):
+                return self.decode(topic, payload)
+
+    def close(self):
+        """
+        Close the socket
+        """
+        self.conn.close()
+
+
 if __name__ == '__main__':
     Logger.init_log()
     db_client = ZmqClient()
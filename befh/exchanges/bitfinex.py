@@ -1,13 +1,13 @@
 from befh.market_data import L2Depth, Trade
 from befh.exchanges.gateway import ExchangeGateway
 from befh.instrument import Instrument
+from befh.order_book import OrderBook
 from befh.ws_api_socket import WebSocketApiClient
-from befh.util import Logger
+from befh.util import Logger, Timestamp
 import time
 import threading
 import json
 from functools import partial
-from datetime import datetime
 
 
 class ExchGwBitfinexWs(WebSocketApiClient):
@@ -24,9 +24,18 @@ class ExchGwBitfinexWs(WebSocketApiClient):
     def get_link(cls):
         return 'wss://api2.bitfinex.com:3000/ws'
 
+    @classmethod
+    def get_order_book_length(cls, instmt):
+        """
+        Number of price levels subscribed on each side, either 25 or 100.
+        Configured by the "order_book_len" parameter of the subscription.
+        """
+        return int(instmt.get_param('order_book_len', 25))
+
     @classmethod
     def get_order_book_subscription_string(cls, instmt):
-        return json.dumps({"event":"subscribe", "channel": "book", "pair": instmt.get_instmt_code(), "freq": "F0"})
+        return json.dumps({"event":"subscribe", "channel": "book", "pair": instmt.get_instmt_code(), "freq": "F0",
+                           "len": str(cls.get_order_book_length(instmt))})
 
     @classmethod
     def get_trades_subscription_string(cls, instmt):
@@ -40,98 +49,25 @@ class ExchGwBitfinexWs(WebSocketApiClient):
         :param raw: Raw data in JSON
         """
         # No order book mapping from config. Need to decode here.
+        order_book = instmt.get_order_book()
         l2_depth = instmt.get_l2_depth()
-        l2_depth.date_time = datetime.utcnow().strftime("%Y%m%d %H:%M:%S.%f")
+        l2_depth.date_time = Timestamp.now()
         if isinstance(raw[0], list):
             # Start subscription
-            for i in range(0, 25):
-                bid = raw[i]
-                ask = raw[25+i]
-
-                l2_depth.bids[i] = L2Depth.Depth(price=bid[0], count=bid[1], volume=bid[2])
-                l2_depth.asks[i] = L2Depth.Depth(price=ask[0], count=ask[1], volume=-ask[2])
+            order_book.apply_snapshot([(e[0], e[2], e[1]) for e in raw if e[2] > 0],
+                                      [(e[0], -e[2], e[1]) for e in raw if e[2] < 0])
 
         else:
             price = raw[1]
             count = raw[2]
             volume = raw[3]
-            found = False
-
-            if count == 0:
-                # Deletion
-                if volume > 0:
-                    for i in range(0, len(l2_depth.bids)):
-                        if price == l2_depth.bids[i].price:
-                            found = True
-                            del l2_depth.bids[i]
-                            break
-                else:
-                    for i in range(0, len(l2_depth.asks)):
-                        if price == l2_depth.asks[i].price:
-                            found = True
-                            del l2_depth.asks[i]
-                            break
-
-                if not found:
-                    depth_text = ""
-                    for i in range(0, l2_depth.depth):
-                        if i < len(l2_depth.bids):
-                            depth_text += "%.4f,%d,%.4f" % \
-                              (l2_depth.bids[i].volume, \
-                               l2_depth.bids[i].count, \
-                               l2_depth.bids[i].price)
-                        else:
-                            depth_text += "                   "
-                        depth_text += "<--->"
-                        if i < len(l2_depth.asks):
-                            depth_text += "%.4f,%d,%.4f" % \
-                                          (l2_depth.asks[i].volume, \
-                                           l2_depth.asks[i].count, \
-                                           l2_depth.asks[i].price)
-                        else:
-                            depth_text += "                   "
-                        depth_text += "\n"
-                    Logger.info(cls.__name__, "Cannot find the deletion of the message: %s\nDepth:\n%s\n" % \
-                              (raw, depth_text))
-            else:
-                # Insertion/Update
-                if volume > 0:
-                    # Update
-                    for i in range(0, len(l2_depth.bids)):
-                        if price == l2_depth.bids[i].price:
-                            l2_depth.bids[i].count = count
-                            l2_depth.bids[i].volume = volume
-                            found = True
-                            break
-
-                    if not found:
-                        # Insertion
-                        l2_depth.bids.append(L2Depth.Depth(price=price,
-                                                         count=count,
-                                                         volume=volume))
-                        l2_depth.sort_bids()
-
-                        if len(l2_depth.bids) > l2_depth.depth * 2:
-                            del l2_depth.bids[l2_depth.depth:]
-                else:
-                    for i in range(0, len(l2_depth.asks)):
-                        # Update
-                        if price == l2_depth.asks[i].price:
-                            l2_depth.asks[i].count = count
-                            l2_depth.asks[i].volume = -volume
-                            found = True
-                            break
-
-                    if not found:
-                        # Insertion
-                        l2_depth.asks.append(L2Depth.Depth(price=price,
-                                                    count=count,
-                                                    volume=-volume))
-                        l2_depth.sort_asks()
+            side = OrderBook.Side.BID if volume > 0 else OrderBook.Side.ASK
 
-                        if len(l2_depth.asks) > l2_depth.depth * 2:
-                            del l2_depth.asks[l2_depth.depth:]
+            # Insertion/Update, or deletion if the count is zero
+            if not order_book.apply_delta(side, price, abs(volume), count):
+                Logger.info(cls.__name__, "Cannot find the deletion of the message: %s" % raw)
 
+        order_book.update_l2_depth(l2_depth)
         return l2_depth
 
     @classmethod
@@ -147,7 +83,7 @@ class ExchGwBitfinexWs(WebSocketApiClient):
         trade_price = raw[2]
         trade_volume = raw[3]
 
-        trade.date_time = datetime.utcfromtimestamp(timestamp).strftime("%Y%m%d %H:%M:%S.%f")
+        trade.date_time = Timestamp.from_seconds(timestamp)
         trade.trade_side = Trade.Side.BUY if trade_volume > 0 else Trade.Side.SELL
         trade.trade_volume = abs(trade_volume)
         trade.trade_id = str(trade_id)
@@ -222,15 +158,15 @@ class ExchGwBitfinex(ExchangeGateway):
                               (message['channel'], instmt.get_instmt_code(), message['chanId']))
         elif isinstance(message, list):
             if message[0] == instmt.get_order_book_channel_id():
+                version = instmt.get_l2_depth().version
                 if isinstance(message[1], list):
                     self.api_socket.parse_l2_depth(instmt, message[1])
                 elif len(message) != 2:
-                    instmt.set_prev_l2_depth(instmt.get_l2_depth().copy())
                     self.api_socket.parse_l2_depth(instmt, message)
                 else:
                     return
 
-                if instmt.get_l2_depth().is_diff(instmt.get_prev_l2_depth()):
+                if instmt.get_l2_depth().version != version:
                     instmt.incr_order_book_id()
                     self.insert_order_book(instmt)
 
@@ -265,8 +201,9 @@ class ExchGwBitfinex(ExchangeGateway):
         :param instmt: Instrument
         :return List of threads
         """
-        instmt.set_l2_depth(L2Depth(25))
-        instmt.set_prev_l2_depth(L2Depth(25))
+        instmt.set_l2_depth(L2Depth(5))
+        instmt.set_prev_l2_depth(L2Depth(5))
+        instmt.set_order_book(OrderBook())
         instmt.set_instmt_snapshot_table_name(self.get_instmt_snapshot_table_name(instmt.get_exchange_name(),
                                                                                   instmt.get_instmt_name()))
         instmt.set_instmt_trades_table_name(self.get_instmt_trades_table_name(instmt.get_exchange_name(),
@@ -1,11 +1,10 @@
 from befh.restful_api_socket import RESTfulApiSocket
 from befh.exchanges.gateway import ExchangeGateway
 from befh.market_data import L2Depth, Trade
-from befh.util import Logger
+from befh.util import Logger, Timestamp
 from befh.instrument import Instrument
 from befh.clients.sql_template import SqlClientTemplate
 from functools import partial
-from datetime import datetime
 import threading
 import time
 
@@ -74,7 +73,7 @@ class ExchGwApiBitflyer(RESTfulApiSocket):
            cls.get_asks_field_name() in keys:
 
             # No Date time information, has update id only
-            l2_depth.date_time = datetime.utcnow().strftime("%Y%m%d %H:%M:%S.%f")
+            l2_depth.date_time = Timestamp.now()
 
             # Bids
             bids = raw[cls.get_bids_field_name()]
@@ -114,9 +113,9 @@ class ExchGwApiBitflyer(RESTfulApiSocket):
             # Date time
             date_time = raw[cls.get_trades_timestamp_field_name()]
             try:
-                trade.date_time = datetime.strptime(date_time, '%Y-%m-%dT%H:%M:%S.%f').strftime('%Y%m%d %H:%M:%S.%f')
+                trade.date_time = Timestamp.parse(date_time, '%Y-%m-%dT%H:%M:%S.%f')
             except Exception as e:
-                trade.date_time = datetime.strptime(date_time, '%Y-%m-%dT%H:%M:%S').strftime('%Y%m%d %H:%M:%S.%f')
+                trade.date_time = Timestamp.parse(date_time, '%Y-%m-%dT%H:%M:%S')
 
             # Trade side
             trade.trade_side = Trade.parse_side(raw[cls.get_trade_side_field_name()])
@@ -2,13 +2,13 @@ from befh.ws_api_socket import WebSocketApiClient
 from befh.market_data import L2Depth, Trade
 from befh.exchanges.gateway import ExchangeGateway
 from befh.instrument import Instrument
-from befh.util import Logger
+from befh.order_book import OrderBook
+from befh.util import Logger, Timestamp
 from befh.clients.sql_template import SqlClientTemplate
 import time
 import threading
 import json
 from functools import partial
-from datetime import datetime
 
 
 class ExchGwBitmexWs(WebSocketApiClient):
@@ -72,64 +72,41 @@ class ExchGwBitmexWs(WebSocketApiClient):
         :param instmt: Instrument
         :param raw: Raw data in JSON
         """
-        def get_order_info(data):
-            return (
-                data['price'] if 'price' in data.keys() else None,
-                (0 if data['side'] == "Buy" else 1),
-                data['id'],
-                data['size'] if 'size' in data.keys() else None
-            )
+        order_book = instmt.get_order_book()
+        instmt_code = instmt.get_instmt_code()
 
+        def get_side(data):
+            return OrderBook.Side.BID if data['side'] == "Buy" else OrderBook.Side.ASK
 
-        if raw['action'] in ('partial', 'insert'):
-            # Order book initialization or insertion
-            for data in raw['data']:
-                if data['symbol'] != instmt.get_instmt_code():
-                    continue
+        if raw['action'] == 'partial':
+            # Order book initialization
+            order_book.apply_order_snapshot(
+                (get_side(data), data['id'], data['price'], data['size'])
+                for data in raw['data'] if data['symbol'] == instmt_code)
 
-                price, side, id, volume = get_order_info(data)
-                instmt.realtime_order_book_ids[side][id] = price
-                if price not in instmt.realtime_order_book_prices[side].keys():
-                    instmt.realtime_order_book_prices[side][price] = { id: volume }
-                else:
-                    instmt.realtime_order_book_prices[side][price][id] = volume
+        elif raw['action'] == 'insert':
+            # Order book insertion
+            for data in raw['data']:
+                if data['symbol'] == instmt_code:
+                    order_book.apply_order_delta(OrderBook.Action.INSERT, data['id'],
+                                                 get_side(data), data['price'], data['size'])
 
         elif raw['action'] == 'update':
             # Order book update
             for data in raw['data']:
-                if data['symbol'] != instmt.get_instmt_code():
-                    continue
-
-                _, side, id, volume = get_order_info(data)
-                price = instmt.realtime_order_book_ids[side][id]
-                instmt.realtime_order_book_ids[side][id] = price
-                instmt.realtime_order_book_prices[side][price][id] = volume
+                if data['symbol'] == instmt_code and 'size' in data:
+                    order_book.apply_order_delta(OrderBook.Action.UPDATE, data['id'], volume=data['size'])
 
         elif raw['action'] == 'delete':
             # Order book delete
             for data in raw['data']:
-                if data['symbol'] != instmt.get_instmt_code():
-                    continue
-
-                _, side, id, _ = get_order_info(data)
-                price = instmt.realtime_order_book_ids[side][id]
-                del instmt.realtime_order_book_prices[side][price][id]
-                if len(instmt.realtime_order_book_prices[side][price]) == 0:
-                    del instmt.realtime_order_book_prices[side][price]
+                if data['symbol'] == instmt_code:
+                    order_book.apply_order_delta(OrderBook.Action.DELETE, data['id'])
 
         # return l2_depth
-        l2_depth = L2Depth()
-        l2_depth.date_time = datetime.utcnow().strftime("%Y%m%d %H:%M:%S.%f")
-
-        bids_px = sorted(list(instmt.realtime_order_book_prices[0].keys()), reverse=True)[:5]
-        asks_px = sorted(list(instmt.realtime_order_book_prices[1].keys()))[:5]
-        bids_qty = [sum(instmt.realtime_order_book_prices[0][px].values()) for px in bids_px]
-        asks_qty = [sum(instmt.realtime_order_book_prices[1][px].values()) for px in asks_px]
-        for i in range(0, 5):
-            l2_depth.bids[i].price = bids_px[i]
-            l2_depth.bids[i].volume = bids_qty[i]
-            l2_depth.asks[i].price = asks_px[i]
-            l2_depth.asks[i].volume = asks_qty[i]
+        l2_depth = instmt.get_l2_depth()
+        l2_depth.date_time = Timestamp.now()
+        order_book.update_l2_depth(l2_depth)
 
         return l2_depth
 
@@ -151,8 +128,7 @@ class ExchGwBitmexWs(WebSocketApiClient):
 
             # Date time
             timestamp = raw[cls.get_trades_timestamp_field_name()]
-            timestamp = timestamp.replace('T', ' ').replace('Z', '').replace('-' , '')
-            trade.date_time = timestamp
+            trade.date_time = Timestamp.parse(timestamp, "%Y-%m-%dT%H:%M:%S.%fZ")
 
             # Trade side
             trade.trade_side = Trade.parse_side(raw[cls.get_trade_side_field_name()])
@@ -239,10 +215,9 @@ class ExchGwBitmex(ExchangeGateway):
                             instmt.set_exch_trade_id(trade.trade_id)
                             self.insert_trade(instmt, trade)
             elif message['table'] == 'orderBookL2':
-                l2_depth = self.api_socket.parse_l2_depth(instmt, message)
-                if l2_depth is not None and l2_depth.is_diff(instmt.get_l2_depth()):
-                    instmt.set_prev_l2_depth(instmt.get_l2_depth())
-                    instmt.set_l2_depth(l2_depth)
+                version = instmt.get_l2_depth().version
+                self.api_socket.parse_l2_depth(instmt, message)
+                if instmt.get_l2_depth().version != version:
                     instmt.incr_order_book_id()
                     self.insert_order_book(instmt)
             else:
@@ -258,6 +233,7 @@ class ExchGwBitmex(ExchangeGateway):
         """
         instmt.set_l2_depth(L2Depth(5))
         instmt.set_prev_l2_depth(L2Depth(5))
+        instmt.set_order_book(OrderBook())
         instmt.set_instmt_snapshot_table_name(self.get_instmt_snapshot_table_name(instmt.get_exchange_name(),
                                                                                   instmt.get_instmt_name()))
         self.init_instmt_snapshot_table(instmt)
@@ -3,12 +3,11 @@ from befh.market_data import L2Depth, Trade
 from befh.exchanges.gateway import ExchangeGateway
 from befh.instrument import Instrument
 from befh.clients.sql_template import SqlClientTemplate
-from befh.util import Logger
+from befh.util import Logger, Timestamp
 import time
 import threading
 import json
 from functools import partial
-from datetime import datetime
 
 
 class ExchGwApiBitstamp(WebSocketApiClient):
@@ -84,7 +83,7 @@ class ExchGwApiBitstamp(WebSocketApiClient):
            cls.get_asks_field_name() in keys:
 
             # Date time
-            l2_depth.date_time = datetime.utcnow().strftime("%Y%m%d %H:%M:%S.%f")
+            l2_depth.date_time = Timestamp.now()
 
             # Bids
             bids = raw[cls.get_bids_field_name()]
@@ -124,7 +123,7 @@ class ExchGwApiBitstamp(WebSocketApiClient):
 
             # Date time
             date_time = float(raw[cls.get_trades_timestamp_field_name()])
-            trade.date_time = datetime.utcfromtimestamp(date_time).strftime("%Y%m%d %H:%M:%S.%f")
+            trade.date_time = Timestamp.from_seconds(date_time)
 
             # Trade side
             # Buy = 0
@@ -200,9 +199,9 @@ class ExchGwBitstamp(ExchangeGateway):
             channel_name = message['channel']
             if (self.api_socket.is_default_instmt(instmt) and channel_name == "order_book") or \
                (not self.api_socket.is_default_instmt(instmt) and channel_name == "order_book_%s" % instmt.get_instmt_code()):
-                instmt.set_prev_l2_depth(instmt.get_l2_depth().copy())
+                version = instmt.get_l2_depth().version
                 self.api_socket.parse_l2_depth(instmt, json.loads(message['data']))
-                if instmt.get_l2_depth().is_diff(instmt.get_prev_l2_depth()):
+                if instmt.get_l2_depth().version != version:
                     instmt.incr_order_book_id()
                     self.insert_order_book(instmt)
             elif (self.api_socket.is_default_instmt(instmt) and channel_name == "live_trades") or \
@@ -1,11 +1,10 @@
 from befh.restful_api_socket import RESTfulApiSocket
 from befh.exchanges.gateway import ExchangeGateway
 from befh.market_data import L2Depth, Trade
-from befh.util import Logger
+from befh.util import Logger, Timestamp
 from befh.instrument import Instrument
 from befh.clients.sql_template import SqlClientTemplate
 from functools import partial
-from datetime import datetime
 import threading
 import time
 
@@ -80,7 +79,7 @@ class ExchGwApiBittrex(RESTfulApiSocket):
            cls.get_asks_field_name() in keys:
 
             # Date time
-            l2_depth.date_time = datetime.utcnow().strftime("%Y%m%d %H:%M:%S.%f")
+            l2_depth.date_time = Timestamp.now()
 
             # Bids
             bids = raw[cls.get_bids_field_name()]
@@ -121,8 +120,7 @@ class ExchGwApiBittrex(RESTfulApiSocket):
             if len(date_time) == 19:
                 date_time += '.'
             date_time += '0' * (26 - len(date_time))
-            date_time = datetime.strptime(date_time, cls.get_trades_timestamp_format())
-            trade.date_time = date_time.strftime("%Y%m%d %H:%M:%S.%f")
+            trade.date_time = Timestamp.parse(date_time, cls.get_trades_timestamp_format())
 
             # Trade side
             trade.trade_side = 1 if raw[cls.get_trade_side_field_name()] == 'BUY' else 2
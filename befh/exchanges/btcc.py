@@ -1,13 +1,12 @@
 from befh.restful_api_socket import RESTfulApiSocket
 from befh.exchanges.gateway import ExchangeGateway
 from befh.market_data import L2Depth, Trade
-from befh.util import Logger
+from befh.util import Logger, Timestamp
 from befh.instrument import Instrument
 from befh.clients.sql_template import SqlClientTemplate
 import time
 import threading
 from functools import partial
-from datetime import datetime
 
 
 class ExchGwBtccRestfulApi(RESTfulApiSocket):
@@ -78,7 +77,7 @@ class ExchGwBtccRestfulApi(RESTfulApiSocket):
             # Date time
             date_time = float(raw[cls.get_order_book_timestamp_field_name()])
             date_time = date_time / cls.get_timestamp_offset()
-            l2_depth.date_time = datetime.utcfromtimestamp(date_time).strftime("%Y%m%d %H:%M:%S.%f")
+            l2_depth.date_time = Timestamp.from_seconds(date_time)
 
             # Bids
             bids = raw[cls.get_bids_field_name()]
@@ -118,7 +117,7 @@ class ExchGwBtccRestfulApi(RESTfulApiSocket):
             # Date time
             date_time = float(raw[cls.get_trades_timestamp_field_name()])
             date_time = date_time / cls.get_timestamp_offset()
-            trade.date_time = datetime.utcfromtimestamp(date_time).strftime("%Y%m%d %H:%M:%S.%f")
+            trade.date_time = Timestamp.from_seconds(date_time)
 
             # Trade side
             trade.trade_side = 1
@@ -1,11 +1,10 @@
 from befh.restful_api_socket import RESTfulApiSocket
 from befh.exchanges.gateway import ExchangeGateway
 from befh.market_data import L2Depth, Trade
-from befh.util import Logger
+from befh.util import Logger, Timestamp
 from befh.instrument import Instrument
 from befh.clients.sql_template import SqlClientTemplate
 from functools import partial
-from datetime import datetime
 import threading
 import time
 
@@ -75,7 +74,7 @@ class ExchGwApiCoincheck(RESTfulApiSocket):
            cls.get_asks_field_name() in keys:
 
             # No Date time information, has update id only
-            l2_depth.date_time = datetime.utcnow().strftime("%Y%m%d %H:%M:%S.%f")
+            l2_depth.date_time = Timestamp.now()
 
             # Bids
             bids = raw[cls.get_bids_field_name()]
@@ -116,7 +115,7 @@ class ExchGwApiCoincheck(RESTfulApiSocket):
             #date_time = float(raw[cls.get_trades_timestamp_field_name()])
             #date_time = date_time / cls.get_timestamp_offset()
             date_time = raw[cls.get_trades_timestamp_field_name()]
-            trade.date_time = datetime.strptime(date_time, '%Y-%m-%dT%H:%M:%S.%fZ').strftime('%Y%m%d %H:%M:%S.%f')
+            trade.date_time = Timestamp.parse(date_time, '%Y-%m-%dT%H:%M:%S.%fZ')
 
             # Trade side
             trade.trade_side = Trade.parse_side(raw[cls.get_trade_side_field_name()])
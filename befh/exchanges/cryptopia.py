@@ -1,11 +1,10 @@
 from befh.restful_api_socket import RESTfulApiSocket
 from befh.exchanges.gateway import ExchangeGateway
 from befh.market_data import L2Depth, Trade
-from befh.util import Logger
+from befh.util import Logger, Timestamp
 from befh.instrument import Instrument
 from befh.clients.sql_template import SqlClientTemplate
 from functools import partial
-from datetime import datetime
 from threading import Thread
 import time
 
@@ -86,7 +85,7 @@ class ExchGwApiCryptopia(RESTfulApiSocket):
            cls.get_asks_field_name() in keys:
 
             # Date time
-            l2_depth.date_time = datetime.utcnow().strftime("%Y%m%d %H:%M:%S.%f")
+            l2_depth.date_time = Timestamp.now()
 
             # Bids
             bids = raw[cls.get_bids_field_name()]
@@ -124,7 +123,7 @@ class ExchGwApiCryptopia(RESTfulApiSocket):
             # Date time
             date_time = float(raw[cls.get_trades_timestamp_field_name()])
             date_time = date_time / cls.get_timestamp_offset()
-            trade.date_time = datetime.utcfromtimestamp(date_time).strftime("%Y%m%d %H:%M:%S.%f")
+            trade.date_time = Timestamp.from_seconds(date_time)
 
             # Trade side
             trade.trade_side = Trade.parse_side(raw[cls.get_trade_side_field_name()])
@@ -136,7 +135,7 @@ class ExchGwApiCryptopia(RESTfulApiSocket):
             trade.trade_volume = float(str(raw[cls.get_trade_volume_field_name()]))
 
             # Trade id
-            trade.trade_id = trade.date_time + '-P' + str(trade.trade_price) + '-V' + str(trade.trade_volume)
+            trade.trade_id = Timestamp.format(trade.date_time) + '-P' + str(trade.trade_price) + '-V' + str(trade.trade_volume)
 
         else:
             raise Exception('Does not contain trade keys in instmt %s-%s.\nOriginal:\n%s' % \
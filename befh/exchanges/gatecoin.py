@@ -1,13 +1,12 @@
 from befh.restful_api_socket import RESTfulApiSocket
 from befh.exchanges.gateway import ExchangeGateway
 from befh.market_data import L2Depth, Trade
-from befh.util import Logger
+from befh.util import Logger, Timestamp
 from befh.instrument import Instrument
 from befh.clients.sql_template import SqlClientTemplate
 import time
 import threading
 from functools import partial
-from datetime import datetime
 
 
 class ExchGwApiGatecoin(RESTfulApiSocket):
@@ -137,7 +136,7 @@ class ExchGwApiGatecoin(RESTfulApiSocket):
 
             # Date time
             date_time = float(raw[cls.get_trade_timestamp_field_name()])
-            trade.date_time = datetime.utcfromtimestamp(date_time).strftime("%Y%m%d %H:%M:%S.%f")
+            trade.date_time = Timestamp.from_seconds(date_time)
 
             # Trade side
             trade.trade_side = 1
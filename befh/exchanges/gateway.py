@@ -2,11 +2,15 @@
 from befh.clients.postgresql import PostgresqlClient
 from befh.clients.zmq import ZmqClient
 from befh.clients.csv import FileClient
+from befh.clients.tickstore import TickStoreClient
 from befh.clients.mysql import MysqlClient
 from befh.clients.sqlite import SqliteClient
 from befh.market_data import L2Depth, Trade, Snapshot
+from befh.sink_worker import SinkWorker
+from befh.util import Timestamp
 from datetime import datetime
-from threading import Lock
+from threading import Timer
+from itertools import count
 
 class ExchangeGateway:
     ############################################################################
@@ -14,6 +18,15 @@ class ExchangeGateway:
     # Applied on all gateways whether to record the timestamp in local machine,
     # rather than exchange timestamp given by the API
     is_local_timestamp = False
+    # Seconds before midnight (UTC) to create the tables of the next day
+    tables_precreation_seconds = 300
+    # Maximum number of queued insertions of each database client. The
+    # insertions are made in the gateway threads if it is zero.
+    sink_queue_size = 0
+    # Action when the queue of a database client is full
+    sink_overflow_policy = SinkWorker.OverflowPolicy.BLOCK
+    # Directory of the spill files
+    sink_spill_directory = ''
     ############################################################################
 
     """
@@ -28,10 +41,15 @@ class ExchangeGateway:
         """
         self.db_clients = db_clients
         self.api_socket = api_socket
-        self.lock = Lock()
-        self.exch_snapshot_id = 0
-        self.exch_trades_id = 0
+        # Instrument name -> sequence of the ids in the trades and snapshot tables
+        self.instmt_trades_ids = dict()
+        self.instmt_snapshot_ids = dict()
         self.date_time = datetime.utcnow().date()
+        # Instrument name -> start of the next day in microseconds since epoch
+        self.next_day_timestamps = dict()
+        # Instrument name -> (date, snapshot table name, trades table name,
+        # snapshot ids, trades ids) of the tables prepared for the next day
+        self.next_day_tables = dict()
 
     @classmethod
     def get_exchange_name(cls):
@@ -41,27 +59,29 @@ class ExchangeGateway:
         """
         return ''
 
-    def get_instmt_snapshot_table_name(self, exchange, instmt_name):
+    def get_instmt_snapshot_table_name(self, exchange, instmt_name, date_time=None):
         """
         Get instmt snapshot
         :param exchange: Exchange name
         :param instmt_name: Instrument name
+        :param date_time: Date of the table, the current date of the gateway by default
         """
         #return 'exch_' + exchange.lower() + '_' + instmt_name.lower() + \
         #       '_snapshot_' + datetime.utcnow().strftime("%Y%m%d")
         return 'exch_' + exchange.lower() + '_' + instmt_name.lower() + \
-               '_snapshot_' + self.date_time.strftime("%Y%m%d")
+               '_snapshot_' + (self.date_time if date_time is None else date_time).strftime("%Y%m%d")
 
-    def get_instmt_trades_table_name(self, exchange, instmt_name):
+    def get_instmt_trades_table_name(self, exchange, instmt_name, date_time=None):
         """
         Get instmt trades
         :param exchange: Exchange name
         :param instmt_name: Instrument name
+        :param date_time: Date of the table, the current date of the gateway by default
         """
         #return 'exch_' + exchange.lower() + '_' + instmt_name.lower() + \
         #       '_snapshot_' + datetime.utcnow().strftime("%Y%m%d")
         return 'exch_' + exchange.lower() + '_' + instmt_name.lower() + \
-               '_trades_' + self.date_time.strftime("%Y%m%d")
+               '_trades_' + (self.date_time if date_time is None else date_time).strftime("%Y%m%d")
 
     @classmethod
     def get_snapshot_table_name(cls):
@@ -69,11 +89,11 @@ class ExchangeGateway:
 
     @classmethod
     def is_allowed_snapshot(cls, db_client):
-        return not isinstance(db_client, FileClient)
+        return not isinstance(db_client, (FileClient, TickStoreClient))
 
     @classmethod
     def is_allowed_instmt_record(cls, db_client):
-        return not isinstance(db_client, ZmqClient)
+        return not isinstance(db_client, ZmqClient) and not db_client.is_snapshot_only
 
     @classmethod
     def init_snapshot_table(cls, db_clients):
@@ -95,17 +115,9 @@ class ExchangeGateway:
                              ['int'] + Trade.types(),
                              [0], is_ifnotexists=True)
 
-            if isinstance(db_client, (MysqlClient, SqliteClient, PostgresqlClient)):
-                with self.lock:
-                    r = db_client.execute('select max(id) from {};'.format(table_name))
-                    db_client.conn.commit()
-                    if r:
-                        res = db_client.cursor.fetchone()
-                        max_id = res['max(id)'] if isinstance(db_client, MysqlClient) else res[0]
-                        if max_id:
-                            self.exch_trades_id = max_id
-                        else:
-                            self.exch_trades_id = 0
+        self.instmt_trades_ids[instmt.get_instmt_name()] = count(self.get_max_id(table_name) + 1)
+
+        self.set_next_day_timestamp(instmt)
 
     def init_instmt_snapshot_table(self, instmt):
         table_name = self.get_instmt_snapshot_table_name(instmt.get_exchange_name(),
@@ -119,17 +131,87 @@ class ExchangeGateway:
                              ['int'] + Snapshot.types(False),
                              [0], is_ifnotexists=True)
 
-            if isinstance(db_client, (MysqlClient, SqliteClient, PostgresqlClient)):
-                with self.lock:
-                    r = db_client.execute('select max(id) from {};'.format(table_name))
-                    db_client.conn.commit()
-                    if r:
-                        res = db_client.cursor.fetchone()
-                        max_id = res['max(id)'] if isinstance(db_client, MysqlClient) else res[0]
-                        if max_id:
-                            self.exch_snapshot_id = max_id
-                        else:
-                            self.exch_snapshot_id = 0
+        self.instmt_snapshot_ids[instmt.get_instmt_name()] = count(self.get_max_id(table_name) + 1)
+
+        self.set_next_day_timestamp(instmt)
+
+    def create_instmt_tables(self, instmt, date_time):
+        """
+        Create the per-day snapshot and trades tables of the instrument
+        without switching the instrument to them, and prepare their id
+        sequences for the roll over
+        :param instmt: Instrument
+        :param date_time: Date of the tables
+        """
+        snapshot_table_name = self.get_instmt_snapshot_table_name(instmt.get_exchange_name(),
+                                                                  instmt.get_instmt_name(),
+                                                                  date_time)
+        trades_table_name = self.get_instmt_trades_table_name(instmt.get_exchange_name(),
+                                                              instmt.get_instmt_name(),
+                                                              date_time)
+        for db_client in self.db_clients:
+            db_client.create(snapshot_table_name,
+                             ['id'] + Snapshot.columns(False),
+                             ['int'] + Snapshot.types(False),
+                             [0], is_ifnotexists=True)
+            db_client.create(trades_table_name,
+                             ['id'] + Trade.columns(),
+                             ['int'] + Trade.types(),
+                             [0], is_ifnotexists=True)
+
+        self.next_day_tables[instmt.get_instmt_name()] = (date_time,
+                                                          snapshot_table_name,
+                                                          trades_table_name,
+                                                          count(self.get_max_id(snapshot_table_name) + 1),
+                                                          count(self.get_max_id(trades_table_name) + 1))
+
+    def set_next_day_timestamp(self, instmt):
+        """
+        Set the day boundary of the instrument after its tables are initialised,
+        and schedule the creation of the tables of the next day shortly before
+        the boundary.
+        :param instmt: Instrument
+        """
+        next_day_timestamp = Timestamp.next_day(Timestamp.from_date(self.date_time))
+        if self.next_day_timestamps.get(instmt.get_instmt_name()) == next_day_timestamp:
+            return
+
+        self.next_day_timestamps[instmt.get_instmt_name()] = next_day_timestamp
+        delay = float(next_day_timestamp - Timestamp.now()) / Timestamp.MICROSECONDS_PER_SECOND
+        if delay > 0:
+            timer = Timer(max(delay - self.tables_precreation_seconds, 0),
+                          self.create_instmt_tables,
+                          [instmt, Timestamp.to_datetime(next_day_timestamp).date()])
+            timer.daemon = True
+            timer.start()
+
+    def roll_over_instmt_tables(self, instmt, timestamp):
+        """
+        Switch the instrument to the snapshot and trades tables of the day
+        of the timestamp. The tables prepared by create_instmt_tables are
+        switched to without querying the database clients.
+        :param instmt: Instrument
+        :param timestamp: Microseconds since epoch
+        """
+        previous_tables = [instmt.get_instmt_snapshot_table_name(), instmt.get_instmt_trades_table_name()]
+        self.date_time = Timestamp.to_datetime(timestamp).date()
+        next_day_tables = self.next_day_tables.pop(instmt.get_instmt_name(), None)
+        if next_day_tables is not None and next_day_tables[0] == self.date_time:
+            _, snapshot_table_name, trades_table_name, snapshot_ids, trades_ids = next_day_tables
+            instmt.set_instmt_snapshot_table_name(snapshot_table_name)
+            instmt.set_instmt_trades_table_name(trades_table_name)
+            self.instmt_snapshot_ids[instmt.get_instmt_name()] = snapshot_ids
+            self.instmt_trades_ids[instmt.get_instmt_name()] = trades_ids
+            self.set_next_day_timestamp(instmt)
+        else:
+            self.init_instmt_snapshot_table(instmt)
+            self.init_instmt_trades_table(instmt)
+
+        # The files of the previous day are not written anymore
+        for db_client in self.db_clients:
+            if hasattr(db_client, 'close_table'):
+                for table in previous_tables:
+                    db_client.close_table(table)
 
     def start(self, instmt):
         """
@@ -139,17 +221,98 @@ class ExchangeGateway:
         """
         return []
 
-    def get_instmt_trades_id(self, instmt):
-        with self.lock:
-            self.exch_trades_id += 1
+    def dispatch_insert(self, db_client, table, columns, types, values, primary_key_index=[],
+                        is_orreplace=False, is_commit=True):
+        """
+        Insert a row into the database client, or enqueue it to the sink worker
+        of the client if the sink queue is enabled. The values must not be
+        modified afterwards.
+        :param db_client: Database client
+        :param table: Table name
+        :param columns: Column array
+        :param types: Type array
+        :param values: Value array
+        :param primary_key_index: An array of indices of primary keys in columns
+        :param is_orreplace: Indicate if the query is "INSERT OR REPLACE"
+        :param is_commit: Indicate if the query is committed
+        """
+        if self.sink_queue_size > 0:
+            SinkWorker.get_worker(db_client,
+                                  self.sink_queue_size,
+                                  self.sink_overflow_policy,
+                                  self.sink_spill_directory).put(table=table,
+                                                                 columns=columns,
+                                                                 types=types,
+                                                                 values=values,
+                                                                 primary_key_index=primary_key_index,
+                                                                 is_orreplace=is_orreplace,
+                                                                 is_commit=is_commit)
+        else:
+            db_client.insert(table=table,
+                             columns=columns,
+                             types=types,
+                             values=values,
+                             primary_key_index=primary_key_index,
+                             is_orreplace=is_orreplace,
+                             is_commit=is_commit)
+
+    def flush_db_client(self, db_client):
+        """
+        Write the queued and buffered rows of the database client
+        :param db_client: Database client
+        """
+        if self.sink_queue_size > 0:
+            SinkWorker.get_worker(db_client,
+                                  self.sink_queue_size,
+                                  self.sink_overflow_policy,
+                                  self.sink_spill_directory).join()
+        db_client.flush()
+
+    def get_max_id(self, table_name):
+        """
+        Get the maximum id of the instrument table in the database clients
+        :param table_name: Table name
+        :return: Maximum id, or 0 if the table is empty
+        """
+        max_id = 0
+        for db_client in self.db_clients:
+            if isinstance(db_client, (MysqlClient, SqliteClient, PostgresqlClient)):
+                # Buffered rows are flushed, and the cursor is shared with the client
+                self.flush_db_client(db_client)
+                with db_client.lock:
+                    r = db_client.execute('select max(id) from {};'.format(table_name))
+                    db_client.conn.commit()
+                    if r:
+                        res = db_client.cursor.fetchone()
+                        res = res['max(id)'] if isinstance(db_client, MysqlClient) else res[0]
+                        if res:
+                            max_id = max(max_id, int(res))
 
-        return self.exch_trades_id
+        return max_id
 
-    def get_instmt_snapshot_id(self, instmt):
-        with self.lock:
-            self.exch_snapshot_id += 1
+    def get_instmt_trades_id(self, instmt):
+        """
+        Get the next id in the trades table of the instrument. The ids of each
+        instrument are generated independently without locking.
+        :param instmt: Instrument
+        :return: Trade id
+        """
+        ids = self.instmt_trades_ids.get(instmt.get_instmt_name())
+        if ids is None:
+            ids = self.instmt_trades_ids.setdefault(instmt.get_instmt_name(), count(1))
+        return next(ids)
 
-        return self.exch_snapshot_id
+    def get_instmt_snapshot_id(self, instmt):
+        """
+        Get the next id in the snapshot table of the instrument. The ids of each
+        instrument are generated independently without locking.
+        :param instmt: Instrument
+        :return: Snapshot id
+        """
+        ids = self.instmt_snapshot_ids.get(instmt.get_instmt_name())
+        if ids is None:
+            ids = self.instmt_snapshot_ids.setdefault(instmt.get_instmt_name(), count(1))
+        return next(ids)
 
     def insert_order_book(self, instmt):
         """
@@ -158,36 +321,39 @@ class ExchangeGateway:
         """
         # If local timestamp indicator is on, assign the local timestamp again
         if self.is_local_timestamp:
-            instmt.get_l2_depth().date_time = datetime.utcnow().strftime("%Y%m%d %H:%M:%S.%f")
+            instmt.get_l2_depth().date_time = Timestamp.now()
 
         # Update the snapshot
         if instmt.get_l2_depth() is not None:
+            if instmt.get_l2_depth().date_time >= self.next_day_timestamps.get(instmt.get_instmt_name(), 0):
+                self.roll_over_instmt_tables(instmt, instmt.get_l2_depth().date_time)
+
             id = self.get_instmt_snapshot_id(instmt)
             for db_client in self.db_clients:
                 if self.is_allowed_snapshot(db_client):
-                    db_client.insert(table=self.get_snapshot_table_name(),
-                                     columns=Snapshot.columns(),
-                                     types=Snapshot.types(),
-                                     values=Snapshot.values(instmt.get_exchange_name(),
-                                                            instmt.get_instmt_name(),
-                                                            instmt.get_l2_depth(),
-                                                            Trade() if instmt.get_last_trade() is None else instmt.get_last_trade(),
-                                                            Snapshot.UpdateType.ORDER_BOOK),
-                                     primary_key_index=[0,1],
-                                     is_orreplace=True,
-                                     is_commit=True)
+                    self.dispatch_insert(db_client, table=self.get_snapshot_table_name(),
+                                         columns=Snapshot.columns(),
+                                         types=Snapshot.types(),
+                                         values=Snapshot.values(instmt.get_exchange_name(),
+                                                                instmt.get_instmt_name(),
+                                                                instmt.get_l2_depth(),
+                                                                Trade() if instmt.get_last_trade() is None else instmt.get_last_trade(),
+                                                                Snapshot.UpdateType.ORDER_BOOK),
+                                         primary_key_index=[0,1],
+                                         is_orreplace=True,
+                                         is_commit=True)
 
                 if self.is_allowed_instmt_record(db_client):
-                    db_client.insert(table=instmt.get_instmt_snapshot_table_name(),
-                                          columns=['id'] + Snapshot.columns(False),
-                                          types=['int'] + Snapshot.types(False),
-                                          values=[id] +
-                                                  Snapshot.values('',
-                                                                 '',
-                                                                 instmt.get_l2_depth(),
-                                                                 Trade() if instmt.get_last_trade() is None else instmt.get_last_trade(),
-                                                                 Snapshot.UpdateType.ORDER_BOOK),
-                                          is_commit=True)
+                    self.dispatch_insert(db_client, table=instmt.get_instmt_snapshot_table_name(),
+                                         columns=['id'] + Snapshot.columns(False),
+                                         types=['int'] + Snapshot.types(False),
+                                         values=[id] +
+                                                Snapshot.values('',
+                                                                '',
+                                                                instmt.get_l2_depth(),
+                                                                Trade() if instmt.get_last_trade() is None else instmt.get_last_trade(),
+                                                                Snapshot.UpdateType.ORDER_BOOK),
+                                         is_commit=True)
 
     def insert_trade(self, instmt, trade):
         """
@@ -200,27 +366,27 @@ class ExchangeGateway:
 
         # If local timestamp indicator is on, assign the local timestamp again
         if self.is_local_timestamp:
-            trade.date_time = datetime.utcnow().strftime("%Y%m%d %H:%M:%S.%f")
+            trade.date_time = Timestamp.now()
 
-        date_time = datetime.strptime(trade.date_time, "%Y%m%d %H:%M:%S.%f").date()
-        if date_time != self.date_time:
-            self.date_time = date_time
-            self.init_instmt_snapshot_table(instmt)
+        if trade.date_time >= self.next_day_timestamps.get(instmt.get_instmt_name(), 0):
+            self.roll_over_instmt_tables(instmt, trade.date_time)
 
         # Set the last trade to the current one
         instmt.set_last_trade(trade)
 
+        id = self.get_instmt_trades_id(instmt)
         for db_client in self.db_clients:
-            is_allowed_instmt_record = self.is_allowed_instmt_record(db_client)
+            if db_client.is_snapshot_only:
+                continue
 
-            id = self.get_instmt_trades_id(instmt)
-            db_client.insert(table=instmt.get_instmt_trades_table_name(),
-                             columns=['id'] + Trade.columns(),
-                             values=[id] + trade.values(),
-                             types=['int'] +Trade.types(),
-                             primary_key_index=[0, 1],
-                             is_orreplace=True,
-                             is_commit=not is_allowed_instmt_record)
+            is_allowed_instmt_record = self.is_allowed_instmt_record(db_client)
+            self.dispatch_insert(db_client, table=instmt.get_instmt_trades_table_name(),
+                                 columns=['id'] + Trade.columns(),
+                                 values=[id] + trade.values(),
+                                 types=['int'] +Trade.types(),
+                                 primary_key_index=[0, 1],
+                                 is_orreplace=True,
+                                 is_commit=not is_allowed_instmt_record)
 
         # Update the snapshot
         if instmt.get_l2_depth() is not None and \
@@ -230,26 +396,26 @@ class ExchangeGateway:
                 is_allowed_snapshot = self.is_allowed_snapshot(db_client)
                 is_allowed_instmt_record = self.is_allowed_instmt_record(db_client)
                 if is_allowed_snapshot:
-                    db_client.insert(table=self.get_snapshot_table_name(),
-                                     columns=Snapshot.columns(),
-                                     values=Snapshot.values(instmt.get_exchange_name(),
-                                                            instmt.get_instmt_name(),
-                                                            instmt.get_l2_depth(),
-                                                            instmt.get_last_trade(),
-                                                            Snapshot.UpdateType.TRADES),
-                                     types=Snapshot.types(),
-                                     primary_key_index=[0,1],
-                                     is_orreplace=True,
-                                     is_commit=not is_allowed_instmt_record)
+                    self.dispatch_insert(db_client, table=self.get_snapshot_table_name(),
+                                         columns=Snapshot.columns(),
+                                         values=Snapshot.values(instmt.get_exchange_name(),
+                                                                instmt.get_instmt_name(),
+                                                                instmt.get_l2_depth(),
+                                                                instmt.get_last_trade(),
+                                                                Snapshot.UpdateType.TRADES),
+                                         types=Snapshot.types(),
+                                         primary_key_index=[0,1],
+                                         is_orreplace=True,
+                                         is_commit=not is_allowed_instmt_record)
 
                 if is_allowed_instmt_record:
-                    db_client.insert(table=instmt.get_instmt_snapshot_table_name(),
-                                     columns=['id'] + Snapshot.columns(False),
-                                     types=['int'] + Snapshot.types(False),
-                                     values=[id] +
-                                            Snapshot.values('',
-                                                         '',
-                                                         instmt.get_l2_depth(),
-                                                         instmt.get_last_trade(),
-                                                         Snapshot.UpdateType.TRADES),
-                                     is_commit=True)
+                    self.dispatch_insert(db_client, table=instmt.get_instmt_snapshot_table_name(),
+                                         columns=['id'] + Snapshot.columns(False),
+                                         types=['int'] + Snapshot.types(False),
+                                         values=[id] +
+                                                Snapshot.values('',
+                                                             '',
+                                                             instmt.get_l2_depth(),
+                                                             instmt.get_last_trade(),
+                                                             Snapshot.UpdateType.TRADES),
+                                         is_commit=True)
@@ -4,12 +4,11 @@ from befh.market_data import L2Depth, Trade
 from befh.exchanges.gateway import ExchangeGateway
 from befh.instrument import Instrument
 from befh.clients.sql_template import SqlClientTemplate
-from befh.util import Logger
+from befh.util import Logger, Timestamp
 import time
 import threading
 import json
 from functools import partial
-from datetime import datetime
 
 
 class ExchGwApiGdaxOrderBook(RESTfulApiSocket):
@@ -45,7 +44,7 @@ class ExchGwApiGdaxOrderBook(RESTfulApiSocket):
            cls.get_asks_field_name() in keys:
 
             # Date time
-            l2_depth.date_time = datetime.utcnow().strftime("%Y%m%d %H:%M:%S.%f")
+            l2_depth.date_time = Timestamp.now()
 
             # Bids
             bids = raw[cls.get_bids_field_name()]
@@ -167,7 +166,7 @@ class ExchGwApiGdaxTrades(WebSocketApiClient):
             # Date time
             # timestamp = raw[cls.get_trades_timestamp_field_name()]
             # timestamp = timestamp.replace('T', ' ').replace('Z', '')
-            trade.date_time = datetime.utcnow().strftime("%Y%m%d %H:%M:%S.%f")
+            trade.date_time = Timestamp.now()
 
             # Trade side
             trade.trade_side = Trade.parse_side(raw[cls.get_trade_side_field_name()])
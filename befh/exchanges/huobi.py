@@ -2,7 +2,7 @@ from befh.ws_api_socket import WebSocketApiClient
 from befh.market_data import L2Depth, Trade
 from befh.exchanges.gateway import ExchangeGateway
 from befh.instrument import Instrument
-from befh.util import Logger
+from befh.util import Logger, Timestamp
 from befh.clients.sql_template import SqlClientTemplate
 import time
 import threading
@@ -82,7 +82,7 @@ class ExchGwApiHuoBiWs(WebSocketApiClient):
 
             # Date time
             timestamp = raw['ts']
-            l2_depth.date_time = datetime.utcfromtimestamp(timestamp/1000.0).strftime("%Y%m%d %H:%M:%S.%f")
+            l2_depth.date_time = Timestamp.from_milliseconds(timestamp)
 
             # Bids
             bids = raw[cls.get_bids_field_name()]
@@ -125,7 +125,7 @@ class ExchGwApiHuoBiWs(WebSocketApiClient):
 
                 # Date time
                 date_time = float(raw[cls.get_trades_timestamp_field_name()])
-                trade.date_time = datetime.utcfromtimestamp(date_time/1000.0).strftime("%Y%m%d %H:%M:%S.%f")
+                trade.date_time = Timestamp.from_milliseconds(date_time)
 
                 # Trade side
                 # Buy = 0
@@ -209,9 +209,9 @@ class ExchGwHuoBi(ExchangeGateway):
                         instmt.set_exch_trade_id(trade.trade_id)
                         self.insert_trade(instmt, trade)
             elif 'depth.step' in message['ch']:
-                instmt.set_prev_l2_depth(instmt.get_l2_depth().copy())
+                version = instmt.get_l2_depth().version
                 self.api_socket.parse_l2_depth(instmt, message['tick'])
-                if instmt.get_l2_depth().is_diff(instmt.get_prev_l2_depth()):
+                if instmt.get_l2_depth().version != version:
                     instmt.incr_order_book_id()
                     self.insert_order_book(instmt)
             else:
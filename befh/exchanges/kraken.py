@@ -2,11 +2,10 @@ from befh.restful_api_socket import RESTfulApiSocket
 from befh.exchanges.gateway import ExchangeGateway
 from befh.market_data import L2Depth, Trade
 from befh.instrument import Instrument
-from befh.util import Logger
+from befh.util import Logger, Timestamp
 import time
 import threading
 from functools import partial
-from datetime import datetime
 
 
 class ExchGwKrakenRestfulApi(RESTfulApiSocket):
@@ -81,13 +80,13 @@ class ExchGwKrakenRestfulApi(RESTfulApiSocket):
 
         # Timestamp
         date_time = float(raw[2])
-        trade.date_time = datetime.utcfromtimestamp(date_time).strftime("%Y%m%d %H:%M:%S.%f")
+        trade.date_time = Timestamp.from_seconds(date_time)
 
         # Trade side
         trade.trade_side = Trade.parse_side(raw[3])
 
         # Trade id
-        trade.trade_id = trade.date_time + '-' + str(instmt.get_exch_trade_id())
+        trade.trade_id = Timestamp.format(trade.date_time) + '-' + str(instmt.get_exch_trade_id())
 
         return trade
 
@@ -162,7 +161,7 @@ class ExchGwKraken(ExchangeGateway):
             try:
                 l2_depth = self.api_socket.get_order_book(instmt, proxy=self.api_socket.proxy)
                 if l2_depth is not None and l2_depth.is_diff(instmt.get_l2_depth()):
-                    instmt.set_prev_l2_depth(instmt.l2_depth.copy())
+                    instmt.set_prev_l2_depth(instmt.get_l2_depth())
                     instmt.set_l2_depth(l2_depth)
                     instmt.incr_order_book_id()
                     self.insert_order_book(instmt)
@@ -2,13 +2,14 @@ from befh.ws_api_socket import WebSocketApiClient
 from befh.market_data import L2Depth, Trade
 from befh.exchanges.gateway import ExchangeGateway
 from befh.instrument import Instrument
+from befh.order_book import OrderBook
 from befh.clients.sql_template import SqlClientTemplate
-from befh.util import Logger
+from befh.util import Logger, Timestamp
 import os
 import time
 import json
 from functools import partial
-from datetime import datetime
+from itertools import count
 
 
 # Please note that exch_luno.py is not added to bitcoinexchangefh.py by default as it requires API keys to function.
@@ -99,6 +100,7 @@ class ExchGwApiLuno(WebSocketApiClient):
         :param instmt: Instrument
         :param raw: Raw data in JSON
         """
+        order_book = instmt.get_order_book()
         l2_depth = instmt.get_l2_depth()
         keys = list(raw.keys())
 
@@ -106,93 +108,48 @@ class ExchGwApiLuno(WebSocketApiClient):
         asks_field = cls.get_asks_field_name()
 
         if bids_field in keys and asks_field in keys:
-            # Date time
-            l2_depth.date_time = datetime.utcnow().strftime("%Y%m%d %H:%M:%S.%f")
-
-            # Bids
-            bids = raw[bids_field]
-            bids_len = min(l2_depth.depth, len(bids))
-            for i in range(0, bids_len):
-                l2_depth.bids[i].price = float(bids[i]['price']) \
-                    if not isinstance(bids[i]['price'], float) else bids[i][0]
-                l2_depth.bids[i].volume = float(bids[i]['volume']) \
-                    if not isinstance(bids[i]['volume'], float) else bids[i][1]
-                l2_depth.bids[i].id = bids[i]['id']
-
-            # Asks
-            asks = raw[asks_field]
-            asks_len = min(l2_depth.depth, len(asks))
-            for i in range(0, asks_len):
-                l2_depth.asks[i].price = float(asks[i]['price']) \
-                    if not isinstance(asks[i]['price'], float) else asks[i][0]
-                l2_depth.asks[i].volume = float(asks[i]['volume']) \
-                    if not isinstance(asks[i]['volume'], float) else asks[i][1]
-                l2_depth.asks[i].id = asks[i]['id']
+            # Initial order book
+            order_book.apply_order_snapshot(
+                [(OrderBook.Side.BID, e['id'], float(e['price']), float(e['volume'])) for e in raw[bids_field]] +
+                [(OrderBook.Side.ASK, e['id'], float(e['price']), float(e['volume'])) for e in raw[asks_field]])
 
         elif "order_id" in keys:
+            order_id = raw['order_id']
             if 'type' in keys:
                 # Insertion
-                order_id = raw['order_id']
-                price = float(raw['price'])
-                volume = float(raw['volume'])
-                update_type = raw['type']
+                if raw['type'] == "BID":
+                    side = OrderBook.Side.BID
+                elif raw['type'] == "ASK":
+                    side = OrderBook.Side.ASK
+                else:
+                    return l2_depth
 
-                if update_type == "BID":
-                    l2_depth.bids.append(L2Depth.Depth(price=price,
-                                                       volume=volume))
-
-                    l2_depth.bids[-1].id = order_id
-
-                    l2_depth.sort_bids()
-
-                    if len(l2_depth.bids) > l2_depth.depth * 2:
-                        del l2_depth.bids[l2_depth.depth:]
-
-                elif update_type == "ASK":
-                    l2_depth.asks.append(L2Depth.Depth(price=price,
-                                                       volume=volume))
-
-                    l2_depth.asks[-1].id = order_id
-
-                    l2_depth.sort_asks()
-
-                    if len(l2_depth.asks) > l2_depth.depth * 2:
-                        del l2_depth.asks[l2_depth.depth:]
+                order_book.apply_order_delta(OrderBook.Action.INSERT, order_id,
+                                             side, float(raw['price']), float(raw['volume']))
 
             elif 'base' in keys:
-                # Update
-                order_id = raw['order_id']
-                volume = float(raw['base'])
-                price = float(raw['counter']) / float(raw['base'])
-
-                for i in range(0, len(l2_depth.bids)):
-                    if l2_depth.bids[i].id == order_id:
-                        if l2_depth.bids[i].price == price:
-                            l2_depth.bids[i].volume -= volume
-                            break
+                # Update by a trade
+                order = order_book.get_order(order_id)
+                if order is not None:
+                    volume = order[2] - float(raw['base'])
+                    if volume > 1e-9:
+                        order_book.apply_order_delta(OrderBook.Action.UPDATE, order_id, volume=volume)
+                    else:
+                        order_book.apply_order_delta(OrderBook.Action.DELETE, order_id)
 
             else:
                 # Deletion
-                order_id = raw['order_id']
-                found = False
-
-                for i in range(0, len(l2_depth.bids)):
-                    if l2_depth.bids[i].id == order_id:
-                        found = True
-                        del l2_depth.bids[i]
-                        break
-
-                if not found:
-                    for i in range(0, len(l2_depth.asks)):
-                        if l2_depth.asks[i].id == order_id:
-                            del l2_depth.asks[i]
-                            break
+                order_book.apply_order_delta(OrderBook.Action.DELETE, order_id)
 
         else:
             raise Exception('Does not contain order book keys in instmt %s-%s.\nOriginal:\n%s' %
                             (instmt.get_exchange_name(), instmt.get_instmt_name(),
                              raw))
 
+        # Date time
+        l2_depth.date_time = Timestamp.now()
+        order_book.update_l2_depth(l2_depth)
+
         return l2_depth
 
     @classmethod
@@ -209,7 +166,7 @@ class ExchGwApiLuno(WebSocketApiClient):
         trade_volume = float(raw['base'])
 
         timestamp = float(raw[cls.get_trades_timestamp_field_name()]) / 1000.0
-        trade.date_time = datetime.utcfromtimestamp(timestamp).strftime("%Y%m%d %H:%M:%S.%f")
+        trade.date_time = Timestamp.from_seconds(timestamp)
         trade.trade_volume = trade_volume
         trade.trade_id = trade_id
         trade.trade_price = trade_price
@@ -228,7 +185,10 @@ class ExchGwLuno(ExchangeGateway):
         :param db_client: Database client
         """
         ExchangeGateway.__init__(self, ExchGwApiLuno(), db_clients)
-        self.order_book = None
+        self.l3_snapshot_time = {}
+        self.l3_snapshot_table_names = {}
+        # Instrument name -> id sequence of the L3 snapshot table
+        self.l3_snapshot_ids = {}
 
     @classmethod
     def get_exchange_name(cls):
@@ -238,6 +198,76 @@ class ExchGwLuno(ExchangeGateway):
         """
         return 'Luno'
 
+    @classmethod
+    def get_l3_snapshot_columns(cls):
+        return ['id', 'snapshot_id', 'date_time', 'order_id', 'side', 'price', 'volume']
+
+    @classmethod
+    def get_l3_snapshot_types(cls):
+        return ['int', 'int', 'varchar(25)', 'varchar(40)', 'int', 'decimal(20,8)', 'decimal(20,8)']
+
+    def get_instmt_l3_snapshot_table_name(self, exchange, instmt_name):
+        """
+        Get instmt L3 snapshot
+        :param exchange: Exchange name
+        :param instmt_name: Instrument name
+        """
+        return 'exch_' + exchange.lower() + '_' + instmt_name.lower() + \
+               '_l3_snapshot_' + self.date_time.strftime("%Y%m%d")
+
+    def get_l3_snapshot_interval(self, instmt):
+        """
+        Interval in seconds of publishing the full order book. Configured
+        by the "l3_snapshot_interval" parameter of the subscription. The
+        full order book is not published if it is zero.
+        """
+        return float(instmt.get_param('l3_snapshot_interval', 0))
+
+    def init_instmt_l3_snapshot_table(self, instmt):
+        table_name = self.get_instmt_l3_snapshot_table_name(instmt.get_exchange_name(),
+                                                            instmt.get_instmt_name())
+        self.l3_snapshot_table_names[instmt.get_instmt_name()] = table_name
+        for db_client in self.db_clients:
+            if self.is_allowed_instmt_record(db_client):
+                db_client.create(table_name,
+                                 self.get_l3_snapshot_columns(),
+                                 self.get_l3_snapshot_types(),
+                                 [0], is_ifnotexists=True)
+
+        self.l3_snapshot_ids[instmt.get_instmt_name()] = count(self.get_max_id(table_name) + 1)
+
+    def insert_l3_snapshot(self, instmt):
+        """
+        Insert every order of the order book into the L3 snapshot table.
+        Each row has its own id, and all the rows of a snapshot share the
+        same snapshot id.
+        :param instmt: Instrument
+        """
+        table_name = self.get_instmt_l3_snapshot_table_name(instmt.get_exchange_name(),
+                                                            instmt.get_instmt_name())
+        if table_name != self.l3_snapshot_table_names.get(instmt.get_instmt_name()):
+            self.init_instmt_l3_snapshot_table(instmt)
+
+        order_book = instmt.get_order_book()
+        date_time = Timestamp.now()
+        snapshot_id = instmt.get_order_book_id()
+        ids = self.l3_snapshot_ids[instmt.get_instmt_name()]
+        rows = []
+        for side, trade_side in ((OrderBook.Side.BID, Trade.Side.BUY),
+                                 (OrderBook.Side.ASK, Trade.Side.SELL)):
+            for order_id, price, volume in order_book.get_orders(side):
+                rows.append([next(ids), snapshot_id, date_time, str(order_id), trade_side, price, volume])
+
+        for db_client in self.db_clients:
+            if self.is_allowed_instmt_record(db_client):
+                for i in range(0, len(rows)):
+                    self.dispatch_insert(db_client, table=table_name,
+                                         columns=self.get_l3_snapshot_columns(),
+                                         types=self.get_l3_snapshot_types(),
+                                         values=rows[i],
+                                         primary_key_index=[0],
+                                         is_commit=(i == len(rows) - 1))
+
     def on_open_handler(self, instmt, ws):
         """
         Socket on open handler
@@ -272,10 +302,12 @@ class ExchGwLuno(ExchangeGateway):
 
         keys = message.keys()
 
+        version = instmt.get_l2_depth().version
+
         if "bids" in keys:
-            self.order_book = self.api_socket.parse_l2_depth(instmt, message)
+            self.api_socket.parse_l2_depth(instmt, message)
             # Insert only if the first 5 levels are different
-            if instmt.get_l2_depth().is_diff(instmt.get_prev_l2_depth()):
+            if instmt.get_l2_depth().version != version:
                 instmt.incr_order_book_id()
                 self.insert_order_book(instmt)
 
@@ -284,7 +316,7 @@ class ExchGwLuno(ExchangeGateway):
                 message['create_update'].update({"timestamp": message['timestamp']})
                 self.api_socket.parse_l2_depth(instmt, message['create_update'])
                 # Insert only if the first 5 levels are different
-                if instmt.get_l2_depth().is_diff(instmt.get_prev_l2_depth()):
+                if instmt.get_l2_depth().version != version:
                     instmt.incr_order_book_id()
                     self.insert_order_book(instmt)
 
@@ -292,7 +324,7 @@ class ExchGwLuno(ExchangeGateway):
                 message['delete_update'].update({"timestamp": message['timestamp']})
                 self.api_socket.parse_l2_depth(instmt, message['delete_update'])
                 # Insert only if the first 5 levels are different
-                if instmt.get_l2_depth().is_diff(instmt.get_prev_l2_depth()):
+                if instmt.get_l2_depth().version != version:
                     instmt.incr_order_book_id()
                     self.insert_order_book(instmt)
 
@@ -308,6 +340,15 @@ class ExchGwLuno(ExchangeGateway):
 
         else:
             Logger.error(self.__class__.__name__, "Unrecognised message:\n" + json.dumps(message))
+            return
+
+        # Publish the full order book at the configured interval
+        interval = self.get_l3_snapshot_interval(instmt)
+        if interval > 0:
+            now = time.time()
+            if now >= self.l3_snapshot_time.get(instmt.get_instmt_name(), 0):
+                self.l3_snapshot_time[instmt.get_instmt_name()] = now + interval
+                self.insert_l3_snapshot(instmt)
 
     def start(self, instmt):
         """
@@ -317,6 +358,7 @@ class ExchGwLuno(ExchangeGateway):
         """
         instmt.set_l2_depth(L2Depth(10))
         instmt.set_prev_l2_depth(L2Depth(10))
+        instmt.set_order_book(OrderBook())
         instmt.set_instmt_snapshot_table_name(self.get_instmt_snapshot_table_name(instmt.get_exchange_name(),
                                                                                   instmt.get_instmt_name()))
         self.init_instmt_snapshot_table(instmt)
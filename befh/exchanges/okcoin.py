@@ -2,7 +2,7 @@ from befh.ws_api_socket import WebSocketApiClient
 from befh.market_data import L2Depth, Trade
 from befh.exchanges.gateway import ExchangeGateway
 from befh.instrument import Instrument
-from befh.util import Logger
+from befh.util import Logger, Timestamp
 import time
 import threading
 import json
@@ -59,7 +59,7 @@ class ExchGwOkCoinWs(WebSocketApiClient):
 
             # Date time
             timestamp = float(raw[cls.get_order_book_timestamp_field_name()])/1000.0
-            l2_depth.date_time = datetime.utcfromtimestamp(timestamp).strftime("%Y%m%d %H:%M:%S.%f")
+            l2_depth.date_time = Timestamp.from_seconds(timestamp)
 
             # Bids
             bids = raw[cls.get_bids_field_name()]
@@ -108,7 +108,7 @@ class ExchGwOkCoinWs(WebSocketApiClient):
         if trade_date > now:
             trade_date = trade_date - timedelta(1)
 
-        trade.date_time = trade_date.astimezone(pytz.UTC)
+        trade.date_time = Timestamp.from_datetime(trade_date)
 
         trade.trade_id = trade_id + timestamp
         trade.trade_price = trade_price
@@ -191,11 +191,11 @@ class ExchGwOkCoin(ExchangeGateway):
                 if 'data' in keys:
                     if message['channel'] == instmt.get_order_book_channel_id():
                         data = message['data']
-                        instmt.set_prev_l2_depth(instmt.get_l2_depth().copy())
+                        version = instmt.get_l2_depth().version
                         self.api_socket.parse_l2_depth(instmt, data)
 
                         # Insert only if the first 5 levels are different
-                        if instmt.get_l2_depth().is_diff(instmt.get_prev_l2_depth()):
+                        if instmt.get_l2_depth().version != version:
                             instmt.incr_order_book_id()
                             self.insert_order_book(instmt)
 
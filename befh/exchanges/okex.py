@@ -2,7 +2,7 @@ from befh.ws_api_socket import WebSocketApiClient
 from befh.market_data import L2Depth, Trade
 from befh.exchanges.gateway import ExchangeGateway
 from befh.instrument import Instrument
-from befh.util import Logger
+from befh.util import Logger, Timestamp
 from befh.clients.sql_template import SqlClientTemplate
 import time
 import threading
@@ -61,7 +61,7 @@ class ExchGwApiOkexWs(WebSocketApiClient):
 
             # Date time
             timestamp = raw['timestamp']
-            l2_depth.date_time = datetime.utcfromtimestamp(timestamp/1000.0).strftime("%Y%m%d %H:%M:%S.%f")
+            l2_depth.date_time = Timestamp.from_milliseconds(timestamp)
 
             # Bids
             bids = raw[cls.get_bids_field_name()]
@@ -109,7 +109,7 @@ class ExchGwApiOkexWs(WebSocketApiClient):
             if trade_date > now:
                 trade_date = trade_date - timedelta(1)
 
-            trade.date_time = trade_date.astimezone(pytz.UTC).strftime("%Y%m%d %H:%M:%S.%f")
+            trade.date_time = Timestamp.from_datetime(trade_date)
 
             # Buy = 0
             # Side = 1
@@ -182,9 +182,9 @@ class ExchGwOkex(ExchangeGateway):
                 channel = item['channel']
 
                 if channel == instmt.get_order_book_channel_id():
-                    instmt.set_prev_l2_depth(instmt.get_l2_depth().copy())
+                    version = instmt.get_l2_depth().version
                     self.api_socket.parse_l2_depth(instmt, item['data'])
-                    if instmt.get_l2_depth().is_diff(instmt.get_prev_l2_depth()):
+                    if instmt.get_l2_depth().version != version:
                         instmt.incr_order_book_id()
                         self.insert_order_book(instmt)
                 elif channel == instmt.get_trades_channel_id():
@@ -1,11 +1,10 @@
 from befh.restful_api_socket import RESTfulApiSocket
 from befh.exchanges.gateway import ExchangeGateway
 from befh.market_data import L2Depth, Trade
-from befh.util import Logger
+from befh.util import Logger, Timestamp
 from befh.instrument import Instrument
 from befh.clients.sql_template import SqlClientTemplate
 from functools import partial
-from datetime import datetime
 import threading
 import time
 
@@ -75,7 +74,7 @@ class ExchGwApiWex(RESTfulApiSocket):
            cls.get_asks_field_name() in keys:
 
             # No Date time information, has update id only
-            l2_depth.date_time = datetime.utcnow().strftime("%Y%m%d %H:%M:%S.%f")
+            l2_depth.date_time = Timestamp.now()
 
             # Bids
             bids = raw[cls.get_bids_field_name()]
@@ -113,7 +112,7 @@ class ExchGwApiWex(RESTfulApiSocket):
            cls.get_trade_volume_field_name() in keys:
             # Date time
             date_time = float(raw[cls.get_trades_timestamp_field_name()])
-            trade.date_time = datetime.utcfromtimestamp(date_time).strftime('%Y%m%d %H:%M:%S.%f')
+            trade.date_time = Timestamp.from_seconds(date_time)
             # Trade side
             #trade.trade_side = 1
             trade.trade_side = Trade.parse_side(raw[cls.get_trade_side_field_name()])
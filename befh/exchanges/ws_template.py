@@ -3,12 +3,11 @@ from befh.market_data import L2Depth, Trade
 from befh.exchanges.gateway import ExchangeGateway
 from befh.instrument import Instrument
 from befh.clients.sql_template import SqlClientTemplate
-from befh.util import Logger
+from befh.util import Logger, Timestamp
 import time
 import threading
 import json
 from functools import partial
-from datetime import datetime
 
 
 class ExchGwApiTemplate(WebSocketApiClient):
@@ -80,8 +79,7 @@ class ExchGwApiTemplate(WebSocketApiClient):
 
             # Date time
             timestamp = raw[cls.get_order_book_timestamp_field_name()]
-            timestamp = timestamp.replace('T', ' ').replace('Z', '').replace('-' , '')
-            l2_depth.date_time = timestamp
+            l2_depth.date_time = Timestamp.parse(timestamp, "%Y-%m-%dT%H:%M:%S.%fZ")
 
             # Bids
             bids = raw[cls.get_bids_field_name()]
@@ -121,8 +119,7 @@ class ExchGwApiTemplate(WebSocketApiClient):
 
             # Date time
             timestamp = raw[cls.get_trades_timestamp_field_name()]
-            timestamp = timestamp.replace('T', ' ').replace('Z', '').replace('-' , '')
-            trade.date_time = timestamp
+            trade.date_time = Timestamp.parse(timestamp, "%Y-%m-%dT%H:%M:%S.%fZ")
 
             # Trade side
             trade.trade_side = Trade.parse_side(raw[cls.get_trade_side_field_name()])
@@ -211,9 +208,9 @@ class ExchGwTemplate(ExchangeGateway):
             elif message['table'] == 'orderBook10':
                 for data in message['data']:
                     if data["symbol"] == instmt.get_instmt_code():
-                        instmt.set_prev_l2_depth(instmt.get_l2_depth().copy())
+                        version = instmt.get_l2_depth().version
                         self.api_socket.parse_l2_depth(instmt, data)
-                        if instmt.get_l2_depth().is_diff(instmt.get_prev_l2_depth()):
+                        if instmt.get_l2_depth().version != version:
                             instmt.incr_order_book_id()
                             self.insert_order_book(instmt)
             else:
@@ -17,6 +17,7 @@ class Instrument(object):
         self.exchange_name = exchange_name
         self.instmt_name = instmt_name
         self.instmt_code = instmt_code
+        self.param = param
         self.instmt_snapshot_table_name = ''
         self.order_book_id = 0
         self.trade_id = 0
@@ -28,8 +29,7 @@ class Instrument(object):
         self.last_trade = None
         self.order_book_channel_id = ''
         self.trades_channel_id = ''
-        self.realtime_order_book_prices = [{}, {}] # Only for BitMEX to use
-        self.realtime_order_book_ids = [{}, {}] # Only for BitMEX to use
+        self.order_book = None
 
     def copy(self, obj):
         """
@@ -38,6 +38,7 @@ class Instrument(object):
         self.exchange_name = obj.exchange_name
         self.instmt_name = obj.instmt_name
         self.instmt_code = obj.instmt_code
+        self.param = obj.param
         self.instmt_snapshot_table_name = obj.instmt_snapshot_table_name
         self.order_book_id = obj.order_book_id
         self.trade_id = obj.trade_id
@@ -49,10 +50,7 @@ class Instrument(object):
         self.last_trade = obj.last_trade
         self.order_book_channel_id = obj.order_book_channel_id
         self.trades_channel_id = obj.trades_channel_id
-        self.realtime_order_book_prices = copy.deepcopy(
-            obj.realtime_order_book_prices)
-        self.realtime_order_book_ids = copy.deepcopy(
-            obj.realtime_order_book_ids)            
+        self.order_book = copy.deepcopy(obj.order_book)
 
     def get_exchange_name(self):
         return self.exchange_name
@@ -63,6 +61,9 @@ class Instrument(object):
     def get_instmt_code(self):
         return self.instmt_code
 
+    def get_param(self, name, default=None):
+        return self.param.get(name, default)
+
     def get_instmt_trades_table_name(self):
         return self.instmt_trades_table_name
 
@@ -93,6 +94,9 @@ class Instrument(object):
     def get_last_trade(self):
         return self.last_trade
 
+    def get_order_book(self):
+        return self.order_book
+
     def get_order_book_channel_id(self):
         return self.order_book_channel_id
 
@@ -134,6 +138,9 @@ class Instrument(object):
     def set_last_trade(self, trade):
         self.last_trade = trade
 
+    def set_order_book(self, order_book):
+        self.order_book = order_book
+
     def set_order_book_channel_id(self, order_book_channel_id):
         self.order_book_channel_id = order_book_channel_id
         
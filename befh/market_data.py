@@ -1,5 +1,8 @@
 #!/bin/python
+from befh.util import Timestamp
 from datetime import datetime
+from array import array
+import struct
 import copy
 
 
@@ -7,6 +10,8 @@ class MarketDataBase:
     """
     Abstract class of a market data
     """
+    __slots__ = []
+
     class Side:
         NONE = 0
         BUY = 1
@@ -54,20 +59,217 @@ class MarketDataBase:
         pass
 
 
+class DepthLevel(object):
+    """
+    Price level view on the arrays of DepthLevels
+    """
+    __slots__ = ['levels', 'index']
+
+    def __init__(self, levels, index):
+        """
+        Constructor
+        :param levels: DepthLevels
+        :param index: Level index
+        """
+        self.levels = levels
+        self.index = index
+
+    @property
+    def price(self):
+        return self.levels.prices[self.index]
+
+    @price.setter
+    def price(self, value):
+        self.levels.set_value(self.levels.prices, self.index, value)
+
+    @property
+    def volume(self):
+        return self.levels.volumes[self.index]
+
+    @volume.setter
+    def volume(self, value):
+        self.levels.set_value(self.levels.volumes, self.index, value)
+
+    @property
+    def count(self):
+        return self.levels.counts[self.index]
+
+    @count.setter
+    def count(self, value):
+        self.levels.counts[self.index] = value
+
+    def copy(self):
+        """
+        Copy the level into a standalone Depth
+        """
+        return MarketDataBase.Depth(price=self.price, count=self.count, volume=self.volume)
+
+
+class DepthLevels(object):
+    """
+    One side of the L2 price depth. Prices, volumes and counts are kept in
+    contiguous double arrays, so that copying and comparing the levels are
+    done in C instead of on a list of objects.
+
+    The version is incremented whenever the price or volume of the top
+    levels changes, so that callers can detect a change of the top levels
+    without keeping a copy of the previous depth.
+    """
+    __slots__ = ['prices', 'volumes', 'counts', 'views', 'version']
+
+    # Number of top levels tracked by the version
+    TRACKED_LEVELS = 5
+
+    def __init__(self, depth=0):
+        """
+        Constructor
+        :param depth: Number of levels
+        """
+        zeros = bytes(8 * depth)
+        self.prices = array('d', zeros)
+        self.volumes = array('d', zeros)
+        self.counts = array('d', zeros)
+        self.views = []
+        self.version = 0
+
+    def __len__(self):
+        return len(self.prices)
+
+    def __iter__(self):
+        for i in range(0, len(self.prices)):
+            yield self[i]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self.prices)))]
+
+        length = len(self.prices)
+        if index < 0:
+            index += length
+        if index < 0 or index >= length:
+            raise IndexError("Depth level index (%d) out of range" % index)
+
+        views = self.views
+        while len(views) <= index:
+            views.append(DepthLevel(self, len(views)))
+        return views[index]
+
+    def __setitem__(self, index, depth):
+        level = self[index]
+        level.price = depth.price
+        level.volume = depth.volume
+        level.count = depth.count
+
+    def __delitem__(self, index):
+        start = index.indices(len(self.prices))[0] if isinstance(index, slice) else index
+        if start < 0:
+            start += len(self.prices)
+        if start < min(self.TRACKED_LEVELS, len(self.prices)):
+            self.version += 1
+
+        del self.prices[index]
+        del self.volumes[index]
+        del self.counts[index]
+        del self.views[len(self.prices):]
+
+    def append(self, depth):
+        """
+        Append a level
+        :param depth: Depth
+        """
+        if len(self.prices) < self.TRACKED_LEVELS:
+            self.version += 1
+
+        self.prices.append(depth.price)
+        self.volumes.append(depth.volume)
+        self.counts.append(depth.count)
+
+    def sort(self, reverse=False):
+        """
+        Sort the levels by price
+        :param reverse: True for descending order
+        """
+        prices = self.prices
+        volumes = self.volumes
+        order = sorted(range(0, len(prices)), key=prices.__getitem__, reverse=reverse)
+        self.prices = array('d', [prices[i] for i in order])
+        self.volumes = array('d', [volumes[i] for i in order])
+        self.counts = array('d', [self.counts[i] for i in order])
+
+        top = self.TRACKED_LEVELS
+        if self.prices[0:top] != prices[0:top] or \
+           self.volumes[0:top] != volumes[0:top]:
+            self.version += 1
+
+    def set_value(self, values, index, value):
+        """
+        Set the price or volume of a level
+        :param values: Prices or volumes array
+        :param index: Level index
+        :param value: New value
+        """
+        if index < self.TRACKED_LEVELS and values[index] != value:
+            self.version += 1
+        values[index] = value
+
+    def assign(self, prices, volumes, counts):
+        """
+        Overwrite the levels from the top. The levels not given are reset
+        to zero while the number of levels is unchanged.
+        :param prices: Array of prices
+        :param volumes: Array of volumes
+        :param counts: Array of counts
+        """
+        length = len(self.prices)
+        n = min(len(prices), length)
+        if n < length:
+            zeros = array('d', bytes(8 * (length - n)))
+            prices = prices[0:n] + zeros
+            volumes = volumes[0:n] + zeros
+            counts = counts[0:n] + zeros
+        else:
+            prices = prices[0:n]
+            volumes = volumes[0:n]
+            counts = counts[0:n]
+
+        top = self.TRACKED_LEVELS
+        if self.prices[0:top] != prices[0:top] or \
+           self.volumes[0:top] != volumes[0:top]:
+            self.version += 1
+
+        self.prices = prices
+        self.volumes = volumes
+        self.counts = counts
+
+    def copy(self):
+        """
+        Copy
+        """
+        ret = DepthLevels()
+        ret.prices = self.prices[:]
+        ret.volumes = self.volumes[:]
+        ret.counts = self.counts[:]
+        ret.version = self.version
+        return ret
+
+
 class L2Depth(MarketDataBase):
     """
     L2 price depth. Container of date, time, bid and ask up to 5 levels
     """
+    __slots__ = ['date_time', 'depth', 'bids', 'asks']
+
     def __init__(self, depth=5):
         """
         Constructor
         :param depth: Number of depth
         """
         MarketDataBase.__init__(self)
-        self.date_time = datetime(2000, 1, 1, 0, 0, 0).strftime("%Y%m%d %H:%M:%S.%f")
+        # Microseconds since epoch, formatted by the database clients
+        self.date_time = Timestamp.from_datetime(datetime(2000, 1, 1, 0, 0, 0))
         self.depth = depth
-        self.bids = [MarketDataBase.Depth() for i in range(0, self.depth)]
-        self.asks = [MarketDataBase.Depth() for i in range(0, self.depth)]
+        self.bids = DepthLevels(depth)
+        self.asks = DepthLevels(depth)
 
     @staticmethod
     def columns():
@@ -93,61 +295,59 @@ class L2Depth(MarketDataBase):
         """
         Return values in a list
         """
-        if self.depth == 5:
-            return [self.date_time] + \
-                   [b.price for b in self.bids] + \
-                   [a.price for a in self.asks] + \
-                   [b.volume for b in self.bids] + \
-                   [a.volume for a in self.asks]
-        else:
-            return [self.date_time] + \
-                   [b.price for b in self.bids[0:5]] + \
-                   [a.price for a in self.asks[0:5]] + \
-                   [b.volume for b in self.bids[0:5]] + \
-                   [a.volume for a in self.asks[0:5]]
+        return [self.date_time] + \
+               self.bids.prices[0:5].tolist() + \
+               self.asks.prices[0:5].tolist() + \
+               self.bids.volumes[0:5].tolist() + \
+               self.asks.volumes[0:5].tolist()
 
     def sort_bids(self):
         """
         Sorting bids
         :return:
         """
-        self.bids.sort(key=lambda x:x.price, reverse=True)
+        self.bids.sort(reverse=True)
         if len(self.bids) > self.depth:
-            self.bids = self.bids[0:self.depth]
+            del self.bids[self.depth:]
 
     def sort_asks(self):
         """
         Sorting bids
         :return:
         """
-        self.asks.sort(key=lambda x:x.price)
+        self.asks.sort()
         if len(self.asks) > self.depth:
-            self.asks = self.asks[0:self.depth]
+            del self.asks[self.depth:]
 
     def copy(self):
         """
         Copy
         """
-        ret = L2Depth(depth=self.depth)
+        ret = L2Depth.__new__(L2Depth)
         ret.date_time = self.date_time
-        ret.bids = [e.copy() for e in self.bids]
-        ret.asks = [e.copy() for e in self.asks]
+        ret.depth = self.depth
+        ret.bids = self.bids.copy()
+        ret.asks = self.asks.copy()
         return ret
 
+    @property
+    def version(self):
+        """
+        Version of the first 5 price depth. It changes whenever any of
+        their prices or volumes is modified.
+        """
+        return self.bids.version + self.asks.version
+
     def is_diff(self, l2_depth):
         """
         Compare the first 5 price depth
         :param l2_depth: Another L2Depth object
         :return: True if they are different
         """
-        for i in range(0, 5):
-            if abs(self.bids[i].price - l2_depth.bids[i].price) > 1e-09 or \
-               abs(self.bids[i].volume - l2_depth.bids[i].volume) > 1e-09:
-                return True
-            elif abs(self.asks[i].price - l2_depth.asks[i].price) > 1e-09 or \
-                abs(self.asks[i].volume - l2_depth.asks[i].volume) > 1e-09:
-                return True
-        return False
+        return self.bids.prices[0:5] != l2_depth.bids.prices[0:5] or \
+               self.bids.volumes[0:5] != l2_depth.bids.volumes[0:5] or \
+               self.asks.prices[0:5] != l2_depth.asks.prices[0:5] or \
+               self.asks.volumes[0:5] != l2_depth.asks.volumes[0:5]
 
 class Trade(MarketDataBase):
     """
@@ -161,7 +361,8 @@ class Trade(MarketDataBase):
         :param default_format: Default date time format
         """
         MarketDataBase.__init__(self)
-        self.date_time = datetime(2000, 1, 1, 0, 0, 0).strftime("%Y%m%d %H:%M:%S.%f")
+        # Microseconds since epoch, formatted by the database clients
+        self.date_time = Timestamp.from_datetime(datetime(2000, 1, 1, 0, 0, 0))
         self.trade_id = ''
         self.trade_price = 0.0
         self.trade_volume = 0.0
@@ -200,6 +401,14 @@ class Snapshot(MarketDataBase):
         ORDER_BOOK = 1
         TRADES = 2
 
+    # Packed binary layout. The version is increased whenever the layout changes.
+    # Header: version, exchange name length, instrument name length
+    # Body: trade price and volume, 20 depth prices and volumes, order book and trades
+    #       timestamps in microseconds, update type
+    PACKED_VERSION = 1
+    PACKED_HEADER = struct.Struct('<BBB')
+    PACKED_BODY = struct.Struct('<22dqqB')
+
     def __init__(self, exchange, instmt_name):
         """
         Constructor
@@ -256,9 +465,42 @@ class Snapshot(MarketDataBase):
         return ([exchange_name] if exchange_name else []) + \
                ([instmt_name] if instmt_name else []) + \
                [last_trade.trade_price, last_trade.trade_volume] + \
-               [b.price for b in l2_depth.bids[0:5]] + \
-               [a.price for a in l2_depth.asks[0:5]] + \
-               [b.volume for b in l2_depth.bids[0:5]] + \
-               [a.volume for a in l2_depth.asks[0:5]] + \
+               l2_depth.bids.prices[0:5].tolist() + \
+               l2_depth.asks.prices[0:5].tolist() + \
+               l2_depth.bids.volumes[0:5].tolist() + \
+               l2_depth.asks.volumes[0:5].tolist() + \
                [l2_depth.date_time, last_trade.date_time, update_type]
+
+    @staticmethod
+    def pack(values):
+        """
+        Pack the values into bytes
+        :param values: Value array in the order of Snapshot.columns()
+        :return: Packed bytes
+        """
+        exchange = values[0].encode('utf-8')
+        instmt = values[1].encode('utf-8')
+        date_times = [v if isinstance(v, int) else Timestamp.parse(v) for v in values[24:26]]
+        return Snapshot.PACKED_HEADER.pack(Snapshot.PACKED_VERSION, len(exchange), len(instmt)) + \
+               exchange + instmt + \
+               Snapshot.PACKED_BODY.pack(*(values[2:24] + date_times + [values[26]]))
+
+    @staticmethod
+    def unpack(data):
+        """
+        Unpack the bytes packed by Snapshot.pack
+        :param data: Packed bytes
+        :return: Value array in the order of Snapshot.columns(). The timestamps
+                 are in microseconds.
+        """
+        version, exchange_len, instmt_len = Snapshot.PACKED_HEADER.unpack_from(data)
+        if version != Snapshot.PACKED_VERSION:
+            raise Exception("Unsupported packed snapshot version (%d)" % version)
+
+        offset = Snapshot.PACKED_HEADER.size
+        exchange = bytes(data[offset:offset + exchange_len]).decode('utf-8')
+        offset += exchange_len
+        instmt = bytes(data[offset:offset + instmt_len]).decode('utf-8')
+        offset += instmt_len
+        return [exchange, instmt] + list(Snapshot.PACKED_BODY.unpack_from(data, offset))
         
@@ -0,0 +1,296 @@
+from array import array
+from bisect import bisect_left
+import zlib
+
+
+class OrderBook(object):
+    """
+    Incremental order book shared by the gateways receiving order book
+    deltas.
+
+    Each side keeps its prices in a sorted ladder together with a map of
+    price levels holding the aggregated volume and order count. An update
+    of an existing level is an O(1) map lookup. A new or deleted level is
+    located by an O(log n) binary search, and inserted into or removed from
+    the ladder by an O(n) list shift, which is a memmove of a few hundred
+    levels in practice. Reading the top k levels costs O(k), instead of
+    sorting the whole book on every delta message.
+
+    Price level feeds (e.g. Bitfinex) use apply_snapshot and apply_delta,
+    while order level feeds (e.g. BitMEX and Luno) use apply_order_snapshot
+    and apply_order_delta.
+    """
+    class Side:
+        BID = 0
+        ASK = 1
+
+    class Action:
+        INSERT = 1
+        UPDATE = 2
+        DELETE = 3
+
+    class PriceLevel(object):
+        """
+        Aggregated price level
+        """
+        __slots__ = ['price', 'volume', 'count']
+
+        def __init__(self, price, volume=0.0, count=0):
+            """
+            Constructor
+            :param price: Price
+            :param volume: Aggregated volume of the level
+            :param count: Number of orders in the level
+            """
+            self.price = price
+            self.volume = volume
+            self.count = count
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        # Prices of both sides are sorted in ascending order. The best bid
+        # is therefore the last element of the bid ladder.
+        self.prices = [[], []]
+        self.levels = [{}, {}]
+        # Order id -> [side, price, volume], only for order level feeds
+        self.orders = {}
+
+    def clear(self):
+        """
+        Remove all the price levels and orders
+        """
+        self.prices = [[], []]
+        self.levels = [{}, {}]
+        self.orders = {}
+
+    def apply_snapshot(self, bids, asks):
+        """
+        Reset the book with price levels
+        :param bids: Iterable of (price, volume, count) of bids
+        :param asks: Iterable of (price, volume, count) of asks
+        """
+        self.clear()
+        for side, levels in ((OrderBook.Side.BID, bids), (OrderBook.Side.ASK, asks)):
+            levels = sorted(levels)
+            self.prices[side] = [e[0] for e in levels]
+            self.levels[side] = dict((e[0], OrderBook.PriceLevel(*e)) for e in levels)
+            if len(self.levels[side]) != len(self.prices[side]):
+                raise Exception("Duplicated prices in the order book snapshot.")
+
+    def apply_delta(self, side, price, volume, count=1):
+        """
+        Apply a price level delta. The level is deleted if the volume or
+        the count is zero.
+        :param side: OrderBook.Side
+        :param price: Price
+        :param volume: Aggregated volume
+        :param count: Number of orders
+        :return: False if the deleted level is not found
+        """
+        if volume == 0 or count == 0:
+            return self.delete_level(side, price)
+
+        self.set_level(side, price, volume, count)
+        return True
+
+    def apply_order_snapshot(self, orders):
+        """
+        Reset the book with orders
+        :param orders: Iterable of (side, order id, price, volume)
+        """
+        self.clear()
+        for side, order_id, price, volume in orders:
+            self.add_order(side, order_id, price, volume)
+
+    def apply_order_delta(self, action, order_id, side=None, price=None, volume=None):
+        """
+        Apply an order delta
+        :param action: OrderBook.Action
+        :param order_id: Order id
+        :param side: OrderBook.Side, only required on insertion
+        :param price: Price, only required on insertion
+        :param volume: Volume, not required on deletion
+        :return: False if the updated or deleted order is not found
+        """
+        if action == OrderBook.Action.INSERT:
+            self.add_order(side, order_id, price, volume)
+            return True
+        elif action == OrderBook.Action.UPDATE:
+            return self.update_order(order_id, volume)
+        elif action == OrderBook.Action.DELETE:
+            return self.delete_order(order_id)
+        else:
+            raise Exception("Unknown order book action (%s)" % action)
+
+    def get_level(self, side, price):
+        """
+        Get the price level
+        :param side: OrderBook.Side
+        :param price: Price
+        :return: PriceLevel, or None if the price does not exist
+        """
+        return self.levels[side].get(price)
+
+    def set_level(self, side, price, volume, count=0):
+        """
+        Insert or replace an aggregated price level
+        :param side: OrderBook.Side
+        :param price: Price
+        :param volume: Aggregated volume
+        :param count: Number of orders
+        """
+        level = self.levels[side].get(price)
+        if level is None:
+            prices = self.prices[side]
+            prices.insert(bisect_left(prices, price), price)
+            self.levels[side][price] = OrderBook.PriceLevel(price, volume, count)
+        else:
+            level.volume = volume
+            level.count = count
+
+    def delete_level(self, side, price):
+        """
+        Delete a price level
+        :param side: OrderBook.Side
+        :param price: Price
+        :return: True if the level is found
+        """
+        if self.levels[side].pop(price, None) is None:
+            return False
+
+        prices = self.prices[side]
+        del prices[bisect_left(prices, price)]
+        return True
+
+    def add_order(self, side, order_id, price, volume):
+        """
+        Add an order into the book. An existing order with the same id
+        is replaced.
+        :param side: OrderBook.Side
+        :param order_id: Order id
+        :param price: Price
+        :param volume: Volume
+        """
+        if order_id in self.orders:
+            self.delete_order(order_id)
+
+        self.orders[order_id] = [side, price, volume]
+        level = self.levels[side].get(price)
+        if level is None:
+            self.set_level(side, price, volume, 1)
+        else:
+            level.volume += volume
+            level.count += 1
+
+    def update_order(self, order_id, volume):
+        """
+        Update the volume of an existing order
+        :param order_id: Order id
+        :param volume: New volume
+        :return: True if the order is found
+        """
+        order = self.orders.get(order_id)
+        if order is None:
+            return False
+
+        side, price, prev_volume = order
+        order[2] = volume
+        self.levels[side][price].volume += volume - prev_volume
+        return True
+
+    def delete_order(self, order_id):
+        """
+        Delete an existing order
+        :param order_id: Order id
+        :return: True if the order is found
+        """
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return False
+
+        side, price, volume = order
+        level = self.levels[side][price]
+        level.count -= 1
+        if level.count <= 0:
+            self.delete_level(side, price)
+        else:
+            level.volume -= volume
+        return True
+
+    def get_order(self, order_id):
+        """
+        Get an existing order
+        :param order_id: Order id
+        :return: [side, price, volume], or None if the order does not exist
+        """
+        return self.orders.get(order_id)
+
+    def get_orders(self, side):
+        """
+        Get all the orders of a side
+        :param side: OrderBook.Side
+        :return: List of (order id, price, volume), the best price first
+        """
+        orders = [(order_id, e[1], e[2]) for order_id, e in self.orders.items() if e[0] == side]
+        orders.sort(key=lambda x: x[1], reverse=(side == OrderBook.Side.BID))
+        return orders
+
+    def get_top_levels(self, side, k):
+        """
+        Get the best k price levels of a side
+        :param side: OrderBook.Side
+        :param k: Number of levels
+        :return: List of PriceLevel, the best price first
+        """
+        prices = self.prices[side]
+        levels = self.levels[side]
+        if side == OrderBook.Side.BID:
+            return [levels[p] for p in prices[:-k-1:-1]] if k > 0 else []
+        else:
+            return [levels[p] for p in prices[:k]]
+
+    def top(self, k):
+        """
+        Get the best k price levels of both sides
+        :param k: Number of levels
+        :return: Tuple of bid and ask PriceLevel lists
+        """
+        return self.get_top_levels(OrderBook.Side.BID, k), \
+               self.get_top_levels(OrderBook.Side.ASK, k)
+
+    def checksum(self, k=25):
+        """
+        CRC32 checksum of the top k levels, computed on the string of
+        "bid price:bid volume:ask price:ask volume" for each level joined
+        by colons, in the same way as exchanges publishing book checksums.
+        :param k: Number of levels
+        :return: Signed 32 bit checksum
+        """
+        bids, asks = self.top(k)
+        values = []
+        for i in range(0, max(len(bids), len(asks))):
+            if i < len(bids):
+                values += [str(bids[i].price), str(bids[i].volume)]
+            if i < len(asks):
+                values += [str(asks[i].price), str(asks[i].volume)]
+
+        checksum = zlib.crc32(':'.join(values).encode('utf-8'))
+        return checksum - (1 << 32) if checksum >= (1 << 31) else checksum
+
+    def update_l2_depth(self, l2_depth):
+        """
+        Write the top levels of the book into the L2 depth. Unused levels
+        are reset to zero and the depth version is incremented only if the
+        top levels are changed.
+        :param l2_depth: L2Depth
+        """
+        for depths, side in ((l2_depth.bids, OrderBook.Side.BID),
+                             (l2_depth.asks, OrderBook.Side.ASK)):
+            levels = self.get_top_levels(side, len(depths))
+            depths.assign(array('d', [e.price for e in levels]),
+                          array('d', [e.volume for e in levels]),
+                          array('d', [e.count for e in levels]))
+
+        return l2_depth
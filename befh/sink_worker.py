@@ -0,0 +1,252 @@
+#!/bin/python
+from befh.util import Logger
+from collections import deque, namedtuple
+import threading
+import atexit
+import pickle
+import time
+import os
+
+
+class SinkWorker(object):
+    """
+    Asynchronous writer of a database client.
+
+    The gateways enqueue insert events and return immediately, and the worker
+    thread of the client inserts them in order. Each client has its own
+    worker and bounded queue, so a slow database does not hold back the
+    market data threads nor the other clients.
+    """
+    class OverflowPolicy:
+        BLOCK = 'block'
+        DROP_OLDEST = 'drop'
+        SPILL = 'spill'
+
+    # Insert event. The values are not modified after the event is enqueued.
+    InsertEvent = namedtuple('InsertEvent', ['table', 'columns', 'types', 'values', 'primary_key_index',
+                                             'is_orreplace', 'is_commit', 'enqueue_time'])
+
+    # Database client id -> worker, shared by all the gateways
+    workers = dict()
+    workers_lock = threading.Lock()
+
+    # Seconds between the metrics logs
+    metrics_interval = 60
+
+    @classmethod
+    def get_worker(cls, db_client, queue_size, overflow_policy=OverflowPolicy.BLOCK, spill_directory=''):
+        """
+        Get the worker of the database client. The worker is created and
+        started at the first call.
+        :param db_client: Database client
+        :param queue_size: Maximum number of events in the memory queue
+        :param overflow_policy: SinkWorker.OverflowPolicy
+        :param spill_directory: Directory of the spill files
+        :return: SinkWorker
+        """
+        with cls.workers_lock:
+            worker = cls.workers.get(id(db_client))
+            if worker is None:
+                worker = SinkWorker(db_client, queue_size, overflow_policy, spill_directory)
+                worker.start()
+                cls.workers[id(db_client)] = worker
+
+        return worker
+
+    def __init__(self, db_client, queue_size, overflow_policy=OverflowPolicy.BLOCK, spill_directory=''):
+        """
+        Constructor
+        :param db_client: Database client
+        :param queue_size: Maximum number of events in the memory queue
+        :param overflow_policy: SinkWorker.OverflowPolicy
+        :param spill_directory: Directory of the spill files
+        """
+        if overflow_policy not in (SinkWorker.OverflowPolicy.BLOCK,
+                                   SinkWorker.OverflowPolicy.DROP_OLDEST,
+                                   SinkWorker.OverflowPolicy.SPILL):
+            raise Exception("Unknown sink overflow policy (%s)" % overflow_policy)
+
+        self.db_client = db_client
+        self.name = db_client.__class__.__name__
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self.queue = deque()
+        self.condition = threading.Condition()
+        self.thread = None
+        self.is_running = False
+        self.is_writing = False
+
+        # Spill file, used when the memory queue is full
+        self.spill_path = os.path.join(spill_directory or os.getcwd(),
+                                       'befh_spill_%s_%d.pickle' % (self.name.lower(), id(self)))
+        self.spill_writer = None
+        self.spill_reader = None
+        self.spill_count = 0
+
+        # Metrics
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.errors = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def start(self):
+        """
+        Start the worker thread
+        """
+        self.is_running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout=10.0):
+        """
+        Stop the worker after the queued events are inserted
+        :param timeout: Maximum seconds to wait for the queued events
+        """
+        with self.condition:
+            self.is_running = False
+            self.condition.notify_all()
+
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def put(self, table, columns, types, values, primary_key_index=(), is_orreplace=False, is_commit=True):
+        """
+        Enqueue an insertion. The parameters are the same as DatabaseClient.insert.
+        """
+        event = SinkWorker.InsertEvent(table, columns, types, values, primary_key_index,
+                                       is_orreplace, is_commit, time.time())
+        with self.condition:
+            self.enqueued += 1
+            if self.spill_count > 0:
+                # Keep the order until the spill file is drained
+                self.spill(event)
+            elif len(self.queue) >= self.queue_size:
+                if self.overflow_policy == SinkWorker.OverflowPolicy.BLOCK:
+                    while len(self.queue) >= self.queue_size and self.thread.is_alive():
+                        self.condition.wait(1.0)
+                    self.queue.append(event)
+                elif self.overflow_policy == SinkWorker.OverflowPolicy.DROP_OLDEST:
+                    self.queue.popleft()
+                    self.dropped += 1
+                    self.queue.append(event)
+                else:
+                    self.spill(event)
+            else:
+                self.queue.append(event)
+
+            self.condition.notify_all()
+
+    def spill(self, event):
+        """
+        Append the event to the spill file. The condition lock must be
+        acquired by the caller.
+        :param event: InsertEvent
+        """
+        if self.spill_writer is None:
+            self.spill_writer = open(self.spill_path, 'wb')
+            self.spill_reader = open(self.spill_path, 'rb')
+            Logger.info(self.__class__.__name__, "Sink %s queue is full. Spilling to %s." % (self.name, self.spill_path))
+
+        pickle.dump(tuple(event), self.spill_writer, pickle.HIGHEST_PROTOCOL)
+        self.spill_count += 1
+        self.spilled += 1
+
+    def unspill(self):
+        """
+        Move the spilled events back to the memory queue. The condition
+        lock must be acquired by the caller.
+        """
+        self.spill_writer.flush()
+        while self.spill_count > 0 and len(self.queue) < self.queue_size:
+            self.queue.append(SinkWorker.InsertEvent(*pickle.load(self.spill_reader)))
+            self.spill_count -= 1
+
+        if self.spill_count == 0:
+            # Start a new file for the next spill
+            self.spill_writer.close()
+            self.spill_reader.close()
+            self.spill_writer = None
+            self.spill_reader = None
+            os.remove(self.spill_path)
+
+    def run(self):
+        """
+        Insert the queued events until the worker is stopped
+        """
+        last_metrics_time = time.time()
+        while True:
+            with self.condition:
+                while len(self.queue) == 0 and self.spill_count == 0 and self.is_running:
+                    self.condition.wait(1.0)
+                    if time.time() - last_metrics_time > self.metrics_interval:
+                        break
+
+                if len(self.queue) == 0 and self.spill_count > 0:
+                    self.unspill()
+
+                if len(self.queue) == 0 and not self.is_running:
+                    return
+
+                event = self.queue.popleft() if len(self.queue) > 0 else None
+                self.is_writing = event is not None
+                self.condition.notify_all()
+
+            if event is not None:
+                try:
+                    self.db_client.insert(table=event.table,
+                                          columns=event.columns,
+                                          types=event.types,
+                                          values=event.values,
+                                          primary_key_index=event.primary_key_index,
+                                          is_orreplace=event.is_orreplace,
+                                          is_commit=event.is_commit)
+                except Exception as e:
+                    self.errors += 1
+                    Logger.error(self.__class__.__name__, "Sink %s failed to insert into %s.\n%s" %
+                                 (self.name, event.table, e))
+
+                self.last_lag = time.time() - event.enqueue_time
+                self.max_lag = max(self.max_lag, self.last_lag)
+                self.processed += 1
+                self.is_writing = False
+
+            if time.time() - last_metrics_time > self.metrics_interval:
+                Logger.info(self.__class__.__name__, "Sink %s: %s" % (self.name, self.get_metrics()))
+                last_metrics_time = time.time()
+                self.max_lag = 0.0
+
+    def get_metrics(self):
+        """
+        Lag metrics of the sink
+        :return: Dictionary of the metrics
+        """
+        return {'queue': len(self.queue),
+                'spill': self.spill_count,
+                'enqueued': self.enqueued,
+                'processed': self.processed,
+                'dropped': self.dropped,
+                'spilled': self.spilled,
+                'errors': self.errors,
+                'last_lag': self.last_lag,
+                'max_lag': self.max_lag}
+
+    def join(self, timeout=10.0):
+        """
+        Wait until all the enqueued events are inserted
+        :param timeout: Maximum seconds to wait
+        :return: True if all the events are inserted
+        """
+        end_time = time.time() + timeout
+        with self.condition:
+            while len(self.queue) > 0 or self.spill_count > 0 or self.is_writing:
+                remaining = end_time - time.time()
+                if remaining <= 0 or not self.thread.is_alive():
+                    return False
+                self.condition.wait(min(remaining, 0.1))
+
+        return True
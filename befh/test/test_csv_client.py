@@ -0,0 +1,97 @@
+#!/bin/python
+
+import unittest
+import os
+import tempfile
+from befh.clients.csv import FileClient
+from befh.util import Logger
+
+
+class FileClientTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        Logger.init_log()
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db_client = FileClient(dir=self.directory, max_open_files=2, flush_interval=0, flush_size=10,
+                                    index_interval=10)
+        self.columns = ['k', 'v']
+        self.types = ['int', 'text']
+
+    def tearDown(self):
+        self.db_client.close()
+        for file_name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, file_name))
+        os.rmdir(self.directory)
+
+    def read(self, table):
+        with open(os.path.join(self.directory, table + '.csv')) as csvfile:
+            return csvfile.read().splitlines()
+
+    def test_handles(self):
+        for table in ['a', 'b', 'c']:
+            self.db_client.create(table, self.columns, self.types)
+
+        for i in range(0, 5):
+            for table in ['a', 'b', 'c']:
+                self.assertTrue(self.db_client.insert(table, self.columns, self.types, [i, table]))
+
+        # Least recently written files are closed
+        self.assertEqual(list(self.db_client.handles.keys()), ['b', 'c'])
+        self.assertEqual(len(self.read('a')), 6)
+
+        # Rows are buffered until the flush size
+        self.assertEqual(len(self.read('c')), 5)
+        for i in range(5, 13):
+            self.db_client.insert('c', self.columns, self.types, [i, 'c'])
+        self.assertEqual(len(self.read('c')), 5)
+        self.db_client.insert('c', self.columns, self.types, [13, 'c'])
+        self.assertEqual(len(self.read('c')), 15)
+
+        # Select flushes the file
+        self.db_client.insert('b', self.columns, self.types, [5, 'b'])
+        self.assertEqual(len(self.db_client.select('b')), 6)
+
+        self.db_client.close_table('b')
+        self.assertEqual(list(self.db_client.handles.keys()), ['c'])
+        self.assertRaises(Exception, self.db_client.insert, 'd', self.columns, self.types, [0, 'd'])
+
+
+    def test_select(self):
+        columns = ['k', 'date_time', 'v']
+        types = ['int', 'varchar(25)', 'text']
+        self.db_client.create('t', columns, types)
+        for i in range(0, 100):
+            # Times are not in order within each ten rows
+            date_time = 1494028800000000 + ((i // 10) * 10 + 9 - i % 10) * 1000000
+            self.db_client.insert('t', columns, types, [i, date_time, 'a' if i % 3 == 0 else "b'"])
+
+        rows = self.db_client.select('t', columns=['k'], condition="v = 'a' and (k < 10 or k >= 95)")
+        self.assertEqual(rows, [[0], [3], [6], [9], [96], [99]])
+        rows = self.db_client.select('t', columns=['k'], condition="not 50 > k and v != 'a'", limit=3)
+        self.assertEqual(rows, [[50], [52], [53]])
+        rows = self.db_client.select('t', columns=['k', 'v'], condition='v = "b\'"', orderby='k desc', limit=2)
+        self.assertEqual(rows, [[98, "b'"], [97, "b'"]])
+        self.assertRaises(Exception, self.db_client.select, 't', condition="x = 1")
+        self.assertRaises(Exception, self.db_client.select, 't', condition="k = 1 and")
+
+        # Time range is sought by the index
+        self.db_client.close_table('t')
+        condition = "date_time >= '20170506 00:00:50.000000' and date_time < '20170506 00:01:02.000000'"
+        rows = self.db_client.select('t', columns=['k'], condition=condition)
+        self.assertEqual(sorted([e[0] for e in rows]), list(range(50, 60)) + [68, 69])
+        field_names = ['k', 'date_time', 'v']
+        self.assertGreater(self.db_client.get_index_offset('t', field_names,
+                                                           FileClient.Condition(condition, field_names)), 0)
+        self.assertEqual(self.db_client.get_index_offset('t', field_names,
+                                                         FileClient.Condition('k > 1 or ' + condition, field_names)), 0)
+
+        # Index is continued after the file is opened again
+        self.db_client.insert('t', columns, types, [100, 1494028900000000, 'a'])
+        rows = self.db_client.select('t', columns=['k'], condition="date_time > '20170506 00:01:39.000000'")
+        self.assertEqual(rows, [[100]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+#!/bin/python
+
+import unittest
+from datetime import date, datetime
+from befh.exchanges.gateway import ExchangeGateway
+from befh.clients.sqlite import SqliteClient
+from befh.instrument import Instrument
+from befh.market_data import L2Depth, Trade
+from befh.util import Timestamp
+
+
+class ExchangeGatewayTest(unittest.TestCase):
+    def setUp(self):
+        self.db_client = SqliteClient()
+        self.db_client.connect(path=':memory:')
+        ExchangeGateway.init_snapshot_table([self.db_client])
+        self.gateway = ExchangeGateway(None, [self.db_client])
+        self.gateway.date_time = date(2017, 5, 6)
+        self.instmt = Instrument('Test', 'BTCUSD', 'BTCUSD')
+        self.instmt.set_l2_depth(L2Depth(5))
+        self.gateway.init_instmt_snapshot_table(self.instmt)
+        self.gateway.init_instmt_trades_table(self.instmt)
+
+    def tables(self):
+        self.db_client.execute("select name from sqlite_master where type='table'")
+        return sorted([e[0] for e in self.db_client.fetchall()])
+
+    def insert_trade(self, date_time):
+        trade = Trade()
+        trade.date_time = Timestamp.from_datetime(date_time)
+        self.gateway.insert_trade(self.instmt, trade)
+
+    def test_roll_over(self):
+        self.assertEqual(self.gateway.next_day_timestamps['BTCUSD'],
+                         Timestamp.from_datetime(datetime(2017, 5, 7)))
+
+        self.insert_trade(datetime(2017, 5, 6, 23, 59, 59))
+        self.assertEqual(self.instmt.get_instmt_trades_table_name(), 'exch_test_btcusd_trades_20170506')
+
+        self.insert_trade(datetime(2017, 5, 7, 0, 0, 1))
+        self.assertEqual(self.instmt.get_instmt_snapshot_table_name(), 'exch_test_btcusd_snapshot_20170507')
+        self.assertEqual(self.instmt.get_instmt_trades_table_name(), 'exch_test_btcusd_trades_20170507')
+        self.assertEqual(self.gateway.next_day_timestamps['BTCUSD'],
+                         Timestamp.from_datetime(datetime(2017, 5, 8)))
+
+        # A late trade of the previous day does not switch the tables back
+        self.insert_trade(datetime(2017, 5, 6, 23, 59, 59))
+        self.assertEqual(self.instmt.get_instmt_trades_table_name(), 'exch_test_btcusd_trades_20170507')
+        self.assertEqual(len(self.db_client.select('exch_test_btcusd_trades_20170506')), 1)
+        self.assertEqual(len(self.db_client.select('exch_test_btcusd_trades_20170507')), 2)
+
+        # Order book updates roll over the tables as well
+        self.instmt.get_l2_depth().date_time = Timestamp.from_datetime(datetime(2017, 5, 8, 0, 0, 0))
+        self.gateway.insert_order_book(self.instmt)
+        self.assertEqual(self.instmt.get_instmt_snapshot_table_name(), 'exch_test_btcusd_snapshot_20170508')
+        self.assertEqual(len(self.db_client.select('exch_test_btcusd_snapshot_20170508')), 1)
+
+    def test_instmt_ids(self):
+        other_instmt = Instrument('Test', 'ETHUSD', 'ETHUSD')
+        self.gateway.init_instmt_trades_table(other_instmt)
+        self.assertEqual([self.gateway.get_instmt_trades_id(self.instmt) for i in range(0, 3)], [1, 2, 3])
+        self.assertEqual(self.gateway.get_instmt_trades_id(other_instmt), 1)
+        self.assertEqual(self.gateway.get_instmt_snapshot_id(self.instmt), 1)
+
+        # The sequence is initialised from the table of the instrument
+        self.insert_trade(datetime(2017, 5, 6, 1, 0, 0))
+        self.insert_trade(datetime(2017, 5, 6, 2, 0, 0))
+        self.gateway.init_instmt_trades_table(self.instmt)
+        self.gateway.init_instmt_trades_table(other_instmt)
+        self.assertEqual(self.gateway.get_instmt_trades_id(self.instmt), 6)
+        self.assertEqual(self.gateway.get_instmt_trades_id(other_instmt), 1)
+
+    def test_create_instmt_tables(self):
+        self.gateway.create_instmt_tables(self.instmt, date(2017, 5, 7))
+        self.assertEqual(self.tables(), ['exch_test_btcusd_snapshot_20170506',
+                                         'exch_test_btcusd_snapshot_20170507',
+                                         'exch_test_btcusd_trades_20170506',
+                                         'exch_test_btcusd_trades_20170507',
+                                         'exchanges_snapshot'])
+        self.assertEqual(self.instmt.get_instmt_trades_table_name(), 'exch_test_btcusd_trades_20170506')
+
+    def test_roll_over_prepared_tables(self):
+        self.insert_trade(datetime(2017, 5, 6, 23, 59, 0))
+        self.gateway.create_instmt_tables(self.instmt, date(2017, 5, 7))
+
+        # The roll over to the prepared tables does not query the database clients
+        get_max_id = self.gateway.get_max_id
+        self.gateway.get_max_id = None
+        self.insert_trade(datetime(2017, 5, 7, 0, 0, 1))
+        self.gateway.get_max_id = get_max_id
+        self.assertEqual(self.instmt.get_instmt_snapshot_table_name(), 'exch_test_btcusd_snapshot_20170507')
+        self.assertEqual(self.instmt.get_instmt_trades_table_name(), 'exch_test_btcusd_trades_20170507')
+        self.assertEqual(self.gateway.next_day_timestamps['BTCUSD'],
+                         Timestamp.from_datetime(datetime(2017, 5, 8)))
+        self.assertEqual(self.gateway.get_instmt_trades_id(self.instmt), 2)
+        self.assertEqual(self.gateway.next_day_tables, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
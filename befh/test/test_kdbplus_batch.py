@@ -0,0 +1,88 @@
+#!/bin/python
+
+import unittest
+from qpython.qtype import QTIMESTAMP_LIST, QSYMBOL_LIST, QDOUBLE_LIST, QLONG_LIST
+from befh.clients.kdbplus import KdbPlusClient
+from befh.util import Timestamp
+
+
+class RecordingConnection(object):
+    """
+    Kdb+ connection recording the sent messages
+    """
+    def __init__(self):
+        self.messages = []
+
+    def sendSync(self, *args):
+        self.messages.append(('sync',) + args)
+
+    def sendAsync(self, *args):
+        self.messages.append(('async',) + args)
+
+
+class KdbPlusBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.db_client = KdbPlusClient()
+        self.db_client.conn = RecordingConnection()
+        self.columns = ['id', 'date_time', 'trade_id', 'trade_price', 'trade_volume']
+        self.types = ['int', 'varchar(25)', 'text', 'decimal(10,5)', 'decimal(20,8)']
+
+    def test_to_qlist(self):
+        # The list types are stored negative, as the types of the atoms
+        # Nanoseconds since 2000.01.01
+        ret = KdbPlusClient.to_qlist('date_time', 'varchar(25)', [946684800000001, '20000101 00:00:01.000000'])
+        self.assertEqual(ret.meta.qtype, -QTIMESTAMP_LIST)
+        self.assertEqual(ret.tolist(), [1000, 1000000000])
+        ret = KdbPlusClient.to_qlist('time', 'timestamp', [Timestamp.parse('20000102 00:00:00.000000')])
+        self.assertEqual(ret.tolist(), [86400 * 1000000000])
+
+        ret = KdbPlusClient.to_qlist('trade_id', 'text', ['a', 1])
+        self.assertEqual(ret.meta.qtype, -QSYMBOL_LIST)
+        self.assertEqual(ret.tolist(), [b'a', b'1'])
+
+        ret = KdbPlusClient.to_qlist('trade_price', 'decimal(10,5)', [1, 2.5])
+        self.assertEqual(ret.meta.qtype, -QDOUBLE_LIST)
+        self.assertEqual(ret.tolist(), [1.0, 2.5])
+
+        ret = KdbPlusClient.to_qlist('id', 'int', [1, 2])
+        self.assertEqual(ret.meta.qtype, -QLONG_LIST)
+        self.assertEqual(ret.tolist(), [1, 2])
+
+    def insert(self, table, i, is_orreplace=False):
+        self.db_client.insert(table, self.columns, self.types,
+                              [i, 946684800000000 + i, str(i), 1.5 * i, 0.5], is_orreplace=is_orreplace)
+
+    def test_batch_insert(self):
+        self.db_client.set_batch_insert(3, 0)
+        self.insert('trades', 0)
+        self.insert('trades', 1)
+        self.insert('snapshot', 0, True)
+        self.assertEqual(self.db_client.conn.messages, [])
+
+        # Flushed at the batch size
+        self.insert('trades', 2)
+        self.assertEqual(len(self.db_client.conn.messages), 1)
+        mode, function, table, columns, data = self.db_client.conn.messages[0]
+        self.assertEqual((mode, function, table), ('sync', KdbPlusClient.INSERT_FUNCTION, b'trades'))
+        self.assertEqual(columns.tolist(), [c.encode('utf-8') for c in self.columns])
+        self.assertEqual([-e.meta.qtype for e in data],
+                         [QLONG_LIST, QTIMESTAMP_LIST, QSYMBOL_LIST, QDOUBLE_LIST, QDOUBLE_LIST])
+        self.assertEqual(data[0].tolist(), [0, 1, 2])
+        self.assertEqual(data[1].tolist(), [0, 1000, 2000])
+
+        # Upserted rows are flushed by the flush call
+        self.db_client.flush()
+        self.assertEqual(len(self.db_client.conn.messages), 2)
+        mode, function, table, columns, data = self.db_client.conn.messages[1]
+        self.assertEqual((mode, function, table), ('sync', KdbPlusClient.UPSERT_FUNCTION, b'snapshot'))
+        self.assertEqual(data[2].tolist(), [b'0'])
+
+        # Asynchronous messages
+        self.db_client.set_batch_insert(1, 0, True)
+        self.insert('trades', 3)
+        self.assertEqual(self.db_client.conn.messages[2][0], 'async')
+        self.assertEqual(len(self.db_client.buffers), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
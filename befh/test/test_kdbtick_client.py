@@ -0,0 +1,56 @@
+#!/bin/python
+
+import unittest
+from qpython.qtype import QTIMESTAMP_LIST, QSYMBOL_LIST, QDOUBLE_LIST
+from befh.clients.kdbtick import KdbTickerplantClient
+from befh.market_data import Snapshot
+from befh.test.test_kdbplus_batch import RecordingConnection
+
+
+class KdbTickerplantClientTest(unittest.TestCase):
+    def setUp(self):
+        self.db_client = KdbTickerplantClient()
+        self.db_client.conn = RecordingConnection()
+        self.db_client.set_batch_insert(2, 0)
+
+    def insert(self, update_type, price, table='exchanges_snapshot'):
+        values = ['Exch', 'BTCUSD', price, 0.5] + [float(i) for i in range(0, 20)] + \
+                 [946684800000001, 946684800000002, update_type]
+        self.db_client.insert(table, Snapshot.columns(), Snapshot.types(), values)
+
+    def test_schema(self):
+        self.assertEqual(KdbTickerplantClient.schema().split('\n'),
+                         ["trades:([] time:`timestamp$(); sym:`symbol$(); exchange:`symbol$(); " +
+                          "price:`float$(); size:`float$())",
+                          "quotes:([] time:`timestamp$(); sym:`symbol$(); exchange:`symbol$(); " +
+                          '; '.join(c + ":`float$()" for c in KdbTickerplantClient.QUOTES_COLUMNS[3:]) + ")"])
+
+    def test_insert(self):
+        self.insert(Snapshot.UpdateType.TRADES, 1.5)
+        self.insert(Snapshot.UpdateType.ORDER_BOOK, 2.5)
+        self.insert(Snapshot.UpdateType.NONE, 3.5)
+        self.insert(Snapshot.UpdateType.TRADES, 4.5, 'exch_exch_btcusd_snapshot_20000101')
+        self.db_client.insert('exch_exch_btcusd_trades_20000101', ['id', 'date_time'], ['int', 'varchar(25)'],
+                              [1, 946684800000001])
+        self.assertEqual(self.db_client.conn.messages, [])
+
+        # Published at the batch size of the table
+        self.insert(Snapshot.UpdateType.TRADES, 5.5)
+        self.assertEqual(len(self.db_client.conn.messages), 1)
+        mode, function, table, data = self.db_client.conn.messages[0]
+        self.assertEqual((mode, function, table), ('async', '.u.upd', b'trades'))
+        self.assertEqual([-e.meta.qtype for e in data],
+                         [QTIMESTAMP_LIST, QSYMBOL_LIST, QSYMBOL_LIST, QDOUBLE_LIST, QDOUBLE_LIST])
+        self.assertEqual([e.tolist() for e in data],
+                         [[2000, 2000], [b'BTCUSD', b'BTCUSD'], [b'Exch', b'Exch'], [1.5, 5.5], [0.5, 0.5]])
+
+        self.db_client.flush()
+        mode, function, table, data = self.db_client.conn.messages[1]
+        self.assertEqual((mode, function, table), ('async', '.u.upd', b'quotes'))
+        self.assertEqual(len(data), len(KdbTickerplantClient.QUOTES_COLUMNS))
+        self.assertEqual([e.tolist() for e in data[0:5]], [[1000], [b'BTCUSD'], [b'Exch'], [0.0], [1.0]])
+        self.assertEqual(len(self.db_client.conn.messages), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
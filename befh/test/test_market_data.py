@@ -0,0 +1,95 @@
+#!/bin/python
+
+import unittest
+from befh.market_data import L2Depth, Trade, Snapshot
+
+
+class L2DepthTest(unittest.TestCase):
+    def test_levels(self):
+        l2_depth = L2Depth(5)
+        for i in range(0, 5):
+            l2_depth.bids[i].price = 100.0 - i
+            l2_depth.bids[i].volume = i + 1.0
+            l2_depth.asks[i].price = 101.0 + i
+            l2_depth.asks[i].volume = i + 2.0
+        l2_depth.bids[0].volume += 0.5
+
+        self.assertEqual(l2_depth.values()[1:],
+                         [100.0, 99.0, 98.0, 97.0, 96.0,
+                          101.0, 102.0, 103.0, 104.0, 105.0,
+                          1.5, 2.0, 3.0, 4.0, 5.0,
+                          2.0, 3.0, 4.0, 5.0, 6.0])
+        self.assertEqual(len(l2_depth.values()), len(L2Depth.columns()))
+        self.assertEqual(l2_depth.bids[-1].price, 96.0)
+        self.assertEqual([e.price for e in l2_depth.asks[0:2]], [101.0, 102.0])
+
+    def test_copy_and_diff(self):
+        l2_depth = L2Depth(5)
+        l2_depth.bids[0].price = 10.0
+        prev_l2_depth = l2_depth.copy()
+        self.assertFalse(l2_depth.is_diff(prev_l2_depth))
+
+        l2_depth.asks[4].volume = 1.0
+        self.assertTrue(l2_depth.is_diff(prev_l2_depth))
+        self.assertEqual(prev_l2_depth.asks[4].volume, 0.0)
+
+    def test_insert_and_sort(self):
+        l2_depth = L2Depth(2)
+        l2_depth.bids.append(L2Depth.Depth(price=12.0, count=1, volume=1.0))
+        l2_depth.bids[0] = L2Depth.Depth(price=11.0, count=2, volume=2.0)
+        l2_depth.sort_bids()
+        self.assertEqual([e.price for e in l2_depth.bids], [12.0, 11.0])
+        self.assertEqual([e.count for e in l2_depth.bids], [1, 2])
+
+        del l2_depth.bids[0]
+        self.assertEqual(len(l2_depth.bids), 1)
+        self.assertEqual(l2_depth.bids[0].volume, 2.0)
+
+    def test_version(self):
+        l2_depth = L2Depth(10)
+        version = l2_depth.version
+        l2_depth.bids[0].price = 0.0
+        l2_depth.bids[5].volume = 1.0
+        l2_depth.asks[9].volume = 1.0
+        l2_depth.asks[0].count = 1
+        self.assertEqual(l2_depth.version, version)
+
+        l2_depth.bids[4].volume = 1.0
+        self.assertNotEqual(l2_depth.version, version)
+
+        version = l2_depth.version
+        del l2_depth.asks[8]
+        l2_depth.asks.append(L2Depth.Depth(price=-1.0))
+        l2_depth.sort_bids()
+        self.assertEqual(l2_depth.version, version)
+
+        l2_depth.sort_asks()
+        self.assertNotEqual(l2_depth.version, version)
+
+        version = l2_depth.version
+        del l2_depth.bids[0]
+        self.assertNotEqual(l2_depth.version, version)
+
+    def test_snapshot_values(self):
+        l2_depth = L2Depth(10)
+        l2_depth.bids[0].price = 1.0
+        values = Snapshot.values('Exch', 'Instmt', l2_depth, Trade(), Snapshot.UpdateType.ORDER_BOOK)
+        self.assertEqual(len(values), len(Snapshot.columns()))
+        self.assertEqual(values[4], 1.0)
+
+    def test_snapshot_pack(self):
+        l2_depth = L2Depth(5)
+        l2_depth.bids[0].price = 1.5
+        l2_depth.asks[4].volume = 2.5
+        l2_depth.date_time = 1500000000000001
+        trade = Trade()
+        trade.trade_price = 1.25
+        trade.date_time = '20170714 02:40:00.000002'
+        values = Snapshot.values('Exch', 'Instmt', l2_depth, trade, Snapshot.UpdateType.TRADES)
+        data = Snapshot.pack(values)
+        self.assertEqual(Snapshot.unpack(data), values[:24] + [1500000000000001, 1500000000000002, 2])
+        self.assertRaises(Exception, Snapshot.unpack, b'\x02' + data[1:])
+
+
+if __name__ == '__main__':
+    unittest.main()
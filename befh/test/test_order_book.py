@@ -0,0 +1,160 @@
+#!/bin/python
+
+import unittest
+from random import Random
+from befh.order_book import OrderBook
+from befh.market_data import L2Depth
+
+
+class OrderBookTest(unittest.TestCase):
+    def test_orders(self):
+        order_book = OrderBook()
+        order_book.add_order(OrderBook.Side.BID, 1, 100.0, 1.0)
+        order_book.add_order(OrderBook.Side.BID, 2, 101.0, 2.0)
+        order_book.add_order(OrderBook.Side.BID, 3, 100.0, 3.0)
+        order_book.add_order(OrderBook.Side.ASK, 4, 103.0, 4.0)
+        order_book.add_order(OrderBook.Side.ASK, 5, 102.0, 5.0)
+
+        bids = order_book.get_top_levels(OrderBook.Side.BID, 5)
+        self.assertEqual([e.price for e in bids], [101.0, 100.0])
+        self.assertEqual([e.volume for e in bids], [2.0, 4.0])
+        self.assertEqual([e.count for e in bids], [1, 2])
+        asks = order_book.get_top_levels(OrderBook.Side.ASK, 1)
+        self.assertEqual([e.price for e in asks], [102.0])
+
+        # Update
+        self.assertTrue(order_book.update_order(3, 1.5))
+        self.assertEqual(order_book.get_level(OrderBook.Side.BID, 100.0).volume, 2.5)
+        self.assertFalse(order_book.update_order(6, 1.5))
+
+        # Deletion
+        self.assertTrue(order_book.delete_order(2))
+        self.assertIsNone(order_book.get_level(OrderBook.Side.BID, 101.0))
+        self.assertTrue(order_book.delete_order(1))
+        self.assertEqual(order_book.get_level(OrderBook.Side.BID, 100.0).volume, 1.5)
+        self.assertEqual(order_book.get_level(OrderBook.Side.BID, 100.0).count, 1)
+        self.assertFalse(order_book.delete_order(1))
+
+        # Replacement of an existing order id
+        order_book.add_order(OrderBook.Side.ASK, 5, 101.5, 1.0)
+        self.assertIsNone(order_book.get_level(OrderBook.Side.ASK, 102.0))
+        self.assertEqual(order_book.prices[OrderBook.Side.ASK], [101.5, 103.0])
+
+    def test_get_orders(self):
+        order_book = OrderBook()
+        order_book.add_order(OrderBook.Side.BID, 'a', 100.0, 1.0)
+        order_book.add_order(OrderBook.Side.BID, 'b', 101.0, 2.0)
+        order_book.add_order(OrderBook.Side.ASK, 'c', 103.0, 3.0)
+        order_book.add_order(OrderBook.Side.ASK, 'd', 102.0, 4.0)
+        self.assertEqual(order_book.get_orders(OrderBook.Side.BID),
+                         [('b', 101.0, 2.0), ('a', 100.0, 1.0)])
+        self.assertEqual(order_book.get_orders(OrderBook.Side.ASK),
+                         [('d', 102.0, 4.0), ('c', 103.0, 3.0)])
+
+    def test_levels(self):
+        order_book = OrderBook()
+        order_book.set_level(OrderBook.Side.ASK, 10.0, 1.0, 1)
+        order_book.set_level(OrderBook.Side.ASK, 9.0, 2.0, 2)
+        order_book.set_level(OrderBook.Side.ASK, 9.0, 3.0, 1)
+        self.assertEqual(order_book.prices[OrderBook.Side.ASK], [9.0, 10.0])
+        self.assertEqual(order_book.get_level(OrderBook.Side.ASK, 9.0).volume, 3.0)
+        self.assertTrue(order_book.delete_level(OrderBook.Side.ASK, 9.0))
+        self.assertFalse(order_book.delete_level(OrderBook.Side.ASK, 9.0))
+        self.assertEqual(order_book.prices[OrderBook.Side.ASK], [10.0])
+
+    def test_apply_snapshot_and_delta(self):
+        order_book = OrderBook()
+        order_book.apply_snapshot([(100.0, 1.0, 1), (101.0, 2.0, 2)],
+                                  [(103.0, 3.0, 1), (102.0, 4.0, 1)])
+        bids, asks = order_book.top(5)
+        self.assertEqual([(e.price, e.volume, e.count) for e in bids], [(101.0, 2.0, 2), (100.0, 1.0, 1)])
+        self.assertEqual([(e.price, e.volume, e.count) for e in asks], [(102.0, 4.0, 1), (103.0, 3.0, 1)])
+
+        self.assertTrue(order_book.apply_delta(OrderBook.Side.BID, 100.5, 1.0, 1))
+        self.assertTrue(order_book.apply_delta(OrderBook.Side.ASK, 102.0, 0.0, 0))
+        self.assertFalse(order_book.apply_delta(OrderBook.Side.ASK, 102.0, 0.0, 0))
+        bids, asks = order_book.top(1)
+        self.assertEqual(bids[0].price, 101.0)
+        self.assertEqual(asks[0].price, 103.0)
+        self.assertEqual(order_book.prices[OrderBook.Side.BID], [100.0, 100.5, 101.0])
+
+        self.assertRaises(Exception, order_book.apply_snapshot, [(1.0, 1.0), (1.0, 2.0)], [])
+
+    def test_apply_order_snapshot_and_delta(self):
+        order_book = OrderBook()
+        order_book.apply_order_snapshot([(OrderBook.Side.BID, 1, 100.0, 1.0),
+                                         (OrderBook.Side.BID, 2, 100.0, 2.0),
+                                         (OrderBook.Side.ASK, 3, 101.0, 3.0)])
+        self.assertTrue(order_book.apply_order_delta(OrderBook.Action.INSERT, 4, OrderBook.Side.ASK, 101.0, 1.0))
+        self.assertTrue(order_book.apply_order_delta(OrderBook.Action.UPDATE, 1, volume=0.5))
+        self.assertTrue(order_book.apply_order_delta(OrderBook.Action.DELETE, 3))
+        self.assertFalse(order_book.apply_order_delta(OrderBook.Action.DELETE, 3))
+        self.assertRaises(Exception, order_book.apply_order_delta, 0, 1)
+
+        bids, asks = order_book.top(5)
+        self.assertEqual([(e.price, e.volume, e.count) for e in bids], [(100.0, 2.5, 2)])
+        self.assertEqual([(e.price, e.volume, e.count) for e in asks], [(101.0, 1.0, 1)])
+
+        order_book.apply_order_snapshot([])
+        self.assertEqual(order_book.top(5), ([], []))
+
+    def test_checksum(self):
+        order_book = OrderBook()
+        order_book.apply_snapshot([(100, 1), (99, 2)], [(101, 3)])
+        self.assertEqual(order_book.checksum(), 1647913850)
+        self.assertEqual(order_book.checksum(1), -1461454051)
+
+        # Same book built by deltas
+        other = OrderBook()
+        other.apply_delta(OrderBook.Side.ASK, 101, 3)
+        other.apply_delta(OrderBook.Side.BID, 99, 2)
+        other.apply_delta(OrderBook.Side.BID, 98, 2)
+        other.apply_delta(OrderBook.Side.BID, 100, 1)
+        other.apply_delta(OrderBook.Side.BID, 98, 0)
+        self.assertEqual(other.checksum(), order_book.checksum())
+
+    def test_random_deltas(self):
+        random = Random(0)
+        order_book = OrderBook()
+        expected = [{}, {}]
+        for i in range(0, 5000):
+            side = random.randint(0, 1)
+            price = float(random.randint(90, 110))
+            volume = float(random.randint(0, 3))
+            order_book.apply_delta(side, price, volume)
+            if volume == 0:
+                expected[side].pop(price, None)
+            else:
+                expected[side][price] = volume
+
+            if i % 100 == 0:
+                bids, asks = order_book.top(5)
+                self.assertEqual([(e.price, e.volume) for e in bids],
+                                 sorted(expected[OrderBook.Side.BID].items(), reverse=True)[:5])
+                self.assertEqual([(e.price, e.volume) for e in asks],
+                                 sorted(expected[OrderBook.Side.ASK].items())[:5])
+
+    def test_update_l2_depth(self):
+        order_book = OrderBook()
+        for i in range(0, 10):
+            order_book.set_level(OrderBook.Side.BID, 100.0 - i, i + 1.0, 1)
+        order_book.set_level(OrderBook.Side.ASK, 101.0, 1.0, 1)
+
+        l2_depth = order_book.update_l2_depth(L2Depth(5))
+        self.assertEqual([e.price for e in l2_depth.bids], [100.0, 99.0, 98.0, 97.0, 96.0])
+        self.assertEqual([e.volume for e in l2_depth.bids], [1.0, 2.0, 3.0, 4.0, 5.0])
+        self.assertEqual([e.price for e in l2_depth.asks], [101.0, 0.0, 0.0, 0.0, 0.0])
+        self.assertEqual([e.volume for e in l2_depth.asks], [1.0, 0.0, 0.0, 0.0, 0.0])
+
+        # Version is only changed when the top levels are changed
+        version = l2_depth.version
+        order_book.set_level(OrderBook.Side.BID, 50.0, 1.0, 1)
+        order_book.update_l2_depth(l2_depth)
+        self.assertEqual(l2_depth.version, version)
+        order_book.set_level(OrderBook.Side.ASK, 101.0, 2.0, 1)
+        order_book.update_l2_depth(l2_depth)
+        self.assertNotEqual(l2_depth.version, version)
+
+
+if __name__ == '__main__':
+    unittest.main()
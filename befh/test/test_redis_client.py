@@ -0,0 +1,114 @@
+#!/bin/python
+
+import unittest
+import json
+from befh.clients.redis import RedisClient, RedisSnapshotReader
+from befh.market_data import Snapshot
+from befh.util import Timestamp
+
+
+class RecordingConnection(object):
+    """
+    Redis connection recording the commands of the pipelines
+    """
+    class Pipeline(object):
+        def __init__(self, commands):
+            self.commands = commands
+            self.pending = []
+
+        def __getattr__(self, name):
+            return lambda *args: self.pending.append((name,) + args)
+
+        def execute(self):
+            self.commands.append(self.pending)
+
+    def __init__(self):
+        self.commands = []
+
+    def pipeline(self, transaction=True):
+        return RecordingConnection.Pipeline(self.commands)
+
+
+class RedisClientTest(unittest.TestCase):
+    def setUp(self):
+        self.client = RedisClient()
+        self.client.conn = RecordingConnection()
+        self.client.set_batch_insert(5, 0)
+
+    def insert_snapshot(self, instmt, price):
+        values = ['Exch', instmt, price, 0.25] + [float(i) for i in range(0, 20)] + \
+                 [1500000000000001, 1500000000000002, Snapshot.UpdateType.ORDER_BOOK]
+        self.client.insert('exchanges_snapshot', Snapshot.columns(), Snapshot.types(), values)
+
+    def insert_trade(self, price, date_time):
+        self.client.insert('exch_exch_instmt_trades_20170714',
+                           ['id', 'date_time', 'trade_id', 'trade_price', 'trade_volume', 'trade_side'],
+                           ['int', 'varchar(25)', 'text', 'decimal(10,5)', 'decimal(20,8)', 'int'],
+                           [1, date_time, '1', price, 2.0, 1])
+
+    def test_batch(self):
+        self.insert_snapshot('Instmt', 1.5)
+        self.insert_trade(1.0, 1500000000000001)
+        self.insert_snapshot('Instmt', 2.5)
+        self.insert_trade(2.0, 1500000000500000)
+        self.assertEqual(self.client.conn.commands, [])
+
+        # Flushed at the batch size
+        self.insert_trade(3.0, 1500000001000000)
+        self.assertEqual(len(self.client.conn.commands), 1)
+        commands = self.client.conn.commands[0]
+        self.assertEqual([c[0] for c in commands], ['mset', 'publish', 'publish', 'lpush', 'lpush', 'zadd'])
+
+        # Snapshot keys are coalesced to the latest values
+        mset = commands[0][1]
+        self.assertEqual(len(mset), len(Snapshot.columns()))
+        self.assertEqual(mset['befh_es_exch_instmt_trade_px'], 2.5)
+        self.assertEqual(mset['befh_es_exch_instmt_order_date_time'], Timestamp.format(1500000000000001))
+
+        # Every snapshot is published
+        self.assertEqual([json.loads(c[2])['trade_px'] for c in commands[1:3]], [1.5, 2.5])
+        self.assertEqual(commands[1][1], 'befh_es')
+
+        # One push per period, and one queue update per instrument
+        self.assertEqual(commands[3], ('lpush', 'befh_etp_exch_instmt_1500000000', '1.0/2.0', '2.0/2.0'))
+        self.assertEqual(commands[4], ('lpush', 'befh_etp_exch_instmt_1500000001', '3.0/2.0'))
+        self.assertEqual(commands[5], ('zadd', 'befh_etpq_exch_instmt',
+                                       1500000000, 'befh_etp_exch_instmt_1500000000',
+                                       1500000001, 'befh_etp_exch_instmt_1500000001'))
+
+        # Flushed by the flush call, and nothing is sent without buffered rows
+        self.insert_snapshot('Instmt', 3.5)
+        self.client.flush()
+        self.client.flush()
+        self.assertEqual(len(self.client.conn.commands), 2)
+        self.assertEqual([c[0] for c in self.client.conn.commands[1]], ['mset', 'publish'])
+
+
+class RedisSnapshotReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.values = ['Exch', 'Instmt', 1.5, 0.25] + [float(i) for i in range(0, 20)] + \
+                      [1500000000000001, 1500000000000002, Snapshot.UpdateType.ORDER_BOOK]
+        self.snapshot = dict(zip(Snapshot.columns(), self.values))
+
+    def test_decode_message(self):
+        ret = dict(zip(Snapshot.columns(), RedisClient.format_date_time(Snapshot.columns(), self.values)))
+        ret['table'] = 'exchanges_snapshot'
+        self.assertEqual(ret['order_date_time'], Timestamp.format(1500000000000001))
+        self.assertEqual(RedisSnapshotReader.decode_message(json.dumps(ret)), self.snapshot)
+        self.assertEqual(RedisSnapshotReader.decode_message(Snapshot.pack(self.values)), self.snapshot)
+
+    def test_convert_values(self):
+        values = [str(v).encode('utf-8') for v in RedisClient.format_date_time(Snapshot.columns(), self.values)]
+        self.assertEqual(RedisSnapshotReader.convert_values(values), self.snapshot)
+        self.assertIsNone(RedisSnapshotReader.convert_values(values[:-1] + [None]))
+
+    def test_snapshot_key(self):
+        self.assertEqual(RedisClient.get_snapshot_key(RedisClient.SnapshotLayout.KEYS, 'Exch', 'Instmt', 'B1'),
+                         'befh_es_exch_instmt_b1')
+        self.assertEqual(RedisClient.get_snapshot_key(RedisClient.SnapshotLayout.HASH, 'Exch', 'Instmt'),
+                         'befh_esh_exch_instmt')
+        self.assertRaises(Exception, RedisClient.get_snapshot_key, 'unknown', 'Exch', 'Instmt')
+
+
+if __name__ == '__main__':
+    unittest.main()
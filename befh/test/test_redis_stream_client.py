@@ -0,0 +1,55 @@
+#!/bin/python
+
+import unittest
+from befh.clients.redisstream import RedisStreamClient, RedisStreamReader
+from befh.market_data import Snapshot, Trade
+
+
+class RedisStreamClientTest(unittest.TestCase):
+    def test_insert(self):
+        client = RedisStreamClient()
+        client.set_batch_insert(100, 0)
+
+        trade = Trade()
+        trade.date_time = '20170714 02:40:00.000001'
+        trade.trade_id = '1'
+        trade.trade_price = 1.5
+        trade.trade_volume = 2.0
+        trade.trade_side = Trade.Side.BUY
+        client.insert('exch_bitstamp_btcusd_trades_20170714', ['id'] + Trade.columns(), ['int'] + Trade.types(),
+                      [1] + trade.values())
+        client.insert('exch_bitstamp_btcusd_snapshot_20170714', Trade.columns(), Trade.types(), trade.values())
+
+        values = ['Bitstamp', 'BTCUSD', 1.5, 2.0] + [float(i) for i in range(0, 20)] + \
+                 [1500000000000002, 1500000000000001]
+        client.insert('exchanges_snapshot', Snapshot.columns(), Snapshot.types(),
+                      values + [Snapshot.UpdateType.ORDER_BOOK])
+        client.insert('exchanges_snapshot', Snapshot.columns(), Snapshot.types(),
+                      values + [Snapshot.UpdateType.TRADES])
+
+        self.assertEqual(len(client.entries), 2)
+        self.assertEqual(client.entries[0],
+                         ('befh_xt_bitstamp_btcusd',
+                          [('id', 1), ('date_time', 1500000000000001), ('trade_id', '1'), ('trade_price', 1.5),
+                           ('trade_volume', 2.0), ('trade_side', Trade.Side.BUY)]))
+        self.assertEqual(client.entries[1][0], 'befh_xq_bitstamp_btcusd')
+        self.assertEqual(client.entries[1][1][0:3], [('date_time', 1500000000000002), ('b1', 0.0), ('b2', 1.0)])
+        self.assertEqual(len(client.entries[1][1]), 21)
+
+    def test_parse_entries(self):
+        raw = [[b'befh_xt_bitstamp_btcusd',
+                [[b'1-0', [b'trade_price', b'1.5', b'trade_volume', b'2.0']],
+                 [b'2-0', None]]]]
+        parsed = [[b'befh_xt_bitstamp_btcusd',
+                   [(b'1-0', {b'trade_price': b'1.5', b'trade_volume': b'2.0'}),
+                    (b'2-0', None)]]]
+        expected = [('befh_xt_bitstamp_btcusd', '1-0', {'trade_price': '1.5', 'trade_volume': '2.0'}),
+                    ('befh_xt_bitstamp_btcusd', '2-0', None)]
+        self.assertEqual(RedisStreamReader.parse_entries(raw), expected)
+        self.assertEqual(RedisStreamReader.parse_entries(parsed), expected)
+        self.assertEqual(RedisStreamReader.parse_entries(dict(parsed)), expected)
+        self.assertEqual(RedisStreamReader.parse_entries(None), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
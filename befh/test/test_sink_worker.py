@@ -0,0 +1,92 @@
+#!/bin/python
+
+import unittest
+import os
+import tempfile
+import threading
+from befh.sink_worker import SinkWorker
+from befh.clients.sqlite import SqliteClient
+from befh.util import Logger
+
+
+class BlockedSqliteClient(SqliteClient):
+    """
+    Sqlite client of which the insertions wait for the event
+    """
+    def __init__(self):
+        SqliteClient.__init__(self)
+        self.event = threading.Event()
+
+    def insert(self, table, columns, types, values, primary_key_index=[], is_orreplace=False, is_commit=True):
+        self.event.wait()
+        return SqliteClient.insert(self, table, columns, types, values, primary_key_index, is_orreplace, is_commit)
+
+
+class SinkWorkerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        Logger.init_log()
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db_client = BlockedSqliteClient()
+        self.db_client.connect(path=':memory:')
+        self.db_client.create('test', ['k'], ['int'], [0])
+
+    def tearDown(self):
+        os.rmdir(self.directory)
+
+    def start_worker(self, overflow_policy):
+        worker = SinkWorker(self.db_client, 3, overflow_policy, self.directory)
+        worker.start()
+        return worker
+
+    def put(self, worker, count):
+        for i in range(0, count):
+            worker.put('test', ['k'], ['int'], [i])
+
+    def keys(self):
+        return [e[0] for e in self.db_client.select('test', orderby='k')]
+
+    def test_drop_oldest(self):
+        worker = self.start_worker(SinkWorker.OverflowPolicy.DROP_OLDEST)
+        self.put(worker, 10)
+        self.db_client.event.set()
+        self.assertTrue(worker.join())
+        worker.stop()
+
+        # The first row may be taken by the worker before the queue is full
+        self.assertEqual(self.keys()[-3:], [7, 8, 9])
+        metrics = worker.get_metrics()
+        self.assertEqual(metrics['enqueued'], 10)
+        self.assertEqual(metrics['processed'] + metrics['dropped'], 10)
+
+    def test_spill(self):
+        worker = self.start_worker(SinkWorker.OverflowPolicy.SPILL)
+        self.put(worker, 10)
+        self.assertGreater(worker.get_metrics()['spill'], 0)
+        self.db_client.event.set()
+        self.assertTrue(worker.join())
+        worker.stop()
+
+        self.assertEqual(self.keys(), list(range(0, 10)))
+        self.assertEqual(worker.get_metrics()['processed'], 10)
+        self.assertFalse(os.path.exists(worker.spill_path))
+
+    def test_block(self):
+        worker = self.start_worker(SinkWorker.OverflowPolicy.BLOCK)
+        thread = threading.Thread(target=self.put, args=(worker, 10))
+        thread.start()
+        thread.join(0.2)
+        self.assertTrue(thread.is_alive())
+        self.db_client.event.set()
+        thread.join()
+        self.assertTrue(worker.join())
+        worker.stop()
+
+        self.assertEqual(self.keys(), list(range(0, 10)))
+        self.assertGreaterEqual(worker.get_metrics()['max_lag'], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
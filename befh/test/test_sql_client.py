@@ -0,0 +1,131 @@
+#!/bin/python
+
+import unittest
+import os
+import tempfile
+from befh.clients.sqlite import SqliteClient
+from befh.clients.postgresql import PostgresqlClient
+from befh.clients.mysql import MysqlClient
+import pymysql.cursors
+from befh.util import Logger
+
+
+class SqlClientBatchInsertTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        Logger.init_log()
+
+    def setUp(self):
+        self.db_client = SqliteClient()
+        self.db_client.connect(path=':memory:')
+        self.db_client.set_batch_insert(3, flush_interval=0)
+        self.columns = ['k', 'v']
+        self.types = ['int', 'text']
+        self.db_client.create('test', self.columns, self.types, [0])
+
+    def insert(self, k, v, is_orreplace=False):
+        return self.db_client.insert('test', self.columns, self.types, [k, v],
+                                     primary_key_index=[0], is_orreplace=is_orreplace)
+
+    def count(self):
+        self.db_client.execute('select count(*) from test')
+        return self.db_client.fetchone()[0]
+
+    def test_batch(self):
+        self.assertTrue(self.insert(1, 'a'))
+        self.assertTrue(self.insert(2, 'b'))
+        self.assertEqual(self.count(), 0)
+
+        # The batch is full
+        self.assertTrue(self.insert(3, 'c'))
+        self.assertEqual(self.count(), 3)
+
+        # Select flushes the buffered rows first
+        self.assertTrue(self.insert(4, 'd'))
+        self.assertEqual(self.db_client.select('test', orderby='k'),
+                         [(1, 'a'), (2, 'b'), (3, 'c'), (4, 'd')])
+
+    def test_replace(self):
+        self.insert(1, 'a', True)
+        self.insert(1, 'b', True)
+        self.db_client.flush()
+        self.insert(1, 'c', True)
+        self.insert(2, 'd', True)
+        self.db_client.close()
+        self.assertEqual(self.db_client.select('test', orderby='k'), [(1, 'c'), (2, 'd')])
+
+    def test_failed_row(self):
+        self.insert(1, 'a')
+        self.insert(1, 'b')
+        self.insert(2, 'c')
+        self.assertEqual(self.db_client.select('test', orderby='k'), [(1, 'a'), (2, 'c')])
+
+
+class SqlClientInsertTest(unittest.TestCase):
+    def test_native_values(self):
+        db_client = SqliteClient()
+        db_client.connect(path=':memory:')
+        db_client.create('test', ['k', 'v', 'p'], ['int', 'text', 'decimal(20,8)'], [0])
+        db_client.insert('test', ['k', 'v', 'p'], ['int', 'text', 'decimal(20,8)'], [1, "it's", 0.1234567890123])
+        self.assertEqual(db_client.select('test'), [(1, "it's", 0.1234567890123)])
+        self.assertEqual(db_client.insert_statements,
+                         {('test', ('k', 'v', 'p'), False): 'insert into test (k,v,p) values (?,?,?)'})
+
+
+class SqliteClientWriterModeTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db_client = SqliteClient()
+        self.db_client.connect(path=os.path.join(self.directory, 'test.sqlite'))
+        self.db_client.create('test', ['k', 'v'], ['int', 'text'], [0])
+        self.db_client.set_writer_mode(transaction_size=100, flush_interval=10, queue_size=1000)
+
+    def tearDown(self):
+        self.db_client.close()
+        for file_name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, file_name))
+        os.rmdir(self.directory)
+
+    def test_writer(self):
+        self.db_client.execute('pragma journal_mode')
+        self.assertEqual(self.db_client.fetchone()[0], 'wal')
+
+        for i in range(0, 5000):
+            self.assertTrue(self.db_client.insert('test', ['k', 'v'], ['int', 'text'], [i, str(i)]))
+        self.db_client.insert('test', ['k', 'v'], ['int', 'text'], [0, 'a'], primary_key_index=[0], is_orreplace=True)
+
+        # Select from the read-only connections after the queue is written
+        self.assertEqual(len(self.db_client.select('test')), 5000)
+        self.assertEqual(self.db_client.select('test', columns=['v'], condition='k = 0'), [('a',)])
+        self.assertEqual(len(self.db_client.queue), 0)
+
+
+class PostgresqlClientTest(unittest.TestCase):
+    def test_copy_data(self):
+        data = PostgresqlClient.copy_data([[1, 'a,"b"', '', None, 0.1234567890123]])
+        self.assertEqual(data.read(), '1,"a,""b""","",,0.1234567890123\n')
+
+    def test_insert_statement(self):
+        db_client = PostgresqlClient()
+        self.assertEqual(db_client.get_insert_statement('exchanges_snapshot', ['exchange', 'instmt', 'b1'], True),
+                         'insert into exchanges_snapshot (exchange,instmt,b1) values (%s,%s,%s) '
+                         'on conflict (exchange, instmt) do update set '
+                         'exchange = excluded.exchange, instmt = excluded.instmt, b1 = excluded.b1')
+        self.assertEqual(db_client.get_insert_statement('trades', ['id', 'trade_id'], True),
+                         'insert into trades (id,trade_id) values (%s,%s) '
+                         'on conflict (id) do update set trade_id = excluded.trade_id')
+
+
+class MysqlClientTest(unittest.TestCase):
+    def test_insert_statement(self):
+        db_client = MysqlClient()
+        sql = db_client.get_insert_statement('exchanges_snapshot', ['exchange', 'instmt', 'b1'], True)
+        self.assertEqual(sql, 'insert into exchanges_snapshot (exchange,instmt,b1) values (%s,%s,%s) '
+                              'on duplicate key update exchange = values(exchange), instmt = values(instmt), '
+                              'b1 = values(b1)')
+        # Pymysql rewrites the statement into multi-row inserts in executemany
+        self.assertIsNotNone(pymysql.cursors.RE_INSERT_VALUES.match(sql))
+
+
+if __name__ == '__main__':
+    unittest.main()
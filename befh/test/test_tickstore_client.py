@@ -0,0 +1,99 @@
+#!/bin/python
+
+import unittest
+import os
+import tempfile
+from befh.clients.tickstore import TickStoreClient
+from befh.market_data import Trade
+from befh.util import Logger
+
+
+class TickStoreClientTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        Logger.init_log()
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.columns = ['id'] + Trade.columns()
+        self.types = ['int'] + Trade.types()
+        self.db_client = self.connect()
+
+    def tearDown(self):
+        self.db_client.close()
+        for file_name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, file_name))
+        os.rmdir(self.directory)
+
+    def connect(self):
+        db_client = TickStoreClient(dir=self.directory, block_size=100, flush_interval=0)
+        db_client.create('trades', self.columns, self.types, [0])
+        return db_client
+
+    def insert(self, start, end):
+        for i in range(start, end):
+            self.db_client.insert('trades', self.columns, self.types,
+                                  [i, 1000000 * i, 'T%d' % i, 100.0 + i * 0.5, 0.1 * (i % 7), i % 2])
+
+    def test_insert_and_select(self):
+        self.insert(0, 250)
+        rows = self.db_client.select('trades')
+        self.assertEqual(len(rows), 250)
+        self.assertEqual(rows[3], [3, 3000000, 'T3', 101.5, 0.1 * 3, 1])
+
+        # Time range over the blocks
+        rows = self.db_client.select('trades', columns=['id'],
+                                     condition='date_time >= 95000000 and date_time < 105000000')
+        self.assertEqual([e[0] for e in rows], list(range(95, 105)))
+        self.assertEqual(self.db_client.select('trades', columns=['id'], condition='date_time = 7000000'), [[7]])
+
+        # Other conditions are evaluated on the rows
+        rows = self.db_client.select('trades', columns=['id'],
+                                     condition='date_time > 200000000 and trade_side = 1',
+                                     orderby='id desc', limit=3)
+        self.assertEqual(rows, [[249], [247], [245]])
+        rows = self.db_client.select('trades', columns=['id'],
+                                     condition="(trade_id = 'T3' or date_time <= 1000000) and not id = 0")
+        self.assertEqual(rows, [[1], [3]])
+        self.assertRaises(Exception, self.db_client.select, 'trades', condition="__import__('os').getcwd()")
+
+    def test_reopen(self):
+        self.insert(0, 150)
+        self.db_client.close()
+        self.db_client = self.connect()
+        self.insert(150, 160)
+        self.assertEqual([e[0] for e in self.db_client.select('trades', columns=['id'])], list(range(0, 160)))
+        self.assertEqual(len(self.db_client.tables['trades'].index), 3)
+
+    def test_close_table(self):
+        self.insert(0, 150)
+        self.db_client.close_table('trades')
+        self.assertEqual(len(self.db_client.tables), 0)
+
+        # The table is opened again on the next insertion
+        self.insert(150, 160)
+        self.assertEqual([e[0] for e in self.db_client.select('trades', columns=['id'])], list(range(0, 160)))
+        self.assertEqual(len(self.db_client.tables['trades'].index), 3)
+
+    def test_recover(self):
+        self.insert(0, 250)
+        self.db_client.flush()
+        last_block_offset = self.db_client.tables['trades'].index[-1][0]
+        self.db_client.close()
+
+        # Footer and the last block are cut off
+        with open(os.path.join(self.directory, 'trades.tick'), 'r+b') as file:
+            file.truncate(last_block_offset + TickStoreClient.BLOCK.size + 10)
+
+        self.db_client = self.connect()
+        self.assertEqual([e[0] for e in self.db_client.select('trades', columns=['id'])], list(range(0, 200)))
+
+    def test_size(self):
+        self.insert(0, 1000)
+        self.db_client.flush()
+        path = os.path.join(self.directory, 'trades.tick')
+        self.assertLess(os.path.getsize(path), 1000 * 8 * len(self.columns))
+
+
+if __name__ == '__main__':
+    unittest.main()
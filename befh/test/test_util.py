@@ -0,0 +1,39 @@
+#!/bin/python
+
+import unittest
+from datetime import datetime, timedelta
+import pytz
+from befh.util import Timestamp
+from befh.clients.database import DatabaseClient
+
+
+class TimestampTest(unittest.TestCase):
+    def test_conversion(self):
+        date_time = datetime(2017, 5, 6, 7, 8, 9, 123456)
+        timestamp = Timestamp.from_datetime(date_time)
+        self.assertEqual(timestamp, 1494054489123456)
+        self.assertEqual(Timestamp.from_seconds(1494054489.123456), timestamp)
+        self.assertEqual(Timestamp.from_milliseconds(1494054489123), timestamp - 456)
+        self.assertEqual(Timestamp.to_datetime(timestamp), date_time)
+        self.assertEqual(Timestamp.from_datetime(pytz.timezone('Asia/Shanghai').localize(date_time + timedelta(hours=8))),
+                         timestamp)
+        self.assertEqual(Timestamp.parse('2017-05-06T07:08:09.123Z', '%Y-%m-%dT%H:%M:%S.%fZ'), timestamp - 456)
+
+    def test_format(self):
+        date_time = datetime(2017, 5, 6, 7, 8, 9, 123456)
+        for i in range(0, 100):
+            date_time += timedelta(hours=7, microseconds=123457)
+            timestamp = Timestamp.from_datetime(date_time)
+            self.assertEqual(Timestamp.format(timestamp), date_time.strftime("%Y%m%d %H:%M:%S.%f"))
+            self.assertEqual(Timestamp.parse(Timestamp.format(timestamp)), timestamp)
+
+        self.assertEqual(Timestamp.format(0, "%Y.%m.%dD"), "1970.01.01D00:00:00.000000")
+
+    def test_format_date_time(self):
+        values = DatabaseClient.format_date_time(['id', 'date_time', 'order_date_time', 'trades_date_time'],
+                                                 [1, 1494054489123456, '20170506 07:08:09.123456', 0.0])
+        self.assertEqual(values, [1, '20170506 07:08:09.123456', '20170506 07:08:09.123456', 0.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
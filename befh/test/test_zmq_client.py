@@ -0,0 +1,106 @@
+#!/bin/python
+
+import unittest
+import time
+import zmq
+from befh.clients.zmq import ZmqClient, ZmqSubscriber
+from befh.market_data import Snapshot, Trade
+from befh.util import Logger
+
+
+class ZmqClientTest(unittest.TestCase):
+    def setUp(self):
+        Logger.init_log()
+        self.client = ZmqClient()
+        self.client.set_message_format(ZmqClient.MessageFormat.PACKED)
+        self.client.connect(addr='tcp://127.0.0.1:*')
+        self.addr = self.client.conn.getsockopt(zmq.LAST_ENDPOINT).decode('utf-8')
+
+    def tearDown(self):
+        self.client.close()
+        self.client.conn.close()
+        self.client.context.term()
+
+    def publish(self, instmt, update_type, price=1.5):
+        values = ['Exch', instmt, price, 0.25] + [float(i) for i in range(0, 20)] + \
+                 [1500000000000001, 1500000000000002, update_type]
+        self.client.insert('exchanges_snapshot', Snapshot.columns(), Snapshot.types(), values)
+        return values
+
+    def wait_subscriber(self, subscriber, instmt, update_type):
+        subscriber.conn.setsockopt(zmq.RCVTIMEO, 100)
+        for i in range(0, 50):
+            self.publish(instmt, update_type)
+            try:
+                subscriber.recv()
+                break
+            except zmq.Again:
+                time.sleep(0.1)
+
+        time.sleep(0.1)
+        while subscriber.conn.poll(0):
+            subscriber.recv()
+
+    def test_subscribe(self):
+        subscriber = ZmqSubscriber(self.addr)
+        subscriber.subscribe('quotes', 'Exch', 'BTC')
+        subscriber.subscribe('trades')
+        self.wait_subscriber(subscriber, 'BTC', Snapshot.UpdateType.ORDER_BOOK)
+
+        self.publish('BTCUSD', Snapshot.UpdateType.ORDER_BOOK)
+        values = self.publish('BTCUSD', Snapshot.UpdateType.TRADES)
+        topic, snapshot = subscriber.recv()
+        self.assertEqual(topic, 'trades.Exch.BTCUSD')
+        self.assertEqual(snapshot, dict(zip(Snapshot.columns(), values)))
+
+        values = self.publish('BTC', Snapshot.UpdateType.ORDER_BOOK)
+        self.assertEqual(subscriber.recv(), ('quotes.Exch.BTC', dict(zip(Snapshot.columns(), values))))
+        subscriber.close()
+        subscriber.context.term()
+
+    def test_conflation(self):
+        self.client.set_conflation(5)
+        self.client.bind_snapshot('tcp://127.0.0.1:*')
+        snapshot_addr = self.client.snapshot_conn.getsockopt(zmq.LAST_ENDPOINT).decode('utf-8')
+        subscriber = ZmqSubscriber(self.addr)
+        subscriber.subscribe()
+        self.wait_subscriber(subscriber, 'BTC', Snapshot.UpdateType.TRADES)
+
+        # The rows of the instrument tables are not published
+        self.assertTrue(self.client.is_snapshot_only)
+        self.client.insert('exch_exch_btc_trades_20170714', ['id'] + Trade.columns(), ['int'] + Trade.types(),
+                           [1] + Trade().values())
+
+        # The order book updates are conflated
+        for i in range(0, 5):
+            last_values = self.publish('BTC', Snapshot.UpdateType.ORDER_BOOK)
+        subscriber.conn.poll(1000)
+        self.assertEqual(subscriber.recv(), ('quotes.Exch.BTC', dict(zip(Snapshot.columns(), last_values))))
+        self.assertRaises(zmq.Again, subscriber.recv)
+
+        # The order book updates are published while the trades interleave
+        quotes_subscriber = ZmqSubscriber(self.addr)
+        quotes_subscriber.subscribe('quotes', 'Exch', 'BTC')
+        self.wait_subscriber(quotes_subscriber, 'BTC', Snapshot.UpdateType.ORDER_BOOK)
+        quote_values = self.publish('BTC', Snapshot.UpdateType.ORDER_BOOK, 2.5)
+        for i in range(0, 6):
+            trade_values = self.publish('BTC', Snapshot.UpdateType.TRADES)
+            time.sleep(0.05)
+        quotes_subscriber.conn.poll(1000)
+        self.assertEqual(quotes_subscriber.recv(), ('quotes.Exch.BTC', dict(zip(Snapshot.columns(), quote_values))))
+        quotes_subscriber.close()
+
+        # The latest quotes and trades of each instrument
+        self.publish('ETH', Snapshot.UpdateType.ORDER_BOOK)
+        self.assertEqual(subscriber.request_snapshot(snapshot_addr, 'quotes.Exch.BTC'),
+                         [('quotes.Exch.BTC', dict(zip(Snapshot.columns(), quote_values)))])
+        self.assertEqual(subscriber.request_snapshot(snapshot_addr, 'trades.'),
+                         [('trades.Exch.BTC', dict(zip(Snapshot.columns(), trade_values)))])
+        self.assertEqual(sorted(e[0] for e in subscriber.request_snapshot(snapshot_addr)),
+                         ['quotes.Exch.BTC', 'quotes.Exch.ETH', 'trades.Exch.BTC'])
+        subscriber.close()
+        subscriber.context.term()
+
+
+if __name__ == '__main__':
+    unittest.main()
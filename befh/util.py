@@ -1,5 +1,6 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
+import time
 
 
 class Logger:
@@ -39,3 +40,118 @@ class Logger:
         :param str: Log message
         """
         Logger.logger.error('[%s]\n%s\n' % (method, str))
+
+
+class Timestamp:
+    """
+    Timestamp in integer microseconds since the unix epoch (UTC).
+
+    Market data carries the integer timestamp and the text is only formatted
+    by the database clients which require it, so that the hot path does not
+    pay for strftime and strptime.
+    """
+    EPOCH = datetime(1970, 1, 1)
+    MICROSECONDS_PER_SECOND = 1000000
+    MICROSECONDS_PER_DAY = 86400 * MICROSECONDS_PER_SECOND
+    DEFAULT_FORMAT = "%Y%m%d %H:%M:%S.%f"
+
+    # Formatted date prefixes, keyed by the day since epoch and the date format
+    date_prefixes = {}
+
+    @staticmethod
+    def now():
+        """
+        Current timestamp
+        :return: Microseconds since epoch
+        """
+        return int(time.time() * Timestamp.MICROSECONDS_PER_SECOND)
+
+    @staticmethod
+    def from_seconds(seconds):
+        """
+        Convert from seconds since epoch
+        :param seconds: Seconds since epoch, can be a float
+        :return: Microseconds since epoch
+        """
+        return int(round(float(seconds) * Timestamp.MICROSECONDS_PER_SECOND))
+
+    @staticmethod
+    def from_milliseconds(milliseconds):
+        """
+        Convert from milliseconds since epoch
+        :param milliseconds: Milliseconds since epoch, can be a float
+        :return: Microseconds since epoch
+        """
+        return int(round(float(milliseconds) * 1000))
+
+    @staticmethod
+    def from_datetime(date_time):
+        """
+        Convert from datetime. A naive datetime is regarded as UTC.
+        :param date_time: datetime
+        :return: Microseconds since epoch
+        """
+        if date_time.tzinfo is not None:
+            date_time = date_time.replace(tzinfo=None) - date_time.utcoffset()
+
+        return (date_time - Timestamp.EPOCH) // timedelta(microseconds=1)
+
+    @staticmethod
+    def from_date(date):
+        """
+        Convert from the start (UTC) of the date
+        :param date: date
+        :return: Microseconds since epoch
+        """
+        return (date - Timestamp.EPOCH.date()).days * Timestamp.MICROSECONDS_PER_DAY
+
+    @staticmethod
+    def next_day(timestamp):
+        """
+        Start (UTC) of the day after the timestamp
+        :param timestamp: Microseconds since epoch
+        :return: Microseconds since epoch
+        """
+        return (timestamp // Timestamp.MICROSECONDS_PER_DAY + 1) * Timestamp.MICROSECONDS_PER_DAY
+
+    @staticmethod
+    def parse(date_time, format=DEFAULT_FORMAT):
+        """
+        Parse a UTC date time string
+        :param date_time: Date time string
+        :param format: Format of the string
+        :return: Microseconds since epoch
+        """
+        return Timestamp.from_datetime(datetime.strptime(date_time, format))
+
+    @staticmethod
+    def to_datetime(timestamp):
+        """
+        Convert to a naive UTC datetime
+        :param timestamp: Microseconds since epoch
+        :return: datetime
+        """
+        return Timestamp.EPOCH + timedelta(microseconds=timestamp)
+
+    @staticmethod
+    def format(timestamp, date_format="%Y%m%d "):
+        """
+        Format the timestamp as "<date_format>HH:MM:SS.ffffff". It is the
+        same as strftime("%Y%m%d %H:%M:%S.%f") by default, but only the date
+        part is formatted by strftime and it is cached across the day.
+        :param timestamp: Microseconds since epoch
+        :param date_format: Format of the date part
+        :return: Formatted string
+        """
+        day, microseconds = divmod(timestamp, Timestamp.MICROSECONDS_PER_DAY)
+        prefix = Timestamp.date_prefixes.get((day, date_format))
+        if prefix is None:
+            if len(Timestamp.date_prefixes) > 1024:
+                Timestamp.date_prefixes.clear()
+            prefix = (Timestamp.EPOCH + timedelta(days=day)).strftime(date_format)
+            Timestamp.date_prefixes[(day, date_format)] = prefix
+
+        seconds, microseconds = divmod(microseconds, Timestamp.MICROSECONDS_PER_SECOND)
+        minutes, seconds = divmod(seconds, 60)
+        hours, minutes = divmod(minutes, 60)
+        return '%s%02d:%02d:%02d.%06d' % (prefix, hours, minutes, seconds, microseconds)